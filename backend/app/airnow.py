@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import upstream
+from app.metrics import track_upstream
+
+# --- AirNow fetch engine ---
+# One shared keep-alive session for every AirNow call, plus a bounded
+# fan-out fetcher used by the periodic refresh job. Every call is admitted
+# by `upstream.airnow` (quota, concurrency, circuit breaker) and raises
+# upstream.UpstreamError when refused. Pool and fan-out sizes follow its
+# concurrency cap (AIRNOW_CONCURRENCY_MAX); there are no separate knobs.
+
+AIRNOW_API_KEY = os.environ.get("AIRNOW_API_KEY")
+# Overridable so benchmarks can point at a local stand-in (benchmarks/stubs.py)
+AIRNOW_BASE_URL = os.getenv("AIRNOW_BASE_URL", "https://www.airnowapi.org").rstrip("/")
+OBS_ZIP_URL = f"{AIRNOW_BASE_URL}/aq/observation/zipCode/current/"
+OBS_LATLONG_URL = f"{AIRNOW_BASE_URL}/aq/observation/latLong/current/"
+# Search radius (miles) for reporting-area lookups by coordinates.
+AIRNOW_DISTANCE_MILES = int(os.getenv("AIRNOW_DISTANCE_MILES", 25))
+
+AIRNOW_TIMEOUT = float(os.getenv("AIRNOW_TIMEOUT", 10))
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+
+
+def _max_concurrency():
+    return max(upstream.airnow.limiter.max_limit, 1)
+
+
+def get_session():
+    """Returns the shared AirNow session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=_max_concurrency(),
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client():
+    """Returns the shared async AirNow client used by the chat path."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=AIRNOW_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=_max_concurrency()),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def parse_observations(data):
+    """Converts an AirNow observation payload into our row dicts."""
+    rows = []
+    for item in data:
+        rows.append({
+            "DateObserved": item.get("DateObserved"),
+            "HourObserved": item.get("HourObserved"),
+            "ReportingArea": item.get("ReportingArea"),
+            "StateCode": item.get("StateCode"),
+            "ParameterName": item.get("ParameterName"),
+            "AQI": item.get("AQI"),
+            "Category": item["Category"]["Name"],
+            # Reporting-area coordinates, used to build the ZIP -> area index
+            "Latitude": item.get("Latitude"),
+            "Longitude": item.get("Longitude"),
+        })
+    return rows
+
+
+def fetch_observations(zip_code):
+    """
+    Fetches current observations for one ZIP on the shared session.
+    Raises on any HTTP or decoding error; callers decide how to degrade.
+    """
+    params = {
+        "format": "application/json",
+        "zipCode": zip_code,
+        "API_KEY": AIRNOW_API_KEY
+    }
+    with upstream.airnow.slot(), track_upstream("airnow", "zip"):
+        r = get_session().get(OBS_ZIP_URL, params=params, timeout=AIRNOW_TIMEOUT)
+        r.raise_for_status()
+        return parse_observations(r.json())
+
+
+async def fetch_observations_async(zip_code):
+    """Async counterpart of `fetch_observations` for the event loop."""
+    params = {
+        "format": "application/json",
+        "zipCode": zip_code,
+        "API_KEY": AIRNOW_API_KEY
+    }
+    async with upstream.airnow.aslot():
+        with track_upstream("airnow", "zip"):
+            r = await get_async_client().get(OBS_ZIP_URL, params=params)
+            r.raise_for_status()
+            return parse_observations(r.json())
+
+
+def _latlong_params(lat, lon):
+    return {
+        "format": "application/json",
+        "latitude": f"{lat:.4f}",
+        "longitude": f"{lon:.4f}",
+        "distance": AIRNOW_DISTANCE_MILES,
+        "API_KEY": AIRNOW_API_KEY
+    }
+
+
+def fetch_observations_latlong(lat, lon):
+    """Fetches current observations for the reporting area nearest a point."""
+    with upstream.airnow.slot(), track_upstream("airnow", "latlong"):
+        r = get_session().get(OBS_LATLONG_URL, params=_latlong_params(lat, lon), timeout=AIRNOW_TIMEOUT)
+        r.raise_for_status()
+        return parse_observations(r.json())
+
+
+async def fetch_observations_latlong_async(lat, lon):
+    async with upstream.airnow.aslot():
+        with track_upstream("airnow", "latlong"):
+            r = await get_async_client().get(OBS_LATLONG_URL, params=_latlong_params(lat, lon))
+            r.raise_for_status()
+            return parse_observations(r.json())
+
+
+def fetch_many(zip_list, max_workers=None, fetch=fetch_observations):
+    """
+    Fetches observations for many ZIPs concurrently.
+
+    Each `fetch` takes an `upstream.airnow` slot, which paces requests by
+    the quota and caps how many are in flight; `max_workers` defaults to
+    that cap. Returns `(rows_by_zip, stats)` where `stats` has one entry
+    per ZIP (rows, seconds, error) plus overall totals.
+    """
+    max_workers = max_workers or _max_concurrency()
+    zips = list(dict.fromkeys(zip_list))  # de-duplicate, keep order
+
+    def run(zip_code):
+        start = time.perf_counter()
+        try:
+            rows = fetch(zip_code)
+            error = None
+        except Exception as e:
+            rows, error = [], str(e)
+        return zip_code, rows, time.perf_counter() - start, error
+
+    started = time.perf_counter()
+    rows_by_zip = {}
+    per_zip = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="airnow") as pool:
+        for zip_code, rows, seconds, error in pool.map(run, zips):
+            rows_by_zip[zip_code] = rows
+            per_zip[zip_code] = {
+                "rows": len(rows),
+                "seconds": round(seconds, 4),
+                "error": error,
+            }
+
+    latencies = [s["seconds"] for s in per_zip.values()]
+    stats = {
+        "zips": len(zips),
+        "errors": sum(1 for s in per_zip.values() if s["error"]),
+        "wall_seconds": round(time.perf_counter() - started, 4),
+        "sum_request_seconds": round(sum(latencies), 4),
+        "max_request_seconds": max(latencies, default=0.0),
+        "concurrency": max_workers,
+        "per_zip": per_zip,
+    }
+    return rows_by_zip, stats
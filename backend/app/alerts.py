@@ -0,0 +1,386 @@
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Threshold alerts ---
+# After each AQI refresh every user's thresholds are checked in one
+# vectorized pass. Users are held as flat arrays sorted by location (cache
+# key, see chatbotbackend.live_aqi_key): thresholds (users x pollutants),
+# location index, channel bitmask and alert state. The refresh's AQI values
+# become a (locations x pollutants) matrix, gathered per user and compared
+# against the threshold matrix.
+#
+# Hysteresis: a pollutant alerts when it goes above the user's threshold
+# and can only alert again after it has dropped ALERT_HYSTERESIS points
+# below it, and no sooner than ALERT_COOLDOWN_SECONDS after the last alert.
+# Notification jobs go through a batched dispatch queue to per-channel
+# sinks (stubs for now).
+#
+# With a `state` store (scheduler.SharedSnapshot) the hysteresis/cooldown
+# state is read before and written after every evaluation, so a restart or
+# a new leader carries on where the last one stopped instead of alerting
+# every user who is already above their threshold.
+
+POLLUTANTS = ("pm25", "pm10", "o3", "no2")
+# AirNow ParameterName -> column in the threshold matrix
+PARAMETER_COLUMNS = {"PM2.5": 0, "PM10": 1, "O3": 2, "NO2": 3}
+CHANNELS = ("email", "push", "sms")
+
+# Defaults match schemas.AirQualityThresholds / NotificationPreferences
+DEFAULT_THRESHOLD = 100
+DEFAULT_CHANNELS = {"email": True, "push": True, "sms": False}
+
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", 10))
+ALERT_COOLDOWN_SECONDS = int(os.getenv("ALERT_COOLDOWN_SECONDS", 6 * 3600))
+ALERT_USERS_REFRESH_SECONDS = int(os.getenv("ALERT_USERS_REFRESH_SECONDS", 300))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", 500))
+ALERT_BATCH_WAIT = float(os.getenv("ALERT_BATCH_WAIT", 1.0))
+
+_ZIP = re.compile(r"\b(\d{5})\b")
+
+
+def zip_from_location(location):
+    """First 5-digit ZIP in a free-text profile location, or None."""
+    match = _ZIP.search(location or "")
+    return match.group(1) if match else None
+
+
+class UserIndex:
+    """Users with a resolvable location, as arrays sorted by location."""
+
+    def __init__(self, user_ids, loc_idx, thresholds, channels, locations):
+        order = np.argsort(loc_idx, kind="stable")
+        self.user_ids = user_ids[order]
+        self.loc_idx = loc_idx[order]
+        self.thresholds = thresholds[order]
+        self.channels = channels[order]
+        self.locations = locations          # location key per loc_idx
+        # CSR offsets: users of location i are [offsets[i], offsets[i + 1])
+        self.offsets = np.searchsorted(self.loc_idx, np.arange(len(locations) + 1))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def from_records(cls, records, key_for_zip):
+        """
+        Builds the index from (user_id, location, thresholds, preferences)
+        tuples. Users without a ZIP or without any enabled channel are
+        skipped.
+        """
+        ids, zips, rows, masks = [], [], [], []
+        for user_id, location, thresholds, prefs in records:
+            zip_code = zip_from_location(location)
+            if zip_code is None:
+                continue
+            prefs = {**DEFAULT_CHANNELS, **(prefs or {})}
+            mask = sum(1 << i for i, c in enumerate(CHANNELS) if prefs.get(c))
+            if not mask:
+                continue
+            thresholds = thresholds or {}
+            ids.append(user_id)
+            zips.append(zip_code)
+            rows.append([_threshold(thresholds.get(p)) for p in POLLUTANTS])
+            masks.append(mask)
+
+        # Resolve each distinct ZIP once
+        keys = {z: key_for_zip(z) for z in set(zips)}
+        locations = list(dict.fromkeys(keys.values()))
+        loc_of_key = {k: i for i, k in enumerate(locations)}
+        loc_idx = np.fromiter((loc_of_key[keys[z]] for z in zips), dtype=np.int32, count=len(zips))
+        return cls(
+            np.asarray(ids, dtype=np.int64),
+            loc_idx,
+            np.asarray(rows, dtype=np.float32).reshape(-1, len(POLLUTANTS)),
+            np.asarray(masks, dtype=np.uint8),
+            locations,
+        )
+
+
+def _threshold(value):
+    """Threshold as a float; missing means the default, 0/None-like disables."""
+    if value is None:
+        return DEFAULT_THRESHOLD
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_THRESHOLD
+    return value if value > 0 else np.inf
+
+
+def aqi_matrix(rows_by_key, locations):
+    """(locations x pollutants) AQI from AirNow rows; NaN where unknown."""
+    matrix = np.full((len(locations), len(POLLUTANTS)), np.nan, dtype=np.float32)
+    for i, key in enumerate(locations):
+        for row in rows_by_key.get(key) or ():
+            col = PARAMETER_COLUMNS.get(row.get("ParameterName"))
+            if col is not None and row.get("AQI") is not None:
+                matrix[i, col] = row["AQI"]
+    return matrix
+
+
+def load_user_records(batch_size=10000):
+    """Streams (id, location, thresholds, preferences) for every user."""
+    # Imported here so the engine itself doesn't need a database.
+    from sqlalchemy import select
+    from app import db, models
+
+    db.ensure_schema()
+    stmt = select(
+        models.User.id,
+        models.User.location,
+        models.User.airQualityThresholds,
+        models.User.notificationPreferences,
+    ).execution_options(yield_per=batch_size)
+    with db.SessionLocal() as session:
+        for row in session.execute(stmt):
+            yield tuple(row)
+
+
+class AlertEngine:
+    def __init__(self, load_users, key_for_zip, dispatcher=None, hysteresis=ALERT_HYSTERESIS,
+                 cooldown=ALERT_COOLDOWN_SECONDS, users_refresh=ALERT_USERS_REFRESH_SECONDS, state=None):
+        self.load_users = load_users
+        self.key_for_zip = key_for_zip
+        self.dispatcher = dispatcher
+        self.state = state
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.users_refresh = users_refresh
+        self.index = None
+        self._active = None        # bool (users x pollutants): currently alerting
+        self._last_alert = None    # float (users,): wall time of the last alert
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.last_run = None
+
+    def refresh_users(self, force=False):
+        """Reloads users if stale, carrying alert state over by user id."""
+        if not force and self.index is not None and time.time() - self._loaded_at < self.users_refresh:
+            return self.index
+        start = time.perf_counter()
+        index = UserIndex.from_records(self.load_users(), self.key_for_zip)
+        active = np.zeros(index.thresholds.shape, dtype=bool)
+        last_alert = np.full(len(index), -np.inf)
+        if self.index is not None and len(self.index) and len(index):
+            old_order = np.argsort(self.index.user_ids)
+            old_ids = self.index.user_ids[old_order]
+            pos = np.clip(np.searchsorted(old_ids, index.user_ids), 0, len(old_ids) - 1)
+            found = old_ids[pos] == index.user_ids
+            old_rows = old_order[pos[found]]
+            active[found] = self._active[old_rows]
+            last_alert[found] = self._last_alert[old_rows]
+        self.index, self._active, self._last_alert = index, active, last_alert
+        self._loaded_at = time.time()
+        self.load_seconds = round(time.perf_counter() - start, 4)
+        return index
+
+    def _load_state(self, index):
+        """Overlays the persisted state onto the in-memory arrays."""
+        saved = self.state.load_alert_state()
+        if not saved or not len(index):
+            return
+        ids = np.fromiter(saved.keys(), dtype=np.int64, count=len(saved))
+        order = np.argsort(ids)
+        ids = ids[order]
+        masks = np.array([saved[i][0] for i in ids.tolist()], dtype=np.int64)
+        last = np.array([saved[i][1] for i in ids.tolist()], dtype=np.float64)
+        pos = np.clip(np.searchsorted(ids, index.user_ids), 0, len(ids) - 1)
+        found = ids[pos] == index.user_ids
+        bits = (masks[pos[found], None] >> np.arange(len(POLLUTANTS))) & 1
+        self._active[found] = bits.astype(bool)
+        self._last_alert[found] = last[pos[found]]
+
+    def _save_state(self, index, rows):
+        masks = (self._active[rows].astype(np.int64) << np.arange(len(POLLUTANTS))).sum(axis=1)
+        self.state.save_alert_state(list(zip(
+            index.user_ids[rows].tolist(), masks.tolist(), self._last_alert[rows].tolist(),
+        )))
+
+    def location_keys(self):
+        """Cache keys users are located in (so the refresh covers them)."""
+        return list(self.index.locations) if self.index is not None else []
+
+    def evaluate(self, rows_by_key, now=None):
+        """
+        Checks every user against the latest AQI and queues notifications
+        for new exceedances. Returns a summary of the run.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            now = time.time() if now is None else now
+            index = self.refresh_users()
+            if not len(index):
+                self.last_run = {"users": 0, "alerts": 0, "jobs": 0, "seconds": 0.0}
+                return self.last_run
+
+            if self.state is not None:
+                self._load_state(index)
+            before = self._active
+
+            # Users are sorted by location, so expanding each location's row
+            # by its user count lines AQI up with the threshold matrix.
+            aqi = np.repeat(aqi_matrix(rows_by_key, index.locations), np.diff(index.offsets), axis=0)
+            with np.errstate(invalid="ignore"):
+                above = aqi > index.thresholds
+                cleared = aqi < index.thresholds - self.hysteresis
+            new = above & ~self._active
+            cooled = (now - self._last_alert) >= self.cooldown
+            alerting = new.any(axis=1) & cooled
+            alerted = np.flatnonzero(alerting)
+            self._last_alert[alerted] = now
+            # Only exceedances that were notified become active; ones held
+            # back by the cooldown stay new and alert once it has passed.
+            # Between `cleared` and `above` the state is kept (hysteresis band).
+            self._active = (self._active & ~cleared) | (new & alerting[:, None])
+            eval_seconds = time.perf_counter() - start
+            changed = np.flatnonzero((self._active != before).any(axis=1) | alerting)
+            if self.state is not None and len(changed):
+                try:
+                    self._save_state(index, changed)
+                except Exception as e:
+                    logger.error("Saving alert state failed: %s", e)
+
+            jobs = self._jobs(index, alerted, new, aqi, now)
+            if self.dispatcher is not None and jobs:
+                self.dispatcher.submit(jobs)
+            self.last_run = {
+                "users": len(index),
+                "locations": len(index.locations),
+                "alerts": len(alerted),
+                "jobs": len(jobs),
+                "active": int(self._active.any(axis=1).sum()),
+                "state_changes": len(changed),
+                "eval_seconds": round(eval_seconds, 4),
+                "seconds": round(time.perf_counter() - start, 4),
+            }
+            return self.last_run
+
+    @staticmethod
+    def _jobs(index, alerted, new, aqi, now):
+        """One job per alerted user and enabled channel."""
+        jobs = []
+        columns = zip(
+            index.user_ids[alerted].tolist(),
+            index.loc_idx[alerted].tolist(),
+            index.channels[alerted].tolist(),
+            new[alerted].tolist(),
+            aqi[alerted].tolist(),
+        )
+        for user_id, loc, channels, flags, values in columns:
+            pollutants = {p: v for p, flag, v in zip(POLLUTANTS, flags, values) if flag}
+            location = index.locations[loc]
+            for bit, channel in enumerate(CHANNELS):
+                if channels >> bit & 1:
+                    jobs.append({
+                        "user_id": user_id,
+                        "channel": channel,
+                        "location": location,
+                        "pollutants": pollutants,
+                        "created_at": now,
+                    })
+        return jobs
+
+    def stats(self):
+        return {
+            "users": len(self.index) if self.index is not None else None,
+            "locations": len(self.index.locations) if self.index is not None else None,
+            "load_seconds": self.load_seconds,
+            "last_run": self.last_run,
+            "dispatcher": self.dispatcher.stats() if self.dispatcher is not None else None,
+        }
+
+
+# --- Dispatch ---
+
+class LogSink:
+    """Stub sink: counts deliveries and logs one line per batch."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.sent = 0
+        self.batches = 0
+
+    def send_batch(self, jobs):
+        self.sent += len(jobs)
+        self.batches += 1
+        logger.info("%s: %d notifications (first: user %s)", self.channel, len(jobs), jobs[0]["user_id"])
+
+
+class AlertDispatcher:
+    """
+    Queue of notification jobs drained by one worker thread, which hands
+    each channel's sink up to `batch_size` jobs at a time, waiting at most
+    `batch_wait` seconds to fill a batch.
+    """
+
+    def __init__(self, sinks=None, batch_size=ALERT_BATCH_SIZE, batch_wait=ALERT_BATCH_WAIT):
+        self.sinks = sinks or {c: LogSink(c) for c in CHANNELS}
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self.queued = 0
+        self.failed = 0
+
+    def submit(self, jobs):
+        self.queued += len(jobs)
+        self._queue.put(jobs)
+        self.start()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="alert-dispatch")
+            self._thread.start()
+
+    def _run(self):
+        pending = {c: [] for c in self.sinks}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                jobs = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                jobs = None
+            if jobs is not None:
+                for job in jobs:
+                    pending.setdefault(job["channel"], []).append(job)
+                    if len(pending[job["channel"]]) >= self.batch_size:
+                        self._send(job["channel"], pending[job["channel"]])
+                        pending[job["channel"]] = []
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_wait
+            if jobs is None or time.monotonic() >= deadline:
+                for channel, batch in pending.items():
+                    if batch:
+                        self._send(channel, batch)
+                        pending[channel] = []
+                deadline = None
+            if jobs is not None:
+                self._queue.task_done()
+
+    def _send(self, channel, batch):
+        sink = self.sinks.get(channel)
+        if sink is None:
+            return
+        try:
+            sink.send_batch(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("%s sink failed for %d jobs: %s", channel, len(batch), e)
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "failed": self.failed,
+            "backlog": self._queue.qsize(),
+            "sent": {c: getattr(s, "sent", None) for c, s in self.sinks.items()},
+        }
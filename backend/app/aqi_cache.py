@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app import upstream
+
+logger = logging.getLogger(__name__)
+
+# --- Live AQI cache ---
+# Sits in front of the AirNow fetch so repeated questions about the same
+# ZIP share one upstream call. AirNow publishes observations hourly, so a
+# one-hour TTL keeps answers as fresh as the source.
+
+
+class LiveAQICache:
+    """
+    Per-key cache of live AQI rows.
+
+    - Entries younger than `ttl` are served directly (hit).
+    - Entries older than `ttl` but within `ttl + stale_ttl` are served as-is
+      while a background refresh is started (stale).
+    - Anything else is fetched synchronously (miss). Concurrent misses for
+      the same key wait on a single upstream call (single-flight).
+
+    If a `store` (LiveObservationStore) is given, every fresh result is
+    merged into it as well. `afetch` is the async fetcher used by `aget`
+    so the event loop never blocks on upstream calls.
+
+    When a fetch fails or comes back empty, the last rows we had for the
+    key are served regardless of age (or the store's rows after a restart),
+    and `age(key)` tells callers how old they are. Background refreshes
+    run at upstream BACKGROUND priority.
+
+    The last request per key is recorded: `requested_keys()` is what the
+    periodic refresh should keep warm, and `evict_idle()` drops keys nobody
+    asked about for `ttl + stale_ttl` (they would be misses anyway), so a
+    ZIP asked about once isn't polled forever.
+    """
+
+    def __init__(self, fetch, ttl=3600, stale_ttl=3 * 3600, refresh_workers=4, store=None, afetch=None):
+        self.fetch = fetch
+        self.afetch = afetch
+        self.store = store
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}   # key -> (rows, fetched_at)
+        self._requested = {}  # key -> monotonic time of the last get/aget
+        self._inflight = {}  # key -> Future
+        self._ainflight = {}  # key -> asyncio.Future (event-loop callers)
+        self._refresh_tasks = set()  # strong refs so running refreshes aren't GC'd
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="aqi-refresh"
+        )
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "fallbacks": 0,
+            "evictions": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        """Returns cached rows for `key`, fetching or refreshing as needed."""
+        self._requested[key] = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            rows, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._count("hits")
+                return rows
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale")
+                self.refresh_in_background(key)
+                return rows
+        self._count("misses")
+        return self._load(key)
+
+    def _load(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self._counters["coalesced"] += 1
+
+        if owner:
+            try:
+                rows = self._fetched(key, self.fetch)
+                future.set_result(rows)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                    self._counters["refreshes"] += 1
+        return future.result()
+
+    async def aget(self, key):
+        """Async `get`: same semantics, but upstream calls go through `afetch`."""
+        if self.afetch is None:
+            return await asyncio.to_thread(self.get, key)
+        self._requested[key] = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            rows, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._count("hits")
+                return rows
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale")
+                if key not in self._ainflight:
+                    task = asyncio.get_running_loop().create_task(self._arefresh(key))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+                return rows
+        self._count("misses")
+        return await self._aload(key)
+
+    async def _aload(self, key):
+        future = self._ainflight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._ainflight[key] = future
+        try:
+            try:
+                rows = await self.afetch(key)
+            except Exception as e:
+                rows = self._fallback(key, e)
+            else:
+                rows = self._accept(key, rows)
+            future.set_result(rows)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if not future.done():
+                # The owner was cancelled (client disconnect): coalesced
+                # waiters get the last known rows instead of hanging.
+                future.set_result(self._fallback(key, None))
+            self._ainflight.pop(key, None)
+            self._count("refreshes")
+        return await future
+
+    def _fetched(self, key, fetch):
+        try:
+            rows = fetch(key)
+        except Exception as e:
+            return self._fallback(key, e)
+        return self._accept(key, rows)
+
+    def _accept(self, key, rows):
+        if not rows:
+            return self._fallback(key, None)
+        self.put(key, rows)
+        return rows
+
+    def _fallback(self, key, error):
+        """Last known rows for `key` after a failed or empty fetch (may be [])."""
+        if error is not None:
+            self._count("refresh_errors")
+            logger.warning("Live AQI fetch for %s failed: %s", key, error)
+        entry = self._entries.get(key)
+        rows = entry[0] if entry is not None else []
+        if not rows and self.store is not None:
+            rows = self.store.rows(key)
+        if rows:
+            self._count("fallbacks")
+        return rows
+
+    async def _arefresh(self, key):
+        with upstream.priority(upstream.BACKGROUND):
+            try:
+                await self._aload(key)
+            except Exception:
+                pass  # the stale rows keep being served
+
+    def refresh_in_background(self, key):
+        """Starts a refresh for `key` unless one is already running."""
+        if key in self._inflight:
+            return
+        self._executor.submit(self._load, key)
+
+    def put(self, key, rows, fetched_at=None):
+        """
+        Stores rows for `key`. `fetched_at` is a wall-clock timestamp for
+        rows fetched elsewhere (e.g. by another worker); older rows than
+        what we already hold are ignored.
+        """
+        # An empty result usually means the upstream call failed; keep
+        # serving what we have rather than caching the failure.
+        if not rows:
+            return
+        now = time.monotonic()
+        stamp = now if fetched_at is None else now - max(time.time() - fetched_at, 0)
+        current = self._entries.get(key)
+        if current is not None and current[1] > stamp:
+            return
+        self._entries[key] = (rows, stamp)
+        if self.store is not None:
+            self.store.merge(key, rows)
+
+    def warm(self, rows_by_key):
+        """Loads freshly fetched rows (e.g. from the periodic job)."""
+        for key, rows in rows_by_key.items():
+            self.put(key, rows)
+
+    def keys(self):
+        return list(self._entries)
+
+    def requested_keys(self, max_age=None):
+        """Keys asked for within `max_age` seconds (default `ttl + stale_ttl`)."""
+        max_age = self.ttl + self.stale_ttl if max_age is None else max_age
+        cutoff = time.monotonic() - max_age
+        return [key for key, at in list(self._requested.items()) if at >= cutoff]
+
+    def evict_idle(self, max_idle=None):
+        """Drops keys not requested (or, if never requested, fetched) within `max_idle` seconds."""
+        max_idle = self.ttl + self.stale_ttl if max_idle is None else max_idle
+        cutoff = time.monotonic() - max_idle
+        evicted = 0
+        with self._lock:
+            for key in list(self._entries.keys() | self._requested.keys()):
+                entry = self._entries.get(key)
+                last = self._requested.get(key, entry[1] if entry is not None else 0.0)
+                if last < cutoff and key not in self._inflight and key not in self._ainflight:
+                    self._entries.pop(key, None)
+                    self._requested.pop(key, None)
+                    evicted += 1
+            self._counters["evictions"] += evicted
+        return evicted
+
+    def age(self, key):
+        """Seconds since the cached rows for `key` were fetched, or None if not cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return max(0.0, time.monotonic() - entry[1])
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["stale"] + counters["misses"]
+        counters["entries"] = len(self._entries)
+        counters["requested_keys"] = len(self.requested_keys())
+        counters["hit_ratio"] = round(
+            (counters["hits"] + counters["stale"]) / lookups, 4
+        ) if lookups else 0.0
+        counters["ttl_seconds"] = self.ttl
+        return counters
@@ -1,11 +1,19 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from app import models, schemas, db
+from concurrent.futures import ThreadPoolExecutor
+from app import metrics, models, schemas, db
+from app.cache import LRUCache
+import asyncio
+import hmac
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,8 +21,24 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Authenticated-user cache (never outlives the token itself). Also the
+# bound on how long other workers may serve a profile after an update.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Operational endpoints (/startup, /db/pool, /metrics, /chat/stats) require
+# this in the X-Admin-Token header; unset, they are not served at all.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# bcrypt work factor (each +1 doubles hashing cost)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Password hashing runs in its own bounded pool so a login burst can't take
+# over the request threadpool. bcrypt releases the GIL, so threads scale
+# across cores.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 1))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", PASSWORD_WORKERS * 4))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -24,6 +48,68 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+# Running + queued password jobs; when exhausted we shed load with a 503.
+_password_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_LIMIT)
+PASSWORD_JOBS_STARTED = metrics.counter("password_jobs_started_total", "Password jobs accepted by the bcrypt pool.")
+_password_started = PASSWORD_JOBS_STARTED.labels()
+PASSWORD_JOBS = metrics.counter("password_jobs_total", "Password jobs by outcome.", ("outcome",))
+_password_outcomes = {
+    outcome: PASSWORD_JOBS.labels(outcome) for outcome in ("completed", "failed", "cancelled", "rejected")
+}
+
+def _password_job_done(future):
+    """Frees the slot once the job has really finished (or never started)."""
+    _password_slots.release()
+    if future.cancelled():
+        _password_outcomes["cancelled"].inc()
+    elif future.exception() is not None:
+        _password_outcomes["failed"].inc()
+    else:
+        _password_outcomes["completed"].inc()
+
+async def run_password_task(fn, *args):
+    """Runs a password function in the bcrypt pool, or fails fast with 503."""
+    if not _password_slots.acquire(blocking=False):
+        _password_outcomes["rejected"].inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    _password_started.inc()
+    try:
+        future = _password_pool.submit(fn, *args)
+    except Exception:
+        _password_slots.release()
+        _password_outcomes["failed"].inc()
+        raise
+    # A cancelled request stops waiting, but a job that is already hashing
+    # keeps its slot until it finishes.
+    future.add_done_callback(_password_job_done)
+    return await asyncio.wrap_future(future)
+
+def password_pool_summary():
+    """Pool gauges; job outcomes are the password_jobs_total counter."""
+    finished = sum(_password_outcomes[outcome].value() for outcome in ("completed", "failed", "cancelled"))
+    return {
+        "in_flight": _password_started.value() - finished,
+        "workers": PASSWORD_WORKERS,
+        "queue_limit": PASSWORD_QUEUE_LIMIT,
+    }
+
+async def get_password_hash_async(password):
+    return await run_password_task(get_password_hash, password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+def require_admin_token(x_admin_token: str = Header(None)):
+    """Admin-only: the X-Admin-Token header must match ADMIN_TOKEN."""
+    if not (ADMIN_TOKEN and x_admin_token and hmac.compare_digest(x_admin_token, ADMIN_TOKEN)):
+        # Don't reveal that the endpoint exists
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -39,12 +125,58 @@ def authenticate_user(database: Session, username: str, password: str):
         return False
     return user
 
+# --- Token -> user cache ---
+# Protected routes resolve the user on every request; caching a detached
+# snapshot per token skips both the JWT decode and the DB query. Entries
+# record the user's generation, and invalidate_user() bumps it, so a
+# profile update makes every cached token for that user miss.
+#
+# Generations are per process: the worker that handled the update drops
+# its entries at once, other uvicorn workers keep serving the old profile
+# for at most USER_CACHE_TTL seconds. Keep the TTL short (default 60 s)
+# where profile changes must be visible everywhere sooner.
+
+_user_cache = LRUCache(maxsize=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL)
+_user_generation = {}
+
+def snapshot_user(user):
+    """Detached copy of a User row (holds no SQLAlchemy session)."""
+    return schemas.User.model_validate(user)
+
+def invalidate_user(user_id):
+    _user_generation[user_id] = _user_generation.get(user_id, 0) + 1
+
+def _cached_user(token):
+    entry = _user_cache.get(token)
+    if entry is None:
+        return None
+    user, generation = entry
+    if _user_generation.get(user.id, 0) != generation:
+        _user_cache.pop(token)
+        return None
+    return user
+
+def _cache_user(token, user, expires_at):
+    # `exp` is a Unix timestamp, so compare with time.time() (not a naive
+    # utcnow(), which .timestamp() would read as local time)
+    ttl = min(USER_CACHE_TTL, expires_at - time.time())
+    if ttl > 0:
+        _user_cache.set(token, (user, _user_generation.get(user.id, 0)), ttl=ttl)
+
+def user_cache_stats():
+    return _user_cache.stats()
+
 # --- THIS IS THE NEW, MISSING FUNCTION ---
-def get_current_user(token: str = Depends(oauth2_scheme), database: Session = Depends(db.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), database: AsyncSession = Depends(db.get_async_db)):
     """
     Decodes the JWT token to get the current user.
     This function is a dependency used in protected routes.
+    Returns a detached schemas.User snapshot, cached per token.
     """
+    cached = _cached_user(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -59,8 +191,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), database: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = database.query(models.User).filter(models.User.username == token_data.username).first()
+    result = await database.execute(select(models.User).where(models.User.username == token_data.username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
-    return user
+    snapshot = snapshot_user(user)
+    if payload.get("exp") is not None:
+        _cache_user(token, snapshot, payload["exp"])
+    return snapshot
 
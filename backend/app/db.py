@@ -1,8 +1,14 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
+import asyncio
 import os
+import threading
+import time
 
 # --- Load environment variables ---
 load_dotenv()  # ensures .env file values are loaded
@@ -13,16 +19,180 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("❌ DATABASE_URL not found. Make sure it's defined in your .env file.")
 
+# Render/Heroku style "postgres://" URLs aren't accepted by SQLAlchemy 2.x
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+
+# --- Connection pool settings ---
+# Size the pool against the worker count: each worker gets its own pool,
+# so the server needs workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Recycle before the server/proxy drops idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolWaitStats:
+    """Time spent waiting to check a connection out of the pool."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def as_dict(self):
+        return {
+            "checkouts": self.count,
+            "wait_seconds_total": round(self.total_seconds, 6),
+            "wait_seconds_avg": round(self.total_seconds / self.count, 6) if self.count else 0.0,
+            "wait_seconds_max": round(self.max_seconds, 6),
+        }
+
+
+sync_pool_wait = PoolWaitStats()
+async_pool_wait = PoolWaitStats()
+
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            sync_pool_wait.record(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            async_pool_wait.record(time.perf_counter() - start)
+
+
+def _pool_kwargs(url, poolclass):
+    # In-memory SQLite needs its single-connection pool; everything else
+    # gets the tuned queue pool.
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url):
+    """Maps the sync DATABASE_URL to its async driver (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        query = dict(url.query)
+        # asyncpg uses "ssl" instead of libpq's "sslmode"
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
 # --- Create database engine ---
-engine = create_engine(DATABASE_URL)
+_url = make_url(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_pool_kwargs(_url, TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# --- Async engine (created on first use so a missing driver doesn't break import) ---
+_async_engine = None
+_async_session_factory = None
+_async_lock = threading.Lock()
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        with _async_lock:
+            if _async_engine is None:
+                url = async_database_url(DATABASE_URL)
+                _async_engine = create_async_engine(url, **_pool_kwargs(url, TimedAsyncQueuePool))
+                _async_session_factory = async_sessionmaker(
+                    _async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+                )
+    return _async_engine
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_session_factory = None
+
+# --- Lazy schema check ---
+# create_all runs once, in the background at startup or on the first
+# request that needs the database, whichever comes first.
+_schema_ready = threading.Event()
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    if _schema_ready.is_set():
+        return
+    with _schema_lock:
+        if not _schema_ready.is_set():
+            from app import models  # noqa: F401  (registers the tables)
+            Base.metadata.create_all(bind=engine)
+            _schema_ready.set()
+
 # --- Dependency for getting DB session ---
 def get_db():
+    ensure_schema()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+# --- Dependency for getting an async DB session ---
+async def get_async_db():
+    if not _schema_ready.is_set():
+        await asyncio.to_thread(ensure_schema)
+    get_async_engine()
+    async with _async_session_factory() as session:
+        yield session
+
+def _pool_status(pool, wait_stats):
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    stats.update(wait_stats.as_dict())
+    return stats
+
+def pool_stats():
+    """Connection pool usage for the sync and async engines."""
+    return {
+        "sync": _pool_status(engine.pool, sync_pool_wait),
+        "async": _pool_status(_async_engine.pool, async_pool_wait) if _async_engine is not None else None,
+        "settings": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+        },
+    }
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+import time
+import warnings
+from datetime import date
+
+import numpy as np
+
+from app.trends_store import SATELLITE_PREFIX, _label
+
+logger = logging.getLogger(__name__)
+
+# --- Batch AQI forecasting ---
+# One autoregressive model per pollutant, AR(p) on each ZIP's deviation from
+# its own mean, fitted by ridge-regularized least squares over the windows
+# of every ZIP at once (a ZIP x day matrix, no per-ZIP loops). Forecasting
+# is then p multiply-adds per step for all ZIPs together. Results are cached
+# per store version, so they're recomputed only after a reload or append.
+#
+# The historical series is daily, so forecasts are daily steps ahead of the
+# last observed day. When the data lags behind (the last observed day is
+# more than the horizon ago), every forecast day is already past: callers
+# only present days from today on and report the forecast as stale.
+
+FORECAST_ORDER = int(os.getenv("FORECAST_ORDER", 7))
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", 3))
+# Only the most recent days are used for fitting.
+FORECAST_TRAIN_DAYS = int(os.getenv("FORECAST_TRAIN_DAYS", 365))
+FORECAST_RIDGE = float(os.getenv("FORECAST_RIDGE", 1e-3))
+
+
+def forward_fill(matrix):
+    """Fills NaNs with the previous value along each row (leading NaNs stay)."""
+    mask = np.isnan(matrix)
+    idx = np.where(mask, 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return matrix[np.arange(matrix.shape[0])[:, None], idx]
+
+
+def fit_ar(deviations, order, ridge=FORECAST_RIDGE, chunk_rows=1024):
+    """
+    Fits y[t] = c + sum(a_k * y[t-k]) over every complete window of every
+    row. The normal equations are accumulated a block of rows at a time,
+    so memory stays bounded however many ZIPs there are. Returns
+    (coefficients[order + 1], rmse, samples), oldest lag first, or None
+    when there are too few complete windows.
+    """
+    n = deviations.shape[1] - order
+    if n <= 0:
+        return None
+    gram = np.zeros((order + 1, order + 1))
+    xty = np.zeros(order + 1)
+    yy = 0.0
+    samples = 0
+    for lo in range(0, deviations.shape[0], chunk_rows):
+        block = deviations[lo:lo + chunk_rows]
+        lags = [block[:, j:j + n] for j in range(order + 1)]  # views; last is the target
+        valid = ~np.isnan(lags[0])
+        for lag in lags[1:]:
+            valid &= ~np.isnan(lag)
+        y = lags[order][valid]
+        x = np.column_stack([lag[valid] for lag in lags[:order]] + [np.ones(len(y))])
+        gram += x.T @ x
+        xty += x.T @ y
+        yy += float(y @ y)
+        samples += len(y)
+    if samples < 4 * (order + 1):
+        return None
+    regularized = gram.copy()
+    regularized[np.diag_indices(order)] += ridge * samples
+    coef = np.linalg.solve(regularized, xty)
+    sse = yy - 2 * coef @ xty + coef @ gram @ coef
+    return coef, float(np.sqrt(max(sse, 0.0) / samples)), samples
+
+
+def predict_ar(history, coef, horizon):
+    """Rolls the AR model forward `horizon` steps for every row of `history`."""
+    order = len(coef) - 1
+    state = history[:, -order:].copy()
+    out = np.empty((history.shape[0], horizon))
+    for h in range(horizon):
+        step = state @ coef[:order] + coef[order]
+        out[:, h] = step
+        state = np.hstack([state[:, 1:], step[:, None]])
+    return out
+
+
+# EPA PM2.5 (24-hour, ug/m3) breakpoints -> AQI, 2024 revision
+_PM25_BREAKPOINTS = [0.0, 9.0, 9.1, 35.4, 35.5, 55.4, 55.5, 125.4, 125.5, 225.4, 225.5, 325.4]
+_PM25_AQI = [0, 50, 51, 100, 101, 150, 151, 200, 201, 300, 301, 500]
+
+
+def pm25_aqi(concentration):
+    """Converts PM2.5 concentrations (ug/m3) to AQI, vectorized."""
+    return np.round(np.interp(concentration, _PM25_BREAKPOINTS, _PM25_AQI))
+
+
+class ForecastResult:
+    def __init__(self, zip_index, location_names, issued, dates, values, models, seconds):
+        self.zip_index = zip_index
+        self.location_names = location_names
+        self.issued = issued          # last observed day (datetime64[D])
+        self.dates = dates            # forecast days
+        self.values = values          # pollutant -> (zips, horizon)
+        self.models = models          # pollutant -> {order, rmse, samples}
+        self.seconds = seconds
+
+    def __contains__(self, zip_code):
+        return zip_code in self.zip_index
+
+    def upcoming(self, today=None):
+        """Index of the first forecast day that isn't in the past."""
+        return int(np.searchsorted(self.dates, np.datetime64(today or date.today(), "D")))
+
+    def is_stale(self, today=None):
+        """True when there is no forecast for today or later."""
+        return self.issued is None or self.upcoming(today) >= len(self.dates)
+
+    def points(self, zip_code, horizon=None, today=None):
+        """Forecast rows for one ZIP from today on: [{"date", "label", pollutant: value}, ...]."""
+        idx = self.zip_index[zip_code]
+        first = self.upcoming(today)
+        last = len(self.dates) if horizon is None else min(first + horizon, len(self.dates))
+        points = []
+        for h in range(first, last):
+            point = {"date": str(self.dates[h]), "label": _label(self.dates[h])}
+            for p, matrix in self.values.items():
+                v = matrix[idx, h]
+                point[p] = None if np.isnan(v) else round(float(v), 1)
+            points.append(point)
+        return points
+
+
+def forecast_store(store, order=FORECAST_ORDER, horizon=FORECAST_HORIZON_DAYS, train_days=FORECAST_TRAIN_DAYS):
+    """Fits per-pollutant models on a TrendsStore and forecasts every ZIP."""
+    start = time.perf_counter()
+    ground = [p for p in store.values if not p.startswith(SATELLITE_PREFIX)]
+    columns = {p: np.asarray(store.values[p], dtype=np.float64) for p in ground}
+
+    # Forecast from the last day with any ground observation
+    has_data = np.zeros(len(store.dates), dtype=bool)
+    for matrix in columns.values():
+        has_data |= ~np.isnan(matrix).all(axis=0)
+    observed = np.flatnonzero(has_data)
+    n_zips = len(store)
+    if not len(observed):
+        return ForecastResult(dict(store.zip_index), list(store.location_names), None,
+                              np.array([], dtype="datetime64[D]"), {}, {}, 0.0)
+    last = observed[-1]
+    first = max(0, last + 1 - train_days)
+    issued = store.dates[last]
+    dates = issued + np.arange(1, horizon + 1)
+
+    values, models = {}, {}
+    for p, matrix in columns.items():
+        window = matrix[:, first:last + 1]
+        with warnings.catch_warnings():
+            # ZIPs with no data in the window give "mean of empty slice"
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            means = np.nanmean(window, axis=1)
+        deviations = window - means[:, None]
+        fitted = fit_ar(deviations, order)
+        if fitted is None:
+            # Too little history: persistence (repeat the last value)
+            forecast = np.repeat(forward_fill(window)[:, -1:], horizon, axis=1)
+            models[p] = {"model": "persistence", "order": 0, "rmse": None, "samples": 0}
+        else:
+            coef, rmse, samples = fitted
+            history = forward_fill(deviations)
+            if history.shape[1] < order:
+                history = np.hstack([np.zeros((n_zips, order - history.shape[1])), history])
+            # ZIPs with gaps at the start of the window fall back to their mean
+            history = np.nan_to_num(history, nan=0.0)
+            forecast = predict_ar(history, coef, horizon) + means[:, None]
+            models[p] = {"model": "ar", "order": order, "rmse": round(rmse, 3), "samples": samples}
+        values[p] = np.maximum(forecast, 0)
+
+    return ForecastResult(
+        dict(store.zip_index), list(store.location_names), issued, dates, values, models,
+        round(time.perf_counter() - start, 4),
+    )
+
+
+class ForecastEngine:
+    """Caches the batch forecast for the current store generation."""
+
+    def __init__(self, order=FORECAST_ORDER, horizon=FORECAST_HORIZON_DAYS, train_days=FORECAST_TRAIN_DAYS):
+        self.order = order
+        self.horizon = horizon
+        self.train_days = train_days
+        self._generation = None
+        self._result = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.runs = 0
+
+    def _current(self, store):
+        return self._generation == store.generation
+
+    def get(self, store):
+        """Forecast for `store`, recomputed only after a reload or append."""
+        if self._current(store):
+            return self._result
+        with self._lock:
+            if not self._current(store):
+                self._result = forecast_store(store, self.order, self.horizon, self.train_days)
+                self._generation = store.generation
+                self.runs += 1
+        return self._result
+
+    def get_nowait(self, store):
+        """
+        Last computed forecast without blocking; if `store` has changed
+        since, a recompute is started in the background.
+        """
+        if not self._current(store) and not self._refreshing:
+            self._refreshing = True
+
+            def run():
+                try:
+                    self.get(store)
+                except Exception as e:
+                    logger.error("Forecast refresh failed: %s", e)
+                finally:
+                    self._refreshing = False
+
+            threading.Thread(target=run, daemon=True, name="forecast-refresh").start()
+        return self._result
+
+    def stats(self):
+        result = self._result
+        return {
+            "runs": self.runs,
+            "issued": str(result.issued) if result is not None and result.issued is not None else None,
+            "horizon_days": self.horizon,
+            "seconds": result.seconds if result is not None else None,
+            "models": result.models if result is not None else {},
+        }
+
+
+forecast_engine = ForecastEngine()
@@ -0,0 +1,286 @@
+import csv
+import math
+import os
+import tempfile
+import threading
+from collections import namedtuple
+
+# --- ZIP -> reporting area resolution ---
+# AirNow reports observations per reporting area, and dozens of ZIPs share
+# one area. Resolving a ZIP to its nearest known area (via an offline ZIP
+# centroid table and a grid index of area coordinates) lets the live cache
+# and refresh job key on the area, so neighbouring ZIPs share one upstream
+# call. Areas are learned from AirNow responses, which carry the area's
+# coordinates, and persisted between runs.
+#
+# The centroid file is a CSV with ZipCode,Latitude,Longitude columns; the
+# Census ZCTA gazetteer (tab-separated, GEOID/INTPTLAT/INTPTLONG) is read
+# as-is for national coverage.
+
+EARTH_RADIUS_KM = 6371.0
+
+ReportingArea = namedtuple("ReportingArea", ("name", "state", "lat", "lon"))
+
+AREA_KEY_PREFIX = "area:"
+
+
+def area_key(name, state):
+    """Cache key for a reporting area, e.g. "area:CA:S Central LA CO"."""
+    return f"{AREA_KEY_PREFIX}{state or ''}:{name}"
+
+
+def is_area_key(key):
+    return key.startswith(AREA_KEY_PREFIX)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def load_zip_centroids(path):
+    """Returns {zip: (lat, lon)} from a centroid CSV or Census gazetteer file."""
+    centroids = {}
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            header = f.readline()
+            delimiter = "\t" if "\t" in header else ","
+            f.seek(0)
+            reader = csv.DictReader(f, delimiter=delimiter)
+            fields = {name.strip(): name for name in reader.fieldnames or []}
+            if "GEOID" in fields:
+                zip_col, lat_col, lon_col = fields["GEOID"], fields["INTPTLAT"], fields["INTPTLONG"]
+            else:
+                zip_col, lat_col, lon_col = "ZipCode", "Latitude", "Longitude"
+            for row in reader:
+                try:
+                    centroids[row[zip_col].strip().zfill(5)] = (float(row[lat_col]), float(row[lon_col]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return centroids
+
+
+class ReportingAreaIndex:
+    """
+    Uniform lat/lon grid of reporting areas. `nearest` scans rings of cells
+    outward from the query point and stops once no unscanned cell can hold
+    anything closer than what it found, so a lookup touches a handful of
+    cells regardless of how many areas are indexed.
+    """
+
+    def __init__(self, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self._cells = {}   # (row, col) -> [ReportingArea, ...]
+        self._areas = {}   # area key -> ReportingArea
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def add(self, name, state, lat, lon):
+        """Indexes an area; returns True if it was new or moved."""
+        area = ReportingArea(name, state, float(lat), float(lon))
+        key = area_key(name, state)
+        with self._lock:
+            current = self._areas.get(key)
+            if current == area:
+                return False
+            if current is not None:
+                cell = self._cell(current.lat, current.lon)
+                self._cells[cell] = [a for a in self._cells[cell] if a != current]
+            cell = self._cell(area.lat, area.lon)
+            # Copy-on-write so lookups never see a list being mutated
+            self._cells[cell] = self._cells.get(cell, []) + [area]
+            self._areas[key] = area
+            self.version += 1
+        return True
+
+    def get(self, key):
+        return self._areas.get(key)
+
+    def __len__(self):
+        return len(self._areas)
+
+    def __iter__(self):
+        return iter(list(self._areas.values()))
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """Returns up to `k` (distance_km, ReportingArea) pairs, closest first."""
+        if not self._areas:
+            return []
+        k = min(k, len(self._areas))
+        row0, col0 = self._cell(lat, lon)
+        max_ring = int(180 / self.cell_deg)
+        found = []
+        for ring in range(max_ring + 1):
+            for row in range(row0 - ring, row0 + ring + 1):
+                for col in range(col0 - ring, col0 + ring + 1):
+                    if max(abs(row - row0), abs(col - col0)) != ring:
+                        continue
+                    for area in self._cells.get((row, col), ()):
+                        found.append((haversine_km(lat, lon, area.lat, area.lon), area))
+            # Anything in ring+1 or beyond is at least `ring` cells away;
+            # a cell is narrowest in longitude at the most polar latitude
+            # the search has reached.
+            polar = math.radians(min(abs(lat) + (ring + 1) * self.cell_deg, 89.0))
+            reach = ring * self.cell_deg * 111.0 * max(math.cos(polar), 0.01)
+            if max_km is not None and reach > max_km:
+                break
+            if len(found) >= k and sorted(d for d, _ in found)[k - 1] <= reach:
+                break
+        found.sort(key=lambda item: item[0])
+        if max_km is not None:
+            found = [item for item in found if item[0] <= max_km]
+        return found[:k]
+
+    def load(self, path):
+        """Loads areas saved by `save`; returns how many were read."""
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        except FileNotFoundError:
+            return 0
+        for row in rows:
+            try:
+                self.add(row["ReportingArea"], row["StateCode"], float(row["Latitude"]), float(row["Longitude"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return len(rows)
+
+    def save(self, path):
+        """Writes all areas to a temp file and renames it over `path`."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".areas-", suffix=".csv")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["ReportingArea", "StateCode", "Latitude", "Longitude"])
+                for area in self:
+                    writer.writerow([area.name, area.state, area.lat, area.lon])
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+
+class ZipResolver:
+    """
+    Maps ZIPs to live-AQI cache keys: the nearest reporting area within
+    `max_km` of the ZIP centroid, or the ZIP itself when the centroid or a
+    nearby area is unknown. Results are memoized until the index changes.
+    Files are read on first use so importing the app stays cheap.
+    """
+
+    def __init__(self, centroids_path, areas_path=None, max_km=50.0, cell_deg=1.0):
+        self.centroids_path = centroids_path
+        self.areas_path = areas_path
+        self.max_km = max_km
+        self.index = ReportingAreaIndex(cell_deg)
+        self._centroids = None
+        self._memo = {}
+        self._memo_version = -1
+        self._init_lock = threading.Lock()
+        self._dirty = False
+        self._areas_signature = None
+        self._counters = {"area": 0, "zip": 0, "area_reloads": 0}
+
+    def _ensure_loaded(self):
+        if self._centroids is None:
+            with self._init_lock:
+                if self._centroids is None:
+                    self._load_areas()
+                    self._centroids = load_zip_centroids(self.centroids_path)
+
+    def _areas_file_signature(self):
+        try:
+            st = os.stat(self.areas_path)
+        except (FileNotFoundError, TypeError):
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _load_areas(self):
+        """Merges the areas file into the index if it changed since the last read."""
+        signature = self._areas_file_signature()
+        if signature is None or signature == self._areas_signature:
+            return False
+        self._areas_signature = signature
+        self.index.load(self.areas_path)
+        self._counters["area_reloads"] += 1
+        return True
+
+    def area(self, key):
+        """Returns the ReportingArea for an area key. The table is kept in
+        memory; on a miss the areas file is re-read only if it changed
+        (another worker may have learned the area)."""
+        self._ensure_loaded()
+        area = self.index.get(key)
+        if area is None and self._load_areas():
+            area = self.index.get(key)
+        return area
+
+    def centroid(self, zip_code):
+        self._ensure_loaded()
+        return self._centroids.get(zip_code)
+
+    def nearest_areas(self, zip_code, k=1):
+        """Nearest reporting areas to a ZIP as (distance_km, ReportingArea) pairs."""
+        point = self.centroid(zip_code)
+        if point is None:
+            return []
+        return self.index.nearest(point[0], point[1], k=k, max_km=self.max_km)
+
+    def key_for_zip(self, zip_code):
+        """Returns the cache key to use for a ZIP's live AQI."""
+        self._ensure_loaded()
+        if self._memo_version != self.index.version:
+            self._memo = {}
+            self._memo_version = self.index.version
+        key = self._memo.get(zip_code)
+        if key is None:
+            nearest = self.nearest_areas(zip_code)
+            key = area_key(nearest[0][1].name, nearest[0][1].state) if nearest else zip_code
+            self._memo[zip_code] = key
+        self._counters["area" if is_area_key(key) else "zip"] += 1
+        return key
+
+    def learn(self, rows):
+        """Indexes the reporting areas (with coordinates) seen in AirNow rows."""
+        self._ensure_loaded()
+        added = 0
+        for row in rows:
+            lat, lon = row.get("Latitude"), row.get("Longitude")
+            if lat is None or lon is None or not row.get("ReportingArea"):
+                continue
+            if self.index.add(row["ReportingArea"], row.get("StateCode"), lat, lon):
+                added += 1
+        if added:
+            self._dirty = True
+        return added
+
+    def save(self):
+        """Persists learned areas if anything changed."""
+        if not self.areas_path or not self._dirty:
+            return False
+        self._dirty = False
+        # Merge in what other workers saved so their areas aren't dropped
+        self._load_areas()
+        self.index.save(self.areas_path)
+        self._areas_signature = self._areas_file_signature()
+        return True
+
+    def stats(self):
+        return {
+            "zip_centroids": len(self._centroids) if self._centroids is not None else None,
+            "reporting_areas": len(self.index),
+            "resolved_to_area": self._counters["area"],
+            "resolved_to_zip": self._counters["zip"],
+            "area_file_reloads": self._counters["area_reloads"],
+            "max_km": self.max_km,
+        }
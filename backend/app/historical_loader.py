@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no locking
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- Historical data loader ---
+# Owns the live TrendsStore. The source file is checked for changes
+# (mtime/inode/size) at most every `check_interval` seconds; a changed file
+# is parsed in a background thread and swapped in with a single reference
+# assignment, so requests keep reading the old version until the new one is
+# ready. New days can be appended incrementally, either through `append` or
+# by adding JSON lines to the updates file, which is tailed from the last
+# byte offset read. Appends are copy-on-write: a published store is never
+# modified, the appended copy replaces it.
+#
+# On reload the applied updates are compacted: the merged store is saved
+# as memory-mappable arrays under `compact_dir` (tagged with the source
+# file's signature) and the updates file is emptied, so it doesn't grow
+# without bound or get replayed from the start on every reload. Other
+# workers notice the emptied file (new inode) and reload from the snapshot.
+# Appends (any worker, the tempo CLI) and compaction hold an exclusive
+# `updates_lock`, so no line is written while the file is being replaced.
+# Requests never apply updates themselves: new lines are picked up in a
+# background thread, like reloads.
+
+# Appended days live outside the source tree (ignored by git).
+HISTORICAL_DATA_DIR = os.getenv("HISTORICAL_DATA_DIR", "historical_data")
+HISTORICAL_UPDATES_PATH = os.getenv(
+    "HISTORICAL_UPDATES_PATH", os.path.join(HISTORICAL_DATA_DIR, "updates.jsonl")
+)
+HISTORICAL_COMPACT_DIR = os.path.join(HISTORICAL_DATA_DIR, "compacted")
+
+
+@contextmanager
+def updates_lock(updates_path):
+    """Exclusive inter-process lock for appending to or compacting an updates file."""
+    if fcntl is None:
+        yield
+        return
+    lock_path = Path(str(updates_path) + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # also releases the lock
+
+
+class HistoricalDataLoader:
+    def __init__(self, path, npy_dir=None, updates_path=None, compact_dir=None, check_interval=30):
+        self.path = Path(path)
+        self.npy_dir = Path(npy_dir) if npy_dir else None
+        self.updates_path = Path(updates_path) if updates_path else None
+        self.compact_dir = Path(compact_dir) if compact_dir else None
+        self.check_interval = check_interval
+        self._store = None
+        self._signature = None
+        self._updates_offset = 0
+        self._updates_signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()        # serializes loads and appends
+        self._init_lock = threading.Lock()
+        self._loading = False
+        self.version = 0
+        self.loaded_at = None
+        self.load_seconds = None
+        self.last_error = None
+        self.compactions = 0
+        self.compacted_bytes = 0
+
+    def _source_path(self):
+        if self.npy_dir and (self.npy_dir / "meta.json").exists():
+            return self.npy_dir / "meta.json"
+        return self.path
+
+    @staticmethod
+    def _stat_signature(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def get(self):
+        """Returns the current store, scheduling a reload if the source changed."""
+        if self._store is None:
+            with self._init_lock:
+                if self._store is None:
+                    self.reload()
+            return self._store
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._stat_signature(self._source_path()) != self._signature:
+                self.reload_in_background()
+            elif self.updates_path is not None:
+                signature = self._stat_signature(self.updates_path)
+                if self._compacted_elsewhere(signature):
+                    self.reload_in_background()
+                elif signature != self._updates_signature:
+                    self._in_background(self._tail_updates, "historical-updates")
+        return self._store
+
+    def _compacted_elsewhere(self, signature):
+        """Another worker replaced the updates file (new inode, or shorter than our offset)."""
+        previous = self._updates_signature
+        if signature is None or previous is None:
+            return False
+        return signature[1] != previous[1] or signature[2] < self._updates_offset
+
+    def peek(self):
+        """Current store without loading or checking for changes (None before the first load)."""
+        return self._store
+
+    def _in_background(self, target, name):
+        """Runs `target` (which clears `_loading`) in a thread unless one is running."""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=target, daemon=True, name=name).start()
+
+    def reload_in_background(self):
+        self._in_background(self.reload, "historical-reload")
+
+    def _tail_updates(self):
+        """Applies new lines of the updates file (to a copy of the store)."""
+        try:
+            with self._lock:
+                signature = self._stat_signature(self.updates_path)
+                self._store = self._apply_updates(self._store)
+                self._updates_signature = signature
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Applying historical updates failed: %s", e)
+        finally:
+            self._loading = False
+
+    def reload(self):
+        """Builds a fresh store from the source (plus updates) and swaps it in."""
+        # Imported here so NumPy isn't loaded at app import (cold start).
+        from app.trends_store import TrendsStore
+
+        start = time.perf_counter()
+        source = self._source_path()
+        signature = self._stat_signature(source)
+        try:
+            store = self._open_compacted(source, signature)
+            if store is None and source.name == "meta.json":
+                store = TrendsStore.open(self.npy_dir, mmap=True)
+            elif store is None and signature is None:
+                store = TrendsStore.empty()
+            elif store is None:
+                store = TrendsStore.from_json_file(self.path)
+            with self._lock, self._updates_locked():
+                self._updates_offset = 0
+                self._updates_signature = self._stat_signature(self.updates_path) if self.updates_path else None
+                store = self._apply_updates(store, copy=False)
+                if self._updates_offset and signature is not None:
+                    store = self._compact(store, source, signature)
+                self._store = store
+                self._signature = signature
+                self.version += 1
+                self.loaded_at = time.time()
+                self.load_seconds = round(time.perf_counter() - start, 4)
+                self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Historical data reload failed: %s", e)
+            if self._store is None:
+                self._store = TrendsStore.empty()
+        finally:
+            self._loading = False
+
+    def _apply_updates(self, store, copy=True):
+        """
+        Returns `store` with the new lines of the updates file applied
+        (caller holds the lock). With `copy` the lines go into a copy, so a
+        store that requests may be reading is left untouched.
+        """
+        if self.updates_path is None or not self.updates_path.exists():
+            return store
+        records = []
+        with self.updates_path.open("rb") as f:
+            f.seek(self._updates_offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # partially written line; pick it up next time
+                self._updates_offset += len(raw)
+                line = raw.strip()
+                if line:
+                    records.append(json.loads(line))
+        return self._appended(store, records, copy)
+
+    def _updates_locked(self):
+        if self.updates_path is None:
+            return nullcontext()
+        return updates_lock(self.updates_path)
+
+    # --- compaction ---
+
+    def _open_compacted(self, source, signature):
+        """The compacted snapshot, if it was built from this exact source file."""
+        from app.trends_store import TrendsStore
+
+        if self.compact_dir is None or signature is None:
+            return None
+        try:
+            built_from = json.loads((self.compact_dir / "source.json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if built_from != {"source": str(source), "signature": list(signature)}:
+            return None
+        return TrendsStore.open(self.compact_dir, mmap=True)
+
+    def _compact(self, store, source, signature):
+        """
+        Saves `store` (base + applied updates) as the compacted snapshot and
+        drops the applied lines from the updates file; lines appended
+        meanwhile are kept. Caller holds the lock and `updates_lock`.
+        Replaying a line twice after a crash is harmless: appends overwrite
+        by day.
+        """
+        if self.compact_dir is None:
+            return store
+        try:
+            tmp = self.compact_dir.with_name(self.compact_dir.name + ".tmp")
+            old = self.compact_dir.with_name(self.compact_dir.name + ".old")
+            shutil.rmtree(tmp, ignore_errors=True)
+            store.save(tmp)
+            (tmp / "source.json").write_text(
+                json.dumps({"source": str(source), "signature": list(signature)}), encoding="utf-8"
+            )
+            shutil.rmtree(old, ignore_errors=True)
+            if self.compact_dir.exists():
+                os.replace(self.compact_dir, old)
+            os.replace(tmp, self.compact_dir)
+            shutil.rmtree(old, ignore_errors=True)
+
+            with self.updates_path.open("rb") as f:
+                f.seek(self._updates_offset)
+                tail = f.read()
+            compacted = self._updates_offset
+            emptied = self.updates_path.with_name(self.updates_path.name + ".tmp")
+            emptied.write_bytes(tail)
+            os.replace(emptied, self.updates_path)
+            self._updates_offset = 0
+            self._updates_signature = self._stat_signature(self.updates_path)
+            self.compactions += 1
+            self.compacted_bytes += compacted
+            logger.info("Compacted %d bytes of historical updates into %s", compacted, self.compact_dir)
+        except OSError as e:
+            logger.error("Compacting historical updates failed: %s", e)
+        return store
+
+    @staticmethod
+    def _appended(store, records, copy=True):
+        if not records:
+            return store
+        if copy:
+            store = store.copy()
+        for record in records:
+            record = dict(record)
+            zip_code = record.pop("zip")
+            location_name = record.pop("locationName", None)
+            store.append_days(zip_code, [record], location_name)
+        return store
+
+    def append(self, zip_code, rows, location_name=None):
+        """
+        Appends days for one ZIP to the live store without a reload. With an
+        updates file the rows are written there first, so they survive the
+        next full reload.
+        """
+        records = []
+        for row in rows:
+            record = {"zip": zip_code, **row}
+            if location_name:
+                record["locationName"] = location_name
+            records.append(record)
+        self.append_records(records)
+
+    def append_records(self, records):
+        """Batch form of `append`: records are {"zip", "date", [locationName], values...}."""
+        if not records:
+            return
+        self.get()
+        with self._lock:
+            if self.updates_path is None:
+                self._store = self._appended(self._store, records)
+                return
+            self.updates_path.parent.mkdir(parents=True, exist_ok=True)
+            with updates_lock(self.updates_path):
+                replaced = self._compacted_elsewhere(self._stat_signature(self.updates_path))
+                with self.updates_path.open("a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+                if replaced:
+                    # Our offset belongs to the file another worker compacted
+                    # away: apply these records directly and reload below.
+                    self._store = self._appended(self._store, records)
+                else:
+                    self._store = self._apply_updates(self._store)
+                    self._updates_signature = self._stat_signature(self.updates_path)
+        if replaced:
+            self.reload_in_background()
+
+    def stats(self):
+        store = self._store
+        return {
+            "version": self.version,
+            "store_version": store.version if store is not None else None,
+            "source": str(self._source_path()),
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "loading": self._loading,
+            "zips": len(store) if store is not None else 0,
+            "days": len(store.dates) if store is not None else 0,
+            "memory_bytes": store.nbytes if store is not None else 0,
+            "memory_mapped": store.memory_mapped if store is not None else False,
+            "updates_offset": self._updates_offset,
+            "compactions": self.compactions,
+            "compacted_bytes": self.compacted_bytes,
+            "last_error": self.last_error,
+        }
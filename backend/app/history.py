@@ -0,0 +1,331 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# --- Observation history ---
+# Every refresh appends its observations instead of only replacing the
+# live snapshot. Raw rows go into one SQLite file per observation day
+# (raw/obs-YYYY-MM-DD.sqlite), written with a single executemany per day,
+# so retention is unlinking whole files. Rollups live in rollups.sqlite:
+# hourly -> daily -> monthly tables holding (sum, samples, peak) AQI per
+# key and parameter. After each batch only the touched hours are
+# re-aggregated from raw rows, then their days from hourly, then their
+# months from daily, so readers never scan raw observations.
+#
+# Keys are live-AQI cache keys (reporting area or ZIP); days and hours
+# are the local observation time AirNow reports.
+
+HISTORY_RAW_RETENTION_DAYS = int(os.getenv("HISTORY_RAW_RETENTION_DAYS", 30))
+HISTORY_HOURLY_RETENTION_DAYS = int(os.getenv("HISTORY_HOURLY_RETENTION_DAYS", 90))
+
+RESOLUTIONS = ("hourly", "daily", "monthly")
+_PERIOD_LENGTH = {"hourly": 13, "daily": 10, "monthly": 7}
+_PARTITION = re.compile(r"^obs-(\d{4}-\d{2}-\d{2})\.sqlite$")
+
+# AirNow ParameterName -> trends column, with EPA AQI breakpoints used to
+# turn daily mean AQI back into the concentration units of
+# historical_data.json (ug/m3 for particles, ppb for gases).
+_AQI = [0, 50, 51, 100, 101, 150, 151, 200, 201, 300, 301, 500]
+TREND_COLUMNS = {
+    "PM2.5": ("pm25", [0.0, 9.0, 9.1, 35.4, 35.5, 55.4, 55.5, 125.4, 125.5, 225.4, 225.5, 325.4], _AQI),
+    "PM10": ("pm10", [0, 54, 55, 154, 155, 254, 255, 354, 355, 424, 425, 604], _AQI),
+    # 8-hour ozone, ppb (EPA defines no 8-hour breakpoints above AQI 300)
+    "O3": ("o3", [0, 54, 55, 70, 71, 85, 86, 105, 106, 200], _AQI[:10]),
+    "NO2": ("no2", [0, 53, 54, 100, 101, 360, 361, 649, 650, 1249, 1250, 2049], _AQI),
+}
+
+
+def aqi_to_concentration(parameter, aqi):
+    """Inverse of the EPA AQI formula for one AirNow parameter (None if unknown)."""
+    spec = TREND_COLUMNS.get(parameter)
+    if spec is None or aqi is None:
+        return None
+    _, concentrations, aqis = spec
+    return round(float(np.interp(aqi, aqis, concentrations)), 1)
+
+
+def observation_hour(row):
+    """Local "YYYY-MM-DDTHH" of an AirNow row, or None without a date."""
+    observed = (row.get("DateObserved") or "").strip()
+    if not observed:
+        return None
+    try:
+        day = date.fromisoformat(observed)
+    except ValueError:
+        return None
+    hour = row.get("HourObserved")
+    return f"{day.isoformat()}T{int(hour) if hour not in (None, '') else 0:02d}"
+
+
+class HistoryStore:
+    def __init__(self, root, raw_retention_days=HISTORY_RAW_RETENTION_DAYS,
+                 hourly_retention_days=HISTORY_HOURLY_RETENTION_DAYS):
+        self.root = Path(root)
+        self.raw_dir = self.root / "raw"
+        self.rollups_path = self.root / "rollups.sqlite"
+        self.raw_retention_days = raw_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._ready = False
+        self.appended = 0
+        self.last_append_seconds = None
+        self.dropped_partitions = 0
+
+    # --- schema ---
+
+    def _init(self):
+        if self._ready:
+            return
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.rollups_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for table in RESOLUTIONS:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    " key TEXT NOT NULL, parameter TEXT NOT NULL, period TEXT NOT NULL,"
+                    " total REAL NOT NULL, samples INTEGER NOT NULL, peak REAL,"
+                    " PRIMARY KEY (key, parameter, period)) WITHOUT ROWID"
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        self._ready = True
+
+    def _partition_path(self, day):
+        return self.raw_dir / f"obs-{day}.sqlite"
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._init()
+            conn = sqlite3.connect(self.rollups_path, timeout=30, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    # --- writes ---
+
+    def append(self, rows_by_key, fetched_at=None):
+        """
+        Appends observations ({key: AirNow rows}) and updates the rollups
+        they touch. Returns {day: {keys}} for the days that changed.
+        """
+        fetched_at = fetched_at or time.time()
+        by_day = {}
+        for key, rows in rows_by_key.items():
+            for row in rows or ():
+                hour = observation_hour(row)
+                if hour is None or row.get("ParameterName") is None:
+                    continue
+                by_day.setdefault(hour[:10], []).append((
+                    key, row["ParameterName"], hour, row.get("AQI"), row.get("Category"),
+                    row.get("ReportingArea"), row.get("StateCode"), fetched_at,
+                ))
+        if not by_day:
+            return {}
+        self._init()
+        start = time.perf_counter()
+        touched = {}
+        with self._write_lock:
+            for day, records in sorted(by_day.items()):
+                self._append_day(day, records)
+                touched[day] = {r[0] for r in records}
+                self.appended += len(records)
+            self.enforce_retention()
+        self.last_append_seconds = round(time.perf_counter() - start, 4)
+        return touched
+
+    def _append_day(self, day, records):
+        conn = sqlite3.connect(self._partition_path(day), timeout=30)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                " key TEXT NOT NULL, parameter TEXT NOT NULL, hour TEXT NOT NULL,"
+                " aqi INTEGER, category TEXT, area TEXT, state TEXT, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (key, parameter, hour)) WITHOUT ROWID"
+            )
+            conn.execute("ATTACH DATABASE ? AS r", (str(self.rollups_path),))
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS touched (key TEXT, parameter TEXT, hour TEXT)")
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS touched_series (key TEXT, parameter TEXT)")
+            with conn:
+                # A re-fetched hour replaces the earlier reading
+                conn.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", records)
+                conn.execute("DELETE FROM temp.touched")
+                conn.executemany("INSERT INTO temp.touched VALUES (?, ?, ?)", {r[:3] for r in records})
+                conn.execute("DELETE FROM temp.touched_series")
+                conn.execute("INSERT INTO temp.touched_series SELECT DISTINCT key, parameter FROM temp.touched")
+                self._rollup(conn, day)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _rollup(conn, day):
+        upsert = (
+            " ON CONFLICT (key, parameter, period) DO UPDATE SET"
+            " total = excluded.total, samples = excluded.samples, peak = excluded.peak"
+        )
+        conn.execute(
+            "INSERT INTO r.hourly (key, parameter, period, total, samples, peak)"
+            " SELECT o.key, o.parameter, o.hour, SUM(o.aqi), COUNT(o.aqi), MAX(o.aqi)"
+            " FROM observations o JOIN temp.touched t"
+            "  ON o.key = t.key AND o.parameter = t.parameter AND o.hour = t.hour"
+            " WHERE o.aqi IS NOT NULL"
+            " GROUP BY o.key, o.parameter, o.hour" + upsert
+        )
+        conn.execute(
+            "INSERT INTO r.daily (key, parameter, period, total, samples, peak)"
+            " SELECT h.key, h.parameter, ?, SUM(h.total), SUM(h.samples), MAX(h.peak)"
+            " FROM r.hourly h JOIN temp.touched_series s ON h.key = s.key AND h.parameter = s.parameter"
+            " WHERE h.period BETWEEN ? AND ?"
+            " GROUP BY h.key, h.parameter" + upsert,
+            (day, f"{day}T00", f"{day}T23"),
+        )
+        month = day[:7]
+        conn.execute(
+            "INSERT INTO r.monthly (key, parameter, period, total, samples, peak)"
+            " SELECT d.key, d.parameter, ?, SUM(d.total), SUM(d.samples), MAX(d.peak)"
+            " FROM r.daily d JOIN temp.touched_series s ON d.key = s.key AND d.parameter = s.parameter"
+            " WHERE d.period BETWEEN ? AND ?"
+            " GROUP BY d.key, d.parameter" + upsert,
+            (month, f"{month}-01", f"{month}-31"),
+        )
+
+    def partitions(self):
+        """Raw partition days on disk, oldest first."""
+        if not self.raw_dir.is_dir():
+            return []
+        days = [m.group(1) for m in map(_PARTITION.match, os.listdir(self.raw_dir)) if m]
+        return sorted(days)
+
+    def enforce_retention(self, today=None):
+        """Unlinks raw partitions and deletes hourly rollups past retention."""
+        today = today or date.today()
+        raw_cutoff = (today - timedelta(days=self.raw_retention_days)).isoformat()
+        dropped = 0
+        for day in self.partitions():
+            if day >= raw_cutoff:
+                break
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                Path(f"{self._partition_path(day)}{suffix}").unlink(missing_ok=True)
+            dropped += 1
+        self.dropped_partitions += dropped
+        hourly_cutoff = (today - timedelta(days=self.hourly_retention_days)).isoformat()
+        conn = sqlite3.connect(self.rollups_path, timeout=30)
+        try:
+            with conn:
+                conn.execute("DELETE FROM hourly WHERE period < ?", (hourly_cutoff,))
+        finally:
+            conn.close()
+        return dropped
+
+    # --- reads ---
+
+    def series(self, key, resolution="daily", start=None, end=None, parameters=None):
+        """
+        Rollup rows for one key: [{"period", parameter: {"mean", "peak",
+        "samples"}}, ...] sorted by period. `start`/`end` are inclusive
+        periods or dates ("2025-10", "2025-10-03", "2025-10-03T14").
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+        sql = f"SELECT period, parameter, total, samples, peak FROM {resolution} WHERE key = ?"
+        args = [key]
+        if start is not None:
+            sql += " AND period >= ?"
+            args.append(str(start)[:_PERIOD_LENGTH[resolution]])
+        if end is not None:
+            # Inclusive end: anything that starts with the end prefix
+            sql += " AND period <= ?"
+            args.append(str(end) + "~")
+        if parameters:
+            sql += f" AND parameter IN ({','.join('?' * len(parameters))})"
+            args.extend(parameters)
+        sql += " ORDER BY period"
+        points = {}
+        for period, parameter, total, samples, peak in self._reader().execute(sql, args):
+            point = points.setdefault(period, {"period": period})
+            point[parameter] = {
+                "mean": round(total / samples, 1) if samples else None,
+                "peak": peak,
+                "samples": samples,
+            }
+        return list(points.values())
+
+    def daily_means(self, keys, day):
+        """{key: {parameter: mean AQI}} for one day."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        out = {}
+        conn = self._reader()
+        for lo in range(0, len(keys), 500):
+            chunk = keys[lo:lo + 500]
+            rows = conn.execute(
+                f"SELECT key, parameter, total, samples FROM daily"
+                f" WHERE period = ? AND key IN ({','.join('?' * len(chunk))})",
+                [day, *chunk],
+            )
+            for key, parameter, total, samples in rows:
+                if samples:
+                    out.setdefault(key, {})[parameter] = total / samples
+        return out
+
+    def stats(self):
+        partitions = self.partitions()
+        raw_bytes = sum(p.stat().st_size for p in self.raw_dir.glob("obs-*.sqlite")) if partitions else 0
+        counts = {}
+        if self.rollups_path.exists():
+            conn = self._reader()
+            for table in RESOLUTIONS:
+                counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return {
+            "root": str(self.root),
+            "raw_partitions": len(partitions),
+            "oldest_partition": partitions[0] if partitions else None,
+            "newest_partition": partitions[-1] if partitions else None,
+            "raw_bytes": raw_bytes,
+            "rollup_rows": counts,
+            "appended": self.appended,
+            "last_append_seconds": self.last_append_seconds,
+            "dropped_partitions": self.dropped_partitions,
+            "raw_retention_days": self.raw_retention_days,
+            "hourly_retention_days": self.hourly_retention_days,
+        }
+
+
+def trend_rows(history, day, zips, key_for_zip, columns):
+    """
+    Daily trend rows for `zips` from the daily rollups: {zip: {"date",
+    column: concentration}}, limited to the trend `columns` (e.g. the
+    pollutants historical_data.json already has).
+    """
+    keys = {z: key_for_zip(z) for z in zips}
+    means = history.daily_means(set(keys.values()), day)
+    rows = {}
+    for zip_code, key in keys.items():
+        row = {"date": day}
+        for parameter, aqi in means.get(key, {}).items():
+            spec = TREND_COLUMNS.get(parameter)
+            if spec is not None and spec[0] in columns:
+                row[spec[0]] = aqi_to_concentration(parameter, aqi)
+        if len(row) > 1:
+            rows[zip_code] = row
+    return rows
+
+
+def parse_period(value):
+    """Accepts YYYY-MM, YYYY-MM-DD or YYYY-MM-DDTHH; raises ValueError otherwise."""
+    for fmt in ("%Y-%m-%dT%H", "%Y-%m-%d", "%Y-%m"):
+        try:
+            datetime.strptime(value, fmt)
+            return value
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid period {value!r}; use YYYY-MM, YYYY-MM-DD or YYYY-MM-DDTHH.")
@@ -0,0 +1,134 @@
+import re
+
+# --- Rule-based fast path for the chatbot ---
+# Simple lookups ("what's the AQI in 90001 right now?") can be answered
+# straight from the AirNow rows. Anything that asks for advice or reasoning
+# goes to the LLM.
+#
+# The rows only describe the active ZIP right now, so a question is taken
+# only if every word is in a small lookup vocabulary. A city ("in Denver"),
+# another ZIP or another time ("was it bad yesterday?") falls through to
+# the LLM rather than being answered with the wrong readings.
+
+CURRENT_AQI = "current_aqi"
+CATEGORY = "category"
+POLLUTANT = "pollutant"
+
+# Pollutant aliases -> AirNow ParameterName
+POLLUTANT_ALIASES = {
+    "PM2.5": ("pm2.5", "pm 2.5", "pm25", "fine particulate", "fine particles"),
+    "PM10": ("pm10", "pm 10", "coarse particulate"),
+    "O3": ("o3", "ozone"),
+    "NO2": ("no2", "nitrogen dioxide"),
+    "CO": ("carbon monoxide",),
+    "SO2": ("so2", "sulfur dioxide"),
+}
+
+# Every word of a fast-path question must be one of these (after removing
+# pollutant names and the active ZIP): present-tense lookup phrasing and
+# references to "here".
+_LOOKUP_WORDS = frozenset("""
+    a an the what what's whats how how's hows is it's its are tell me give show please check
+    current currently right now today at the moment here in for of near around my our this local
+    area location neighborhood neighbourhood zip zipcode code
+    aqi air quality pollution index level levels reading readings value number category
+    good bad clean polluted like
+""".split())
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_AQI_WORDS = re.compile(r"\b(aqi|air quality|air pollution|pollution level|air index)\b")
+_CATEGORY_WORDS = re.compile(
+    r"\b(how (good|bad|clean|polluted) is the air|is the air (good|bad|clean|polluted)|category|"
+    r"how is the air)\b"
+)
+_ZIP = re.compile(r"\b\d{5}\b")
+
+# EPA's general health messages per AQI category.
+CATEGORY_MESSAGES = {
+    "Good": "Air quality is satisfactory and poses little or no risk.",
+    "Moderate": "Air quality is acceptable; unusually sensitive people should consider limiting prolonged outdoor exertion.",
+    "Unhealthy for Sensitive Groups": "Members of sensitive groups may experience health effects; the general public is less likely to be affected.",
+    "Unhealthy": "Some members of the general public may experience health effects; sensitive groups may experience more serious effects.",
+    "Very Unhealthy": "Health alert: the risk of health effects is increased for everyone.",
+    "Hazardous": "Health warning of emergency conditions: everyone is more likely to be affected.",
+}
+
+
+def find_pollutant(text):
+    for name, aliases in POLLUTANT_ALIASES.items():
+        for alias in aliases:
+            if re.search(r"(?<![a-z0-9])" + re.escape(alias) + r"(?![a-z0-9])", text):
+                return name
+    return None
+
+
+def classify_question(question, active_zip=None):
+    """
+    Returns (intent, pollutant) for simple lookup questions, or (None, None)
+    if the question should go to the LLM.
+    """
+    text = " ".join((question or "").lower().replace("\u2019", "'").split())
+    if not text:
+        return None, None
+    # A different ZIP in the question means the user is asking about
+    # another place than the data we fetched.
+    for z in _ZIP.findall(text):
+        if z != active_zip:
+            return None, None
+
+    pollutant = find_pollutant(text)
+    rest = _ZIP.sub(" ", text)
+    for alias in POLLUTANT_ALIASES.get(pollutant, ()):
+        rest = re.sub(r"(?<![a-z0-9])" + re.escape(alias) + r"(?![a-z0-9])", " ", rest)
+    if any(word not in _LOOKUP_WORDS for word in _WORD.findall(rest)):
+        return None, None
+
+    if pollutant:
+        return POLLUTANT, pollutant
+    if _CATEGORY_WORDS.search(text):
+        return CATEGORY, None
+    if _AQI_WORDS.search(text):
+        return CURRENT_AQI, None
+    return None, None
+
+
+def _worst(rows):
+    return max(rows, key=lambda r: r["AQI"] if r["AQI"] is not None else -1)
+
+
+def _place(rows, zip_code):
+    area = rows[0].get("ReportingArea")
+    return f"{area} (ZIP {zip_code})" if area else f"ZIP {zip_code}"
+
+
+def answer_from_rows(intent, rows, zip_code, pollutant=None):
+    """
+    Renders a template answer from AirNow rows. Returns None when the rows
+    can't answer the question (the caller then falls back to the LLM).
+    """
+    if not rows or intent is None:
+        return None
+    place = _place(rows, zip_code)
+
+    if intent == POLLUTANT:
+        row = next((r for r in rows if r["ParameterName"] == pollutant), None)
+        if row is None:
+            return None
+        return (
+            f"The current {pollutant} AQI in {place} is {row['AQI']}, "
+            f"which is {row['Category']}. {CATEGORY_MESSAGES.get(row['Category'], '')}"
+        ).strip()
+
+    worst = _worst(rows)
+    if intent == CATEGORY:
+        return (
+            f"Air quality in {place} is currently {worst['Category']} "
+            f"(AQI {worst['AQI']}, driven by {worst['ParameterName']}). "
+            f"{CATEGORY_MESSAGES.get(worst['Category'], '')}"
+        ).strip()
+
+    readings = "; ".join(f"{r['ParameterName']} {r['AQI']} ({r['Category']})" for r in rows)
+    return (
+        f"The current AQI in {place} is {worst['AQI']} ({worst['Category']}), "
+        f"driven by {worst['ParameterName']}. Readings: {readings}. "
+        f"{CATEGORY_MESSAGES.get(worst['Category'], '')}"
+    ).strip()
@@ -0,0 +1,142 @@
+import csv
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Live observation store ---
+# In-memory snapshot of the latest AirNow observations, indexed by ZIP and
+# pollutant. Updates merge into the snapshot; a background flusher persists
+# it atomically so readers never touch the disk.
+
+FIELDS = ("DateObserved", "ReportingArea", "StateCode", "ParameterName", "AQI", "Category")
+
+FLUSH_SECONDS = metrics.histogram("live_store_flush_duration_seconds", "Time to write the live AQI snapshot.")
+
+# Compact, immutable row representation (one tuple per ZIP/pollutant).
+Observation = namedtuple("Observation", FIELDS)
+
+
+class LiveObservationStore:
+    def __init__(self, path, flush_interval=60):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._by_zip = {}  # zip -> {ParameterName: Observation}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        self.version = 0
+        self.last_flush = None
+
+    def merge(self, zip_code, rows):
+        """Merges fresh rows for a ZIP, replacing only the pollutants they cover."""
+        if not rows:
+            return
+        observations = [Observation(*(row.get(f) for f in FIELDS)) for row in rows]
+        with self._lock:
+            by_param = dict(self._by_zip.get(zip_code, {}))
+            for obs in observations:
+                by_param[obs.ParameterName] = obs
+            self._by_zip[zip_code] = by_param
+            self._dirty = True
+            self.version += 1
+
+    def rows(self, zip_code):
+        """Returns the latest rows for a ZIP as dicts (no disk I/O)."""
+        by_param = self._by_zip.get(zip_code)
+        if not by_param:
+            return []
+        return [obs._asdict() for obs in by_param.values()]
+
+    def zip_codes(self):
+        return list(self._by_zip)
+
+    def __len__(self):
+        return sum(len(v) for v in self._by_zip.values())
+
+    def load(self):
+        """Loads a previously flushed snapshot, if one exists."""
+        try:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                if not reader.fieldnames or "ZipCode" not in reader.fieldnames:
+                    return 0
+                grouped = {}
+                for row in reader:
+                    row["AQI"] = int(row["AQI"]) if row["AQI"] else None
+                    grouped.setdefault(row["ZipCode"], []).append(row)
+        except FileNotFoundError:
+            return 0
+        for zip_code, rows in grouped.items():
+            self.merge(zip_code, rows)
+        with self._lock:
+            self._dirty = False
+        return len(grouped)
+
+    def flush(self):
+        """Writes the snapshot to a temp file and renames it over `path`."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            snapshot = [
+                (zip_code, obs)
+                for zip_code, by_param in self._by_zip.items()
+                for obs in by_param.values()
+            ]
+            self._dirty = False
+
+        start = time.perf_counter()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".live_aqi.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(("ZipCode",) + FIELDS)
+                for zip_code, obs in snapshot:
+                    writer.writerow((zip_code,) + tuple(obs))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        FLUSH_SECONDS.observe(time.perf_counter() - start)
+        self.last_flush = time.time()
+        return True
+
+    def start_flusher(self, should_flush=None):
+        """
+        Starts a daemon thread that flushes every `flush_interval` seconds.
+        `should_flush` (optional callable) can limit flushing to one worker.
+        """
+        if self._flusher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                if should_flush is not None and not should_flush():
+                    continue
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Live AQI snapshot flush failed: %s", e)
+
+        self._flusher = threading.Thread(target=loop, daemon=True, name="live-aqi-flush")
+        self._flusher.start()
+
+    def stats(self):
+        return {
+            "zips": len(self._by_zip),
+            "observations": len(self),
+            "version": self.version,
+            "dirty": self._dirty,
+            "last_flush": self.last_flush,
+        }
@@ -0,0 +1,396 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from app import metrics, upstream
+from app.metrics import track_upstream
+
+logger = logging.getLogger(__name__)
+
+# --- LLM gateway ---
+# Every Groq chat completion goes through one `LLMGateway`:
+#
+# - persistent keep-alive clients (sync and async), so calls reuse TLS
+#   connections instead of opening one per request;
+# - a global in-flight limit: each attempt holds an `upstream.groq` slot,
+#   whose adaptive limit is capped at GROQ_CONCURRENCY_MAX (the client
+#   pools are sized to match), and hedges count against it too;
+# - optional hedging (LLM_HEDGE): if an async completion hasn't answered
+#   by the model's recent p95 latency, a second identical request is sent
+#   and the first answer wins. Hedges never queue for a slot;
+# - latency-based model fallback: when the primary model's recent p95
+#   misses LLM_LATENCY_SLO, new requests use LLM_FALLBACK_MODEL for
+#   LLM_FALLBACK_COOLDOWN seconds, then the primary is tried again;
+# - token accounting: estimated prompt size per part (system prompt,
+#   build_context output, question) and Groq's reported usage per model.
+#
+# "Latency" is the time until the answer starts arriving: the whole call
+# for plain completions, the first token for streams.
+
+LLM_API_KEY = os.environ.get("GROQ_API_KEY")
+LLM_CHAT_URL = os.getenv("GROQ_CHAT_URL", "https://api.groq.com/openai/v1/chat/completions")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+# Smaller/faster model used while the primary misses its SLO; unset = no fallback.
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL") or None
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.3))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", 800))
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 3))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 20))
+LLM_LATENCY_SLO = float(os.getenv("LLM_LATENCY_SLO", 5))
+LLM_FALLBACK_COOLDOWN = float(os.getenv("LLM_FALLBACK_COOLDOWN", 120))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+# Latency samples kept per model, and how many are needed before p95 is trusted
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", 20))
+
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
+
+LLM_LATENCY = metrics.histogram(
+    "llm_latency_seconds", "Time until the LLM answer starts arriving.", ("model", "mode"),
+)
+LLM_PROMPT_TOKENS = metrics.histogram(
+    "llm_prompt_tokens_estimated", "Estimated prompt tokens per request by prompt part.", ("part",), TOKEN_BUCKETS,
+)
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Tokens reported by the LLM API.", ("model", "kind"),
+)
+LLM_HEDGES = metrics.counter("llm_hedged_requests_total", "Hedged completions by winner.", ("winner",))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English text)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+class LatencyWindow:
+    """The last `size` latency samples of one model, for p95 estimates."""
+
+    def __init__(self, size=LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q, min_samples=LLM_LATENCY_MIN_SAMPLES):
+        """The q-quantile, or None with fewer than `min_samples` samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LLMGateway:
+    def __init__(self, url=LLM_CHAT_URL, api_key=LLM_API_KEY, model=LLM_MODEL, fallback_model=LLM_FALLBACK_MODEL,
+                 latency_slo=LLM_LATENCY_SLO, fallback_cooldown=LLM_FALLBACK_COOLDOWN, hedge=LLM_HEDGE,
+                 service=upstream.groq):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.fallback_model = fallback_model
+        self.latency_slo = latency_slo
+        self.fallback_cooldown = fallback_cooldown
+        self.hedge = hedge
+        self.service = service
+        self._latency = {}        # model -> LatencyWindow
+        self._fallback_until = 0.0
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0, "errors": 0, "fallback_requests": 0, "fallback_switches": 0,
+            "hedges": 0, "hedge_wins": 0,
+            "prompt_tokens_estimated": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+    # --- Clients ---
+
+    def _timeout(self):
+        return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+    def _limits(self):
+        size = max(int(self.service.limiter.max_limit), 1)
+        return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=60)
+
+    def get_client(self):
+        """Shared keep-alive client for sync callers (threadpool, scripts)."""
+        if self._client is None or self._client.is_closed:
+            with self._client_lock:
+                if self._client is None or self._client.is_closed:
+                    self._client = httpx.Client(timeout=self._timeout(), limits=self._limits())
+        return self._client
+
+    def get_async_client(self):
+        """Shared keep-alive client for the event loop."""
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(timeout=self._timeout(), limits=self._limits())
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    # --- Prompt ---
+
+    def payload(self, system_prompt, user_question, context_text, model, stream=False):
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Context:\n{context_text}"},
+                {"role": "user", "content": user_question}
+            ],
+            "temperature": LLM_TEMPERATURE,
+            "max_tokens": LLM_MAX_TOKENS
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _account_prompt(self, system_prompt, user_question, context_text):
+        parts = {
+            "system": estimate_tokens(system_prompt),
+            "context": estimate_tokens(context_text),
+            "question": estimate_tokens(user_question),
+        }
+        for part, tokens in parts.items():
+            LLM_PROMPT_TOKENS.labels(part).observe(tokens)
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["prompt_tokens_estimated"] += sum(parts.values())
+
+    def _account_usage(self, model, usage):
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        LLM_TOKENS.labels(model, "prompt").inc(prompt)
+        LLM_TOKENS.labels(model, "completion").inc(completion)
+        with self._lock:
+            self._counters["prompt_tokens"] += prompt
+            self._counters["completion_tokens"] += completion
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    # --- Model choice ---
+
+    def _window(self, model):
+        window = self._latency.get(model)
+        if window is None:
+            window = self._latency.setdefault(model, LatencyWindow())
+        return window
+
+    def choose_model(self):
+        """The primary model, unless it recently missed the latency SLO."""
+        if self.fallback_model and time.monotonic() < self._fallback_until:
+            self._count("fallback_requests")
+            return self.fallback_model
+        return self.model
+
+    def _observe(self, model, seconds, mode):
+        LLM_LATENCY.labels(model, mode).observe(seconds)
+        window = self._window(model)
+        window.add(seconds)
+        if model != self.model or not self.fallback_model:
+            return
+        p95 = window.quantile(0.95)
+        if p95 is not None and p95 > self.latency_slo:
+            # Start the primary's next window from scratch after the cooldown
+            window.clear()
+            with self._lock:
+                self._fallback_until = time.monotonic() + self.fallback_cooldown
+                self._counters["fallback_switches"] += 1
+            logger.warning(
+                "LLM p95 %.2fs over the %ss SLO; using %s for %.0fs",
+                p95, self.latency_slo, self.fallback_model, self.fallback_cooldown,
+            )
+
+    def hedge_delay(self, model):
+        """Seconds after which an async completion is hedged, or None."""
+        if not self.hedge:
+            return None
+        p95 = self._window(model).quantile(0.95)
+        return None if p95 is None else max(p95, LLM_HEDGE_MIN_DELAY)
+
+    # --- Calls ---
+
+    @staticmethod
+    def _answer(data):
+        return data["choices"][0]["message"]["content"]
+
+    def complete(self, system_prompt, user_question, context_text, model=None):
+        """Blocking chat completion; returns the answer text."""
+        model = model or self.choose_model()
+        self._account_prompt(system_prompt, user_question, context_text)
+        payload = self.payload(system_prompt, user_question, context_text, model)
+        try:
+            with self.service.slot(), track_upstream("groq", "chat"):
+                started = time.perf_counter()
+                response = self.get_client().post(self.url, headers=self.headers(), json=payload)
+                if response.is_error:
+                    logger.error("Groq error %s: %s", response.status_code, response.text)
+                    response.raise_for_status()
+                data = response.json()
+        except Exception:
+            self._count("errors")
+            raise
+        self._observe(model, time.perf_counter() - started, "chat")
+        self._account_usage(model, data.get("usage"))
+        return self._answer(data)
+
+    async def _apost(self, payload, model, hedge=False):
+        # A hedge only goes out if a slot is free right now
+        async with self.service.aslot(max_wait=0 if hedge else None):
+            with track_upstream("groq", "chat"):
+                started = time.perf_counter()
+                response = await self.get_async_client().post(self.url, headers=self.headers(), json=payload)
+                if response.is_error:
+                    logger.error("Groq error %s: %s", response.status_code, response.text)
+                    response.raise_for_status()
+                data = response.json()
+        self._observe(model, time.perf_counter() - started, "chat")
+        self._account_usage(model, data.get("usage"))
+        return self._answer(data)
+
+    async def acomplete(self, system_prompt, user_question, context_text, model=None):
+        """Async chat completion, hedged after the model's p95 if enabled."""
+        model = model or self.choose_model()
+        self._account_prompt(system_prompt, user_question, context_text)
+        payload = self.payload(system_prompt, user_question, context_text, model)
+        try:
+            delay = self.hedge_delay(model)
+            if delay is None:
+                return await self._apost(payload, model)
+            return await self._hedged(payload, model, delay)
+        except Exception:
+            self._count("errors")
+            raise
+
+    async def _hedged(self, payload, model, delay):
+        first = asyncio.ensure_future(self._apost(payload, model))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            self._count("hedges")
+            tasks.add(asyncio.ensure_future(self._apost(payload, model, hedge=True)))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "primary" if task is first else "hedge"
+                        LLM_HEDGES.labels(winner).inc()
+                        if task is not first:
+                            self._count("hedge_wins")
+                        return task.result()
+            # Every attempt failed; report the original request's error
+            raise first.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, system_prompt, user_question, context_text, model=None):
+        """
+        Yields answer text chunks as they stream in (OpenAI-style SSE).
+        Raises if the stream ends without [DONE] or a finish_reason, so a
+        truncated answer is never taken for a complete one.
+        """
+        model = model or self.choose_model()
+        self._account_prompt(system_prompt, user_question, context_text)
+        payload = self.payload(system_prompt, user_question, context_text, model, stream=True)
+        client = self.get_async_client()
+        try:
+            # Holds a slot and is timed until the stream finishes (or the
+            # client disconnects)
+            async with self.service.aslot():
+                with track_upstream("groq", "stream"):
+                    started = time.perf_counter()
+                    first_token = True
+                    finished = False
+                    async with client.stream("POST", self.url, headers=self.headers(), json=payload) as response:
+                        if response.is_error:
+                            body = await response.aread()
+                            logger.error("Groq error %s: %s", response.status_code, body.decode(errors="replace"))
+                            response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                finished = True
+                                break
+                            chunk = json.loads(data)
+                            usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                            self._account_usage(model, usage)
+                            choices = chunk.get("choices") or []
+                            if not choices:
+                                continue
+                            finished = finished or choices[0].get("finish_reason") is not None
+                            delta = choices[0].get("delta", {}).get("content")
+                            if delta:
+                                if first_token:
+                                    self._observe(model, time.perf_counter() - started, "stream")
+                                    first_token = False
+                                yield delta
+                    if not finished:
+                        raise httpx.RemoteProtocolError("Groq stream ended before the answer finished")
+        except Exception:
+            self._count("errors")
+            raise
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        requests = counters["requests"]
+        counters["avg_prompt_tokens_estimated"] = (
+            round(counters["prompt_tokens_estimated"] / requests, 1) if requests else 0.0
+        )
+        counters["model"] = self.model
+        counters["fallback_model"] = self.fallback_model
+        counters["fallback_active"] = bool(self.fallback_model) and time.monotonic() < self._fallback_until
+        counters["latency_slo"] = self.latency_slo
+        counters["hedging"] = self.hedge
+        counters["latency"] = {
+            model: {
+                "samples": len(window),
+                "p50": window.quantile(0.5, 1),
+                "p95": window.quantile(0.95, 1),
+            }
+            for model, window in list(self._latency.items())
+        }
+        return counters
+
+
+gateway = LLMGateway()
@@ -0,0 +1,322 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import get_ident
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics ---
+# Counters and histograms rendered in the Prometheus text format at
+# GET /metrics. Every thread (the event loop, each threadpool worker)
+# writes to its own shard, so recording is a dict lookup and a couple of
+# list increments with no lock; shards are only summed when scraped.
+# Existing `stats()` dicts are exposed as gauges through collectors.
+
+# Seconds; spans a cache hit up to a slow LLM call.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+PREFIX = "cleanskies_"
+
+
+class _Sharded:
+    """Per-thread value lists; each list is only ever written by its own thread."""
+
+    def __init__(self, width):
+        self._width = width
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = [0] * self._width
+            with self._lock:  # once per thread
+                self._shards[get_ident()] = shard
+        return shard
+
+    def _totals(self):
+        with self._lock:
+            shards = list(self._shards.values())
+        return [sum(column) for column in zip(*shards)] if shards else [0] * self._width
+
+
+class _CounterValue(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def value(self):
+        return self._totals()[0]
+
+
+class _HistogramValue(_Sharded):
+    """Layout: one count per bucket, then +Inf, then the sum."""
+
+    def __init__(self, buckets):
+        super().__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value):
+        shard = self._shards.get(get_ident()) or self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """(cumulative bucket counts incl. +Inf, sum)."""
+        totals = self._totals()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child for one label combination (created once, then a dict lookup)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _items(self):
+        with self._lock:
+            items = list(self._children.items())
+        seen = set()
+        for values, child in items:
+            if id(child) not in seen:
+                seen.add(id(child))
+                yield tuple(str(v) for v in values), child
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def render(self):
+        for values, child in self._items():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value())}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def render(self):
+        bounds = [_number(b) for b in self.buckets] + ["+Inf"]
+        for values, child in self._items():
+            cumulative, total = child.snapshot()
+            for bound, count in zip(bounds, cumulative):
+                labels = _labels(self.labelnames + ("le",), values + (bound,))
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # module reloads
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, name, collect):
+        """`collect()` returns a stats dict; numeric leaves become gauges."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                logger.error("Metrics collector '%s' failed: %s", name, e)
+                continue
+            for metric_name, value in _flatten(PREFIX + _sanitize(name), stats):
+                lines.append(f"# TYPE {metric_name} gauge")
+                lines.append(f"{metric_name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def add_collector(name, collect):
+    REGISTRY.add_collector(name, collect)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def _sanitize(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", str(name)).strip("_").lower()
+
+
+def _flatten(prefix, value, depth=2):
+    """Numeric leaves of a stats dict, two levels deep (deeper is per-key detail)."""
+    if isinstance(value, bool):
+        yield prefix, int(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, value
+    elif isinstance(value, dict) and depth > 0:
+        for key, item in value.items():
+            yield from _flatten(f"{prefix}_{_sanitize(key)}", item, depth - 1)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(round(value, 9))
+    return str(value)
+
+
+# --- Shared metrics ---
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"),
+)
+HTTP_RESPONSE_BYTES = histogram(
+    "http_response_size_bytes", "HTTP response body size by route.", ("method", "route"), SIZE_BUCKETS,
+)
+UPSTREAM_REQUESTS = counter(
+    "upstream_requests_total", "Calls to external APIs by outcome.", ("service", "operation", "outcome"),
+)
+UPSTREAM_SECONDS = histogram(
+    "upstream_request_duration_seconds", "External API call latency.", ("service", "operation"),
+)
+
+
+@contextmanager
+def track_upstream(service, operation):
+    """Counts and times one upstream call; works in sync and async code."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_SECONDS.labels(service, operation).observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(service, operation, outcome).inc()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and response size per route
+    template (e.g. /api/data/trends/{zipcode}), so ZIPs don't explode the
+    label set. Unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_SECONDS.labels(method, path, status).observe(time.perf_counter() - start)
+            HTTP_RESPONSE_BYTES.labels(method, path).observe(size)
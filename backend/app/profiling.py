@@ -0,0 +1,278 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from threading import get_ident
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# --- On-demand sampling profiler ---
+# A background thread snapshots Python stacks (sys._current_frames) every
+# few milliseconds and counts them in collapsed "a;b;c count" form, which
+# flamegraph.pl and speedscope read directly. It profiles either one
+# request (admin token in the X-Profile header / ?profile= query, or a
+# random PROFILE_SAMPLE_RATE fraction of requests) or a time window of the
+# whole worker (POST /debug/profile). With neither configured the
+# middleware and routes aren't installed at all.
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000.0
+PROFILE_MAX_WINDOW_SECONDS = float(os.getenv("PROFILE_MAX_WINDOW_SECONDS", 60))
+# Oldest profiles are deleted beyond this many files.
+PROFILE_KEEP_FILES = int(os.getenv("PROFILE_KEEP_FILES", 200))
+
+PROFILE_SUFFIX = ".folded"
+_NAME_PATTERN = re.compile(r"^[\w.-]+\.folded$")
+# Frames from files under this directory count as application code
+APP_ROOT = str(Path(__file__).resolve().parents[1])
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+
+def enabled():
+    return bool(PROFILING_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def token_matches(candidate):
+    return bool(PROFILING_TOKEN) and bool(candidate) and hmac.compare_digest(candidate, PROFILING_TOKEN)
+
+
+_labels = {}
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(APP_ROOT):
+            path = os.path.relpath(path, APP_ROOT)
+        elif "site-packages" in path:
+            path = path.split("site-packages" + os.sep, 1)[1]
+        elif path.startswith(_STDLIB):
+            path = os.path.relpath(path, _STDLIB)
+        label = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+def _is_app_frame(frame):
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_ROOT) and "site-packages" not in filename:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class StackSampler:
+    """
+    Samples stacks every `interval` seconds until stopped.
+
+    `threads`: thread ids to always sample (None = every thread). With
+    `app_threads=True`, other threads are sampled too while they are inside
+    application code, which catches sync endpoints running in the threadpool.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_SECONDS, threads=None, app_threads=False):
+        self.interval = interval
+        self.threads = threads
+        self.app_threads = app_threads
+        self.samples = Counter()
+        self.ticks = 0
+        self.started_at = None
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if self.threads is not None and ident not in self.threads:
+                if not (self.app_threads and _is_app_frame(frame)):
+                    continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(f"thread {names.get(ident, ident)}")
+            stack.reverse()
+            self.samples[";".join(stack)] += 1
+        self.ticks += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._start
+        return self
+
+    def run_for(self, seconds):
+        """Blocking: samples for `seconds` and returns self."""
+        self.start()
+        time.sleep(seconds)
+        return self.stop()
+
+
+def top_frames(samples, limit=20):
+    """Hottest frames by self time (leaf) and by total time (anywhere on the stack)."""
+    own, inclusive = Counter(), Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")[1:]  # drop the thread root
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    total = sum(samples.values()) or 1
+
+    def rows(counter):
+        return [
+            {"frame": frame, "samples": count, "percent": round(count * 100.0 / total, 1)}
+            for frame, count in counter.most_common(limit)
+        ]
+
+    return {"samples": sum(samples.values()), "self": rows(own), "total": rows(inclusive)}
+
+
+def _slug(text):
+    return re.sub(r"[^\w.-]+", "_", text).strip("_")[:80] or "root"
+
+
+def new_profile_name(label):
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    return f"{stamp}-{os.getpid()}-{_slug(label)}-{random.randrange(16 ** 4):04x}{PROFILE_SUFFIX}"
+
+
+def save_profile(name, samples):
+    """Writes collapsed stacks to PROFILE_DIR/name and prunes old files."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / name
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp, path)
+    profiles = sorted(PROFILE_DIR.glob("*" + PROFILE_SUFFIX), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:-PROFILE_KEEP_FILES]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def profile_path(name):
+    """Path of a stored profile, or None for unknown or malformed names."""
+    if not _NAME_PATTERN.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+def load_profile(path):
+    samples = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                samples[stack] += int(count)
+    return samples
+
+
+def list_profiles():
+    if not PROFILE_DIR.is_dir():
+        return []
+    profiles = sorted(PROFILE_DIR.glob("*" + PROFILE_SUFFIX), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [
+        {"name": p.name, "bytes": p.stat().st_size, "modified": round(p.stat().st_mtime, 3)}
+        for p in profiles
+    ]
+
+
+_window_lock = threading.Lock()
+
+
+def profile_window(seconds):
+    """Profiles every thread of this worker for `seconds`; blocking."""
+    seconds = max(0.1, min(float(seconds), PROFILE_MAX_WINDOW_SECONDS))
+    if not _window_lock.acquire(blocking=False):
+        raise RuntimeError("A profiling window is already running in this worker.")
+    try:
+        sampler = StackSampler().run_for(seconds)
+    finally:
+        _window_lock.release()
+    name = new_profile_name("window")
+    save_profile(name, sampler.samples)
+    return name, sampler
+
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests: those carrying the admin token (X-Profile
+    header or ?profile= query) and a random PROFILE_SAMPLE_RATE fraction.
+    Randomly sampled requests are skipped while another profile is running.
+    The stored profile's name is returned in the X-Profile response header.
+    """
+
+    def __init__(self, app, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self._active = 0
+
+    def _requested(self, scope):
+        for name, value in scope.get("headers", ()):
+            if name == b"x-profile":
+                return token_matches(value.decode("latin-1"))
+        if b"profile=" in scope.get("query_string", b""):
+            query = parse_qs(scope["query_string"].decode("latin-1"))
+            return token_matches((query.get("profile") or [""])[0])
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if not self._requested(scope):
+            if not (self.sample_rate > 0 and self._active == 0 and random.random() < self.sample_rate):
+                return await self.app(scope, receive, send)
+
+        label = f"{scope.get('method', '')}_{scope.get('path', '')}"
+        name = new_profile_name(label)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", ())) + [(b"x-profile", name.encode())]
+            await send(message)
+
+        # The event loop thread, plus threadpool threads running our code
+        sampler = StackSampler(threads={get_ident()}, app_threads=True).start()
+        self._active += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._active -= 1
+            sampler.stop()
+            try:
+                await asyncio.to_thread(save_profile, name, sampler.samples)
+            except Exception as e:
+                logger.error("Saving profile %s failed: %s", name, e)
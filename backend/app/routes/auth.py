@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas, core, db
 
 router = APIRouter(
@@ -10,7 +11,7 @@ router = APIRouter(
 
 # --- Registration Endpoint ---
 @router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
-def register_user(user_create: schemas.UserCreate, database: Session = Depends(db.get_db)):
+async def register_user(user_create: schemas.UserCreate, database: AsyncSession = Depends(db.get_async_db)):
     """
     Handles user registration.
     1. Checks if a user with the same username or email already exists.
@@ -18,17 +19,20 @@ def register_user(user_create: schemas.UserCreate, database: Session = Depends(d
     3. Creates a new user record in the database.
     """
     # Check for existing user
-    db_user = database.query(models.User).filter(
-        (models.User.email == user_create.email) | (models.User.username == user_create.username)
-    ).first()
+    result = await database.execute(
+        select(models.User).where(
+            (models.User.email == user_create.email) | (models.User.username == user_create.username)
+        )
+    )
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email or username already registered"
         )
 
-    # Hash the password
-    hashed_password = core.get_password_hash(user_create.password)
+    # Hash the password (in the bounded bcrypt pool)
+    hashed_password = await core.get_password_hash_async(user_create.password)
     
     # Create new user instance
     new_user = models.User(
@@ -39,25 +43,26 @@ def register_user(user_create: schemas.UserCreate, database: Session = Depends(d
 
     # Add to database
     database.add(new_user)
-    database.commit()
-    database.refresh(new_user)
+    await database.commit()
+    await database.refresh(new_user)
 
     return new_user
 
 
 # --- Login Endpoint ---
 @router.post("/login", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), database: Session = Depends(db.get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), database: AsyncSession = Depends(db.get_async_db)):
     """
     Handles user login.
     1. Finds the user by username.
     2. Verifies the provided password against the stored hash.
     3. Creates and returns a JWT access token if credentials are valid.
     """
-    user = database.query(models.User).filter(models.User.username == form_data.username).first()
+    result = await database.execute(select(models.User).where(models.User.username == form_data.username))
+    user = result.scalars().first()
 
-    # Check if user exists and password is correct
-    if not user or not core.verify_password(form_data.password, user.hashed_password):
+    # Check if user exists and password is correct (in the bounded bcrypt pool)
+    if not user or not await core.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -1,6 +1,19 @@
-from fastapi import APIRouter, HTTPException
+import json
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from app.schemas import ChatQuery, ChatResponse # Assuming your schemas are here
-from chatbotbackend import handle_user_question # Import your core logic
+import chatbotbackend
+from app import llm, upstream
+from app.core import require_admin_token
+from chatbotbackend import (  # Import your core logic
+    handle_user_question_async,
+    stream_user_question,
+    answer_cache_stats,
+    answer_path_summary,
+    live_aqi_cache,
+    live_store,
+)
 
 # Initialize the router
 router = APIRouter(
@@ -15,25 +28,21 @@ async def ask_chatbot(query: ChatQuery):
     and returns a generated air quality response.
     """
     try:
-        # Note: handle_user_question only returns 'answer' in your provided code,
-        # so we'll modify it slightly or make an assumption.
-        # For now, let's assume we can get the active_zip from the query or a placeholder.
-        
-        # Determine the active ZIP code (replicate logic from handle_user_question for clarity)
-        active_zip = query.zip_code or "94103" # Fallback, should ideally be determined within the handler
-
-        answer = handle_user_question(
-            user_id="web_user", # Placeholder user_id since it's not used in your logic
+        # Every upstream call on this path is async, so a slow AirNow or
+        # Groq response no longer blocks the event loop for other requests.
+        status = {}
+        answer, active_zip = await handle_user_question_async(
             question=query.question,
             zip_code=query.zip_code,
             health_issue=query.health_issue,
             activity=query.activity,
-            user_profile={"zip_code": active_zip} # Pass active_zip as a default if needed
+            status=status,
         )
 
         return ChatResponse(
             answer=answer,
-            active_zip=active_zip # This is a simplification; a better approach is in the notes below
+            active_zip=active_zip,
+            **status,
         )
 
     except Exception as e:
@@ -44,6 +53,69 @@ async def ask_chatbot(query: ChatQuery):
             detail=f"An error occurred while processing the request: {e}"
         )
 
-# NOTE: The handle_user_question function in chatbotbackend.py needs a minor
-# modification to return the 'active_zip' it used, for a perfect API response.
-# Currently, it only returns 'answer'.
\ No newline at end of file
+
+def _sse(data, event=None):
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
+
+
+@router.post("/stream")
+async def ask_chatbot_stream(query: ChatQuery):
+    """
+    Same as POST /chat/ but streams the answer as Server-Sent Events.
+    Each `data:` event carries {"token": "..."}; a final `done` event
+    carries {"active_zip": "...", "stale": ..., "data_age_seconds": ...}
+    plus "degraded" if the answer fell back to the rules.
+    """
+    status = {}
+    try:
+        active_zip, chunks = await stream_user_question(
+            question=query.question,
+            zip_code=query.zip_code,
+            health_issue=query.health_issue,
+            activity=query.activity,
+            status=status,
+        )
+    except Exception as e:
+        print(f"Chatbot processing error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"An error occurred while processing the request: {e}"
+        )
+
+    async def events():
+        async for chunk in chunks:
+            yield _sse({"token": chunk})
+        yield _sse({"active_zip": active_zip, **status}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats", dependencies=[Depends(require_admin_token)])
+def chatbot_stats():
+    """
+    Returns live AQI cache counters (hits, misses, stale serves, coalesced calls),
+    the state of the live observation store, LLM answer cache hit ratio /
+    upstream time saved, fast-path vs LLM answer counts and latency, and
+    the AirNow/Groq quota, concurrency limit and circuit breaker state, and
+    LLM gateway latency, model fallback, hedging and token usage.
+    """
+    return {
+        "live_aqi_cache": live_aqi_cache.stats(),
+        "live_store": live_store.stats(),
+        "answer_cache": answer_cache_stats(),
+        "answer_paths": answer_path_summary(),
+        "zip_resolver": chatbotbackend.zip_resolver.stats(),
+        "tempo": chatbotbackend.get_tempo_store().stats(),
+        "alerts": chatbotbackend._alert_engine.stats() if chatbotbackend._alert_engine else None,
+        "history": chatbotbackend._history_store.stats() if chatbotbackend._history_store else None,
+        "scheduler": chatbotbackend.scheduler.stats() if chatbotbackend.scheduler else None,
+        "upstream": upstream.stats(),
+        "llm": llm.gateway.stats(),
+    }
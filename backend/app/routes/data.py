@@ -1,40 +1,266 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app import models, schemas, core
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from app import schemas, core
+from app.cache import LRUCache
+from app.historical_loader import HISTORICAL_COMPACT_DIR, HISTORICAL_UPDATES_PATH, HistoricalDataLoader
 from pathlib import Path
-from functools import lru_cache
+from datetime import date
+from typing import Optional, Literal
+import gzip
+import hashlib
 import json
+import os
 
 router = APIRouter(prefix="/api/data", tags=["Data"])
 
 # data.py is in backend/app/routes/
 # We want backend/historical_data.json  -> two levels up from routes/ then join
 DATA_PATH = Path(__file__).resolve().parents[2] / "historical_data.json"
+# Optional directory of pre-built .npy arrays (see TrendsStore.save); when
+# present it is memory-mapped instead of parsing the JSON.
+NPY_DIR = os.getenv("HISTORICAL_DATA_NPY_DIR")
+# Append-only JSON lines ({"zip", "date", pollutant values...}) applied
+# incrementally on top of the main file, and compacted into
+# HISTORICAL_DATA_DIR/compacted on reload.
+UPDATES_PATH = HISTORICAL_UPDATES_PATH
+
+historical_loader = HistoricalDataLoader(
+    DATA_PATH,
+    npy_dir=NPY_DIR,
+    updates_path=UPDATES_PATH,
+    compact_dir=HISTORICAL_COMPACT_DIR,
+    check_interval=int(os.getenv("HISTORICAL_DATA_CHECK_SECONDS", 30)),
+)
 
-@lru_cache(maxsize=1)
 def load_historical_data():
+    """Returns the current TrendsStore; changes on disk are picked up in the background."""
+    return historical_loader.get()
+
+def warm_forecast():
+    """Loads the data and computes the batch forecast (startup background step)."""
+    from app.forecast import forecast_engine
+    forecast_engine.get(load_historical_data())
+
+# --- Pre-encoded trend payloads ---
+# The default per-ZIP payload only changes when the data reloads, so it is
+# serialized and gzipped once and then served as bytes with a strong ETag.
+
+ENCODED_CACHE_MAX_ENTRIES = int(os.getenv("TRENDS_ENCODED_CACHE_MAX_ENTRIES", 4096))
+MAX_BATCH_ZIPS = 200
+
+_encoded_trends = LRUCache(maxsize=ENCODED_CACHE_MAX_ENTRIES)
+_encoded_batches = LRUCache(maxsize=256)  # batch etag -> (json_bytes, gzip_bytes)
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def _encode(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return body, gzip.compress(body, compresslevel=6), _etag(body)
+
+def encoded_trends(data, zipcode):
+    """Returns (json_bytes, gzip_bytes, etag) for a ZIP's default payload."""
+    entry = _encoded_trends.get(zipcode)
+    # Entries are keyed by the store generation (new on every reload and
+    # append), so they invalidate without a flush and don't pin old stores.
+    if entry is None or entry[0] != data.generation:
+        entry = (data.generation,) + _encode(data.legacy_trends(zipcode))
+        _encoded_trends.set(zipcode, entry)
+    return entry[1:]
+
+def _not_modified(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates or etag[:-1] + '-gzip"' in candidates
+
+def _bytes_response(request, body, gzipped, etag):
+    """Serves pre-encoded JSON, honoring If-None-Match and Accept-Encoding."""
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        # Distinct validator per representation; either one matches above.
+        headers["ETag"] = etag[:-1] + '-gzip"'
+        return Response(content=gzipped, media_type="application/json", headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/status", dependencies=[Depends(core.require_admin_token)])
+def get_data_status():
+    """
+    Reports the loaded historical data version, load duration and memory footprint.
+    """
+    load_historical_data()
+    return historical_loader.stats()
+
+@router.get("/forecast/{zipcode}", response_model=schemas.ForecastResponse)
+def get_forecast_by_zipcode(
+    zipcode: str,
+    horizon: Optional[int] = Query(None, ge=1, description="Days ahead (default: all forecast days)."),
+    current_user: schemas.User = Depends(core.get_current_user),
+):
+    """
+    Daily pollutant forecast for a ZIP from the batch model over the
+    historical series. Recomputed for all ZIPs only when the data changes.
+    Days already past are left out; `stale` is set when the data ends too
+    long ago to forecast today or later (`points` is then empty).
+    """
+    from app.forecast import forecast_engine
+
+    data = load_historical_data()
+    if zipcode not in data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No historical data found for zip code {zipcode}."
+        )
+    forecast = forecast_engine.get(data)
+    if forecast.issued is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not enough historical data to forecast."
+        )
+    points = forecast.points(zipcode, horizon)
+    return {
+        "locationName": forecast.location_names[forecast.zip_index[zipcode]],
+        "zipcode": zipcode,
+        "issued": str(forecast.issued),
+        "horizonDays": len(points),
+        "stale": forecast.is_stale(),
+        "points": points,
+        "models": forecast.models,
+    }
+
+@router.get("/history/{zipcode}", response_model=schemas.HistoryResponse)
+def get_history_by_zipcode(
+    zipcode: str,
+    resolution: Literal["hourly", "daily", "monthly"] = Query("daily"),
+    start: Optional[str] = Query(None, description="First period (YYYY-MM, YYYY-MM-DD or YYYY-MM-DDTHH)."),
+    end: Optional[str] = Query(None, description="Last period, inclusive."),
+    current_user: schemas.User = Depends(core.get_current_user),
+):
+    """
+    Observed AQI (mean, peak, sample count per parameter) for the ZIP's
+    reporting area, read from the precomputed history rollups.
+    """
+    import chatbotbackend
+    from app.history import parse_period
+
     try:
-        with DATA_PATH.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        start = parse_period(start) if start else None
+        end = parse_period(end) if end else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    key = chatbotbackend.live_aqi_key(zipcode)
+    points = chatbotbackend.get_history_store().series(key, resolution, start, end)
+    if not points and start is None and end is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No observation history for zip code {zipcode}."
+        )
+    return {
+        "zipcode": zipcode,
+        "key": key,
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "points": points,
+    }
+
+@router.get("/trends")
+def get_trends_batch(
+    request: Request,
+    zips: list[str] = Query(..., description="ZIP codes, repeated (?zips=a&zips=b) or comma-separated."),
+    current_user: schemas.User = Depends(core.get_current_user),
+):
+    """
+    Returns the default weekly/monthly trends for several ZIPs at once:
+    {"trends": {zip: {...}}, "missing": [...]}.
+    """
+    requested = list(dict.fromkeys(z.strip() for item in zips for z in item.split(",") if z.strip()))
+    if len(requested) > MAX_BATCH_ZIPS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_ZIPS} ZIP codes per request."
+        )
 
-@router.get("/trends/{zipcode}", response_model=schemas.TrendsResponse)
+    data = load_historical_data()
+    encoded, missing = [], []
+    for zipcode in requested:
+        if zipcode not in data:
+            missing.append(zipcode)
+            continue
+        encoded.append((zipcode, encoded_trends(data, zipcode)))
+
+    etag = _etag(json.dumps([requested, [e[1][2] for e in encoded]]).encode("utf-8"))
+    if _not_modified(request, etag):
+        return _bytes_response(request, b"", b"", etag)
+
+    cached = _encoded_batches.get(etag)
+    if cached is None:
+        # Stitch the cached per-ZIP bytes together instead of re-serializing.
+        parts = [json.dumps(z).encode("utf-8") + b":" + e[0] for z, e in encoded]
+        body = (
+            b'{"trends":{' + b",".join(parts) + b'},"missing":'
+            + json.dumps(missing).encode("utf-8") + b"}"
+        )
+        cached = (body, gzip.compress(body, compresslevel=6))
+        _encoded_batches.set(etag, cached)
+    return _bytes_response(request, *cached, etag)
+
+@router.get("/trends/{zipcode}", response_model=schemas.TrendsResponse | schemas.TrendSeriesResponse)
 def get_trends_by_zipcode(
+    request: Request,
     zipcode: str,
-    current_user: models.User = Depends(core.get_current_user),
+    start: Optional[date] = Query(None, description="First day to include (YYYY-MM-DD)."),
+    end: Optional[date] = Query(None, description="Last day to include (YYYY-MM-DD)."),
+    resample: Optional[Literal["daily", "weekly", "monthly"]] = Query(None, description="daily, weekly or monthly."),
+    stat: Optional[str] = Query(
+        None, description="Aggregate per weekly/monthly period: mean (default), max, min, median or pNN (e.g. p95)."
+    ),
+    rolling: Optional[int] = Query(None, ge=2, le=365, description="Rolling-mean window in points."),
+    current_user: schemas.User = Depends(core.get_current_user),
 ):
     data = load_historical_data()
-    if not data:
+    if not len(data):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Historical data file not found on server at {DATA_PATH}."
         )
 
-    zipcode_data = data.get(zipcode)
-    if not zipcode_data:
+    if zipcode not in data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No historical data found for zip code {zipcode}."
         )
 
-    return zipcode_data
+    # Without query parameters keep the original weekly/monthly payload,
+    # served from the pre-encoded cache.
+    if start is None and end is None and resample is None and rolling is None and stat is None:
+        return _bytes_response(request, *encoded_trends(data, zipcode))
+
+    # Daily points are already one value per period; don't silently drop it
+    if stat is not None and resample in (None, "daily"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="stat aggregates per period; use it with resample=weekly or resample=monthly.",
+        )
+    stat = stat or "mean"
+
+    try:
+        points = data.query(zipcode, start, end, resample or "daily", stat, rolling)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    return {
+        "locationName": data.location_names[data.zip_index[zipcode]],
+        "zipcode": zipcode,
+        "start": start,
+        "end": end,
+        "resample": resample or "daily",
+        "stat": stat,
+        "rolling": rolling,
+        "points": points,
+    }
@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app import profiling
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["Debug"],
+    include_in_schema=False,
+)
+
+
+def require_profiling_token(x_profile_token: str = Header(None)):
+    """Admin-only: the X-Profile-Token header must match PROFILING_TOKEN."""
+    if not profiling.token_matches(x_profile_token):
+        # Don't reveal that the endpoint exists
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+@router.post("/profile", dependencies=[Depends(require_profiling_token)])
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0, description="Window length (capped by PROFILE_MAX_WINDOW_SECONDS)."),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Samples every thread of the worker that serves this request for a time
+    window, stores the collapsed stacks and returns the hottest frames.
+    """
+    try:
+        name, sampler = await asyncio.to_thread(profiling.profile_window, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {
+        "name": name,
+        "seconds": round(sampler.seconds, 3),
+        "ticks": sampler.ticks,
+        **profiling.top_frames(sampler.samples, limit),
+    }
+
+
+@router.get("/profiles", dependencies=[Depends(require_profiling_token)])
+def list_profiles():
+    """Stored profiles on this worker's disk, newest first."""
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/{name}", dependencies=[Depends(require_profiling_token)])
+def get_profile(
+    name: str,
+    format: str = Query("top", pattern="^(top|folded)$", description="top frames, or raw collapsed stacks."),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Top frames of a stored profile, or its collapsed stacks for flamegraph.pl / speedscope."""
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {name} not found.")
+    if format == "folded":
+        return PlainTextResponse(path.read_text(encoding="utf-8"))
+    return {"name": name, **profiling.top_frames(profiling.load_profile(path), limit)}
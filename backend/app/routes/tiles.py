@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import Literal
+import os
+import threading
+import chatbotbackend
+from app.core import require_admin_token
+
+router = APIRouter(prefix="/api/tiles", tags=["Tiles"])
+
+# Byte budget for rendered tiles, per layer
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Zooms up to this are rendered after every refresh; deeper ones on demand
+TILE_PRECOMPUTE_ZOOM = int(os.getenv("TILE_PRECOMPUTE_ZOOM", 4))
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", 12))
+# Radius (km) each station colours around itself
+TILE_RADIUS_KM = float(os.getenv("TILE_RADIUS_KM", 60))
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+# --- Point sources ---
+
+def live_points():
+    """(version, [(lat, lon, aqi)]) for every live AQI key with a known location."""
+    store = chatbotbackend.live_store
+    resolver = chatbotbackend.zip_resolver
+    points = []
+    for key in store.zip_codes():
+        if chatbotbackend.is_area_key(key):
+            area = resolver.index.get(key)
+            point = (area.lat, area.lon) if area else None
+        else:
+            point = resolver.centroid(key)
+        values = [r["AQI"] for r in store.rows(key) if r.get("AQI") is not None]
+        if point and values:
+            points.append((point[0], point[1], max(values)))
+    return (store.version, resolver.index.version), points
+
+def forecast_points():
+    """PM2.5 forecast as AQI at each ZIP centroid for the first day not yet past."""
+    from app.forecast import forecast_engine, pm25_aqi
+    from app.routes.data import historical_loader
+
+    store = historical_loader.peek()
+    forecast = forecast_engine.get_nowait(store) if store is not None else None
+    if forecast is None or forecast.is_stale() or "pm25" not in forecast.values:
+        return None, []
+    # The first day that isn't past yet (days before today are dropped)
+    day = forecast.upcoming()
+    aqi = pm25_aqi(forecast.values["pm25"][:, day])
+    points = []
+    for zip_code, idx in forecast.zip_index.items():
+        point = chatbotbackend.zip_resolver.centroid(zip_code)
+        if point is not None and aqi[idx] == aqi[idx]:
+            points.append((point[0], point[1], float(aqi[idx])))
+    return (forecast_engine.runs, str(forecast.dates[day])), points
+
+LAYERS = {"live": live_points, "forecast": forecast_points}
+
+def get_renderer(layer):
+    renderer = _renderers.get(layer)
+    if renderer is None:
+        # Imported here so NumPy isn't loaded at app import (cold start).
+        from app.tiles import TileRenderer
+        with _renderers_lock:
+            renderer = _renderers.get(layer)
+            if renderer is None:
+                renderer = TileRenderer(
+                    layer, LAYERS[layer],
+                    cache_bytes=TILE_CACHE_MAX_BYTES,
+                    precompute_zoom=TILE_PRECOMPUTE_ZOOM,
+                    max_zoom=TILE_MAX_ZOOM,
+                    radius_km=TILE_RADIUS_KM,
+                )
+                _renderers[layer] = renderer
+    return renderer
+
+def precompute_tiles(_summary=None):
+    """Re-renders low-zoom tiles for every layer (runs after each refresh)."""
+    for layer in LAYERS:
+        get_renderer(layer).precompute_in_background()
+
+chatbotbackend.refresh_listeners.append(precompute_tiles)
+
+# --- Endpoints ---
+
+@router.get("/stats", dependencies=[Depends(require_admin_token)])
+def tile_stats():
+    """Grid build time, per-zoom render times and tile cache hit ratios."""
+    return {layer: renderer.stats() for layer, renderer in _renderers.items()}
+
+@router.get("/{z}/{x}/{y}.png")
+def get_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    layer: Literal["live", "forecast"] = Query("live", description="live AQI or next-day PM2.5 forecast"),
+):
+    """AQI heatmap tile (Web Mercator, 256 px, transparent where there's no data)."""
+    try:
+        png, etag = get_renderer(layer).get(z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas, core, db
 
 router = APIRouter(
@@ -9,7 +9,7 @@ router = APIRouter(
 
 @router.get("/me", response_model=schemas.User)
 def get_current_user_profile(
-    current_user: models.User = Depends(core.get_current_user)
+    current_user: schemas.User = Depends(core.get_current_user)
 ):
     """
     Fetches the profile of the currently authenticated user.
@@ -18,24 +18,32 @@ def get_current_user_profile(
 
 
 @router.put("/me", response_model=schemas.User)
-def update_current_user_profile(
+async def update_current_user_profile(
     user_updates: schemas.UserUpdate,
-    db_session: Session = Depends(db.get_db),
-    current_user: models.User = Depends(core.get_current_user)
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: schemas.User = Depends(core.get_current_user)
 ):
     """
     Updates the profile of the currently authenticated user.
     """
+    # current_user is a cached snapshot; load the row to modify it
+    db_user = await db_session.get(models.User, current_user.id)
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
     # Get the update data, excluding any unset fields
     update_data = user_updates.model_dump(exclude_unset=True)
 
     # Update the user object with the new data
     for key, value in update_data.items():
-        setattr(current_user, key, value)
+        setattr(db_user, key, value)
 
     # Commit the changes to the database
-    db_session.add(current_user)
-    db_session.commit()
-    db_session.refresh(current_user)
+    db_session.add(db_user)
+    await db_session.commit()
+    await db_session.refresh(db_user)
 
-    return current_user
+    # Cached snapshots for this user are now out of date
+    core.invalidate_user(db_user.id)
+
+    return db_user
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: every process acts as leader
+    fcntl = None
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Single-leader refresh scheduler ---
+# With N uvicorn workers each process imports the app, but only the process
+# holding an exclusive file lock runs the AirNow refresh. The OS drops the
+# lock when that process dies, and another worker takes over on its next
+# poll. The leader publishes results to a SQLite file that every worker
+# reads from, so adding workers doesn't multiply upstream calls.
+
+
+class LeaderLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None and self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+
+class SharedSnapshot:
+    """
+    SQLite-backed store of the latest rows per key, shared by all workers
+    on the machine. Each write bumps a sequence number so readers only pull
+    what changed since their last sync.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS live_aqi ("
+                " key TEXT PRIMARY KEY, rows TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL, seq INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS live_aqi_seq ON live_aqi (seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS watched (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+            # Alert hysteresis/cooldown per user (see AlertEngine), so a new
+            # leader doesn't re-alert everyone already above threshold
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alert_state ("
+                " user_id INTEGER PRIMARY KEY, active INTEGER NOT NULL, last_alert REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def publish(self, rows_by_key, fetched_at=None):
+        fetched_at = fetched_at or time.time()
+        items = [(k, json.dumps(rows)) for k, rows in rows_by_key.items() if rows]
+        if not items:
+            return 0
+        with self._connect() as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM live_aqi").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO live_aqi (key, rows, fetched_at, seq) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET rows=excluded.rows,"
+                " fetched_at=excluded.fetched_at, seq=excluded.seq",
+                [(k, rows, fetched_at, seq) for k, rows in items],
+            )
+        return len(items)
+
+    def changes_since(self, seq):
+        """Returns (max_seq, [(key, rows, fetched_at), ...]) newer than `seq`."""
+        cur = self._connect().execute(
+            "SELECT key, rows, fetched_at, seq FROM live_aqi WHERE seq > ? ORDER BY seq", (seq,)
+        )
+        changes, max_seq = [], seq
+        for key, rows, fetched_at, row_seq in cur:
+            changes.append((key, json.loads(rows), fetched_at))
+            max_seq = max(max_seq, row_seq)
+        return max_seq, changes
+
+    def watch(self, keys):
+        """Registers keys a worker is serving so the leader refreshes them too."""
+        if not keys:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO watched (key, seen_at) VALUES (?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET seen_at=excluded.seen_at",
+                [(k, now) for k in keys],
+            )
+
+    def watched(self, max_age):
+        cur = self._connect().execute("SELECT key FROM watched WHERE seen_at >= ?", (time.time() - max_age,))
+        return [row[0] for row in cur]
+
+    def load_alert_state(self):
+        """Returns {user_id: (active pollutant bitmask, last alert wall time)}."""
+        cur = self._connect().execute("SELECT user_id, active, last_alert FROM alert_state")
+        return {user_id: (active, last_alert) for user_id, active, last_alert in cur}
+
+    def save_alert_state(self, rows):
+        """Upserts (user_id, active bitmask, last_alert) rows."""
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO alert_state (user_id, active, last_alert) VALUES (?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET active=excluded.active,"
+                " last_alert=excluded.last_alert",
+                rows,
+            )
+
+    def get_meta(self, name, default=None):
+        row = self._connect().execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, name, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO meta (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+                (name, value),
+            )
+
+
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+JOB_SECONDS = metrics.histogram(
+    "scheduler_job_duration_seconds", "Duration of scheduled refresh runs.", ("job",), JOB_BUCKETS,
+)
+JOB_RUNS = metrics.counter("scheduler_job_runs_total", "Scheduled refresh runs by outcome.", ("job", "outcome"))
+SYNC_SECONDS = metrics.histogram(
+    "scheduler_sync_duration_seconds", "Time to apply the leader's shared results in a worker.", ("job",),
+)
+
+
+class LeaderScheduler:
+    """
+    Every `poll_seconds` each worker:
+    - tries to become leader (non-blocking lock);
+    - if leader and the last successful refresh (recorded in the shared
+      store, so it survives failover) is older than `interval_seconds`,
+      runs `job`. A job that raises doesn't count as a refresh: it is
+      retried after `retry_seconds`, and followers don't treat the
+      failed run as fresh data;
+    - pulls any new shared results through `on_update(key, rows, fetched_at)`
+      and registers the keys it serves (`watch_keys()`) for the leader.
+      A follower that applied changes then calls `on_synced(count)`, so
+      work the leader does after its refresh can be redone from the
+      synced data.
+    """
+
+    def __init__(self, lock, shared, job, on_update, interval_seconds, poll_seconds=30,
+                 initial_delay=0, watch_keys=None, name="aqi_refresh", retry_seconds=300,
+                 on_synced=None):
+        self.name = name
+        self.lock = lock
+        self.shared = shared
+        self.job = job
+        self.on_update = on_update
+        self.interval_seconds = interval_seconds
+        self.poll_seconds = poll_seconds
+        self.retry_seconds = retry_seconds
+        self.initial_delay = initial_delay
+        self.watch_keys = watch_keys
+        self.on_synced = on_synced
+        self._seq = 0
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+        self.last_run_seconds = None
+        self.last_error = None
+
+    @property
+    def is_leader(self):
+        return self.lock.held
+
+    def sync(self):
+        start = time.perf_counter()
+        self._seq, changes = self.shared.changes_since(self._seq)
+        for key, rows, fetched_at in changes:
+            self.on_update(key, rows, fetched_at)
+        SYNC_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+        # The leader's own published rows come back here too; it already
+        # ran its post-refresh work in the job
+        if changes and self.on_synced is not None and not self.is_leader:
+            self.on_synced(len(changes))
+        return len(changes)
+
+    def tick(self):
+        if self.watch_keys is not None:
+            self.shared.watch(self.watch_keys())
+        if self.lock.try_acquire() and self._due():
+            start = time.perf_counter()
+            try:
+                self.job()
+                outcome = "ok"
+            except Exception as e:
+                outcome = "error"
+                self.failures += 1
+                self.last_error = str(e)
+                self.shared.set_meta("last_refresh_failed", time.time())
+                logger.error("Scheduled %s failed: %s", self.name, e)
+            seconds = time.perf_counter() - start
+            JOB_SECONDS.labels(self.name).observe(seconds)
+            JOB_RUNS.labels(self.name, outcome).inc()
+            self.last_run_seconds = round(seconds, 4)
+            self.runs += 1
+            if outcome == "ok":
+                self.last_error = None
+                self.shared.set_meta("last_refresh", time.time())
+        self.sync()
+
+    def _due(self):
+        now = time.time()
+        if now - self.shared.get_meta("last_refresh", 0) < self.interval_seconds:
+            return False
+        return now - self.shared.get_meta("last_refresh_failed", 0) >= self.retry_seconds
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def loop():
+            time.sleep(self.initial_delay)
+            while True:
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error("Scheduler tick failed: %s", e)
+                time.sleep(self.poll_seconds)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="aqi-scheduler")
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_run_seconds": self.last_run_seconds,
+            "last_refresh": self.shared.get_meta("last_refresh"),
+            "synced_seq": self._seq,
+        }
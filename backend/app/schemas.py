@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, Any, Literal
+from datetime import date
 
 # --- User Schemas ---
 
@@ -53,6 +54,36 @@ class TrendsResponse(BaseModel):
     weeklyTrends: list
     monthlyTrends: list
 
+class TrendSeriesResponse(BaseModel):
+    """Range/aggregate query result for /api/data/trends/{zipcode}."""
+    locationName: str
+    zipcode: str
+    start: Optional[date] = None
+    end: Optional[date] = None
+    resample: Literal["daily", "weekly", "monthly"] = "daily"
+    stat: str = "mean"
+    rolling: Optional[int] = None
+    points: list
+
+class ForecastResponse(BaseModel):
+    """Daily forecast for /api/data/forecast/{zipcode}."""
+    locationName: str
+    zipcode: str
+    issued: date
+    horizonDays: int
+    stale: bool = False
+    points: list
+    models: dict
+
+class HistoryResponse(BaseModel):
+    """Observation rollups for /api/data/history/{zipcode}."""
+    zipcode: str
+    key: str
+    resolution: Literal["hourly", "daily", "monthly"] = "daily"
+    start: Optional[str] = None
+    end: Optional[str] = None
+    points: list
+
 # --- User Update Schema ---
 class UserUpdate(BaseModel):
     """
@@ -81,7 +112,7 @@ class UserUpdate(BaseModel):
 class ChatQuery(BaseModel):
     """Defines the structure for a user's chatbot request."""
     question: str = Field(..., description="The user's question about air quality.")
-    zip_code: Optional[str] = Field(None, description="Optional ZIP code override.")
+    zip_code: Optional[str] = Field(None, pattern=r"^\d{5}$", description="Optional 5-digit ZIP code override.")
     health_issue: Optional[str] = Field(None, description="Optional health condition (e.g., 'asthma').")
     activity: Optional[str] = Field(None, description="Optional planned activity (e.g., 'jogging').")
 
@@ -89,6 +120,9 @@ class ChatResponse(BaseModel):
     """Defines the structure for the chatbot's response."""
     answer: str = Field(..., description="The AI's generated response.")
     active_zip: str = Field(..., description="The ZIP code the answer was based on.")
+    stale: bool = Field(False, description="True if live AQI couldn't be refreshed and older readings were used.")
+    data_age_seconds: Optional[int] = Field(None, description="Age of the AQI readings the answer was based on.")
+    degraded: Optional[str] = Field(None, description="Set (e.g. 'llm_unavailable') when the answer is a rule-based fallback.")
 
 
 # --- Token Schemas ---
@@ -0,0 +1,53 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Startup timing report ---
+# Records how long each import/startup phase took so cold-start
+# regressions show up at GET /startup.
+
+_started = time.perf_counter()
+_phases = {}
+_lock = threading.Lock()
+ready_seconds = None
+
+
+def record(name, seconds, background=False):
+    with _lock:
+        _phases[name] = {"seconds": round(seconds, 4), "background": background}
+
+
+@contextmanager
+def phase(name, background=False):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, background)
+
+
+def run_in_background(name, fn, *args):
+    """Runs a startup step in a daemon thread, timing it as a background phase."""
+    def target():
+        try:
+            with phase(name, background=True):
+                fn(*args)
+        except Exception as e:
+            logger.error("Startup step '%s' failed: %s", name, e)
+
+    threading.Thread(target=target, daemon=True, name=f"startup-{name}").start()
+
+
+def mark_ready():
+    """Called once the app is ready to accept requests."""
+    global ready_seconds
+    ready_seconds = round(time.perf_counter() - _started, 4)
+
+
+def report():
+    with _lock:
+        phases = dict(_phases)
+    return {"ready_seconds": ready_seconds, "phases": phases}
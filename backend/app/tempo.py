@@ -0,0 +1,405 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time as _time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.cache import LRUCache
+from app.historical_loader import HISTORICAL_UPDATES_PATH, updates_lock
+
+# --- TEMPO gridded satellite data ---
+# Hourly TEMPO L3 granules are regular lat/lon grids. Each one is converted
+# once into a tiled float32 array on disk (tiles_y, tiles_x, tile, tile), so
+# sampling a batch of points memory-maps the file and only pages in the
+# tiles the points fall in, never the whole granule. Sampling is a single
+# vectorized bilinear interpolation over all points.
+#
+# Layout: <root>/<variable>/<YYYYMMDDTHHMMZ>/{tiles.npy, meta.json}
+#
+# netCDF4 is only needed to ingest .nc files; synthetic or pre-extracted
+# grids can be ingested from arrays or .npz files (values, lat, lon).
+#
+# Lookups never list the directory: the granule index is kept in memory,
+# rebuilt at most every TEMPO_INDEX_SECONDS (ingests usually run in another
+# process) and right after an ingest in this one. Open granules are an LRU
+# of memory maps, and granules older than TEMPO_RETENTION_DAYS are deleted
+# on ingest.
+
+DEFAULT_TILE = 256
+TEMPO_INDEX_SECONDS = float(os.getenv("TEMPO_INDEX_SECONDS", 60))
+TEMPO_MAX_OPEN_GRANULES = int(os.getenv("TEMPO_MAX_OPEN_GRANULES", 64))
+TEMPO_RETENTION_DAYS = int(os.getenv("TEMPO_RETENTION_DAYS", 30))
+
+# Variable name -> (netCDF group/variable path, column label in trends)
+VARIABLES = {
+    "no2": ("product/vertical_column_troposphere", "tempo_no2"),
+    "o3": ("product/column_amount_o3", "tempo_o3"),
+    "hcho": ("product/vertical_column", "tempo_hcho"),
+}
+
+LABELS = {
+    "no2": "tropospheric NO2 column",
+    "o3": "total O3 column",
+    "hcho": "HCHO column",
+}
+
+_TIME_FORMAT = "%Y%m%dT%H%MZ"
+
+
+def _regular_axis(axis, name):
+    """Returns (start, step) of an evenly spaced coordinate axis."""
+    axis = np.asarray(axis, dtype=np.float64)
+    if axis.ndim != 1 or len(axis) < 2:
+        raise ValueError(f"{name} must be a 1-D axis with at least two points")
+    steps = np.diff(axis)
+    if not np.allclose(steps, steps[0], rtol=1e-4, atol=1e-6):
+        raise ValueError(f"{name} is not evenly spaced")
+    return float(axis[0]), float(steps[0])
+
+
+def write_tiled(source, out_path, tile=DEFAULT_TILE, fill_value=None):
+    """
+    Copies a 2-D grid into a tiled .npy file, one band of `tile` rows at a
+    time, so `source` (an array, memmap or netCDF variable) is never fully
+    loaded. Fill values and masked cells become NaN.
+    """
+    ny, nx = source.shape
+    ty, tx = -(-ny // tile), -(-nx // tile)
+    tiles = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(ty, tx, tile, tile))
+    tiles[:] = np.nan
+    for band in range(ty):
+        rows = source[band * tile:(band + 1) * tile, :]
+        if np.ma.isMaskedArray(rows):
+            rows = rows.astype(np.float32).filled(np.nan)
+        rows = np.asarray(rows, dtype=np.float32)
+        if fill_value is not None:
+            rows = np.where(rows == fill_value, np.nan, rows)
+        padded = np.full((tile, tx * tile), np.nan, dtype=np.float32)
+        padded[:rows.shape[0], :nx] = rows
+        # (tile, tx, tile) -> (tx, tile, tile)
+        tiles[band] = padded.reshape(tile, tx, tile).transpose(1, 0, 2)
+    tiles.flush()
+    return tiles.shape
+
+
+class Granule:
+    """One ingested grid, opened as a read-only memory map."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tiles = np.load(self.directory / "tiles.npy", mmap_mode="r")
+        self.variable = self.meta["variable"]
+        self.time = datetime.strptime(self.meta["time"], _TIME_FORMAT).replace(tzinfo=timezone.utc)
+        self.units = self.meta.get("units")
+
+    def sample(self, lats, lons):
+        """
+        Bilinearly interpolated values at the given points (NaN outside the
+        grid or where all surrounding cells are missing). Missing corners
+        are dropped and the remaining weights renormalized.
+        """
+        m = self.meta
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        fi = (lats - m["lat0"]) / m["dlat"]
+        fj = (lons - m["lon0"]) / m["dlon"]
+        inside = (fi >= 0) & (fi <= m["ny"] - 1) & (fj >= 0) & (fj <= m["nx"] - 1)
+
+        i0 = np.clip(np.floor(fi), 0, m["ny"] - 1).astype(np.int64)
+        j0 = np.clip(np.floor(fj), 0, m["nx"] - 1).astype(np.int64)
+        i1 = np.minimum(i0 + 1, m["ny"] - 1)
+        j1 = np.minimum(j0 + 1, m["nx"] - 1)
+        wi = np.clip(fi - i0, 0, 1)
+        wj = np.clip(fj - j0, 0, 1)
+
+        t = m["tile"]
+        tiles = self.tiles
+
+        def gather(i, j):
+            return tiles[i // t, j // t, i % t, j % t].astype(np.float64)
+
+        values = np.stack([gather(i0, j0), gather(i1, j0), gather(i0, j1), gather(i1, j1)])
+        weights = np.stack([(1 - wi) * (1 - wj), wi * (1 - wj), (1 - wi) * wj, wi * wj])
+        valid = ~np.isnan(values)
+        total = np.where(valid, weights, 0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.where(valid, values * weights, 0).sum(axis=0) / total
+        result[(total == 0) | ~inside] = np.nan
+        return result
+
+
+class TempoStore:
+    """Catalog of ingested granules under `root`, opened lazily and cached."""
+
+    def __init__(self, root, tile=DEFAULT_TILE, index_seconds=TEMPO_INDEX_SECONDS,
+                 max_open=TEMPO_MAX_OPEN_GRANULES, retention_days=TEMPO_RETENTION_DAYS):
+        self.root = Path(root)
+        self.tile = tile
+        self.index_seconds = index_seconds
+        self.retention_days = retention_days
+        self._granules = LRUCache(maxsize=max_open)  # directory -> Granule
+        self._index = {}                             # variable -> [times], oldest first
+        self._indexed_at = None
+        self._lock = threading.Lock()
+        self.index_builds = 0
+        self.pruned = 0
+
+    # --- ingestion ---
+
+    def ingest_array(self, values, lats, lons, variable, time, units=None, fill_value=None):
+        """
+        Ingests a grid given as a 2-D array (or lazily sliced variable) with
+        1-D latitude/longitude axes. Written to a temp directory and renamed
+        into place, so readers never see a partial granule.
+        """
+        lat0, dlat = _regular_axis(lats, "latitude")
+        lon0, dlon = _regular_axis(lons, "longitude")
+        if tuple(values.shape) != (len(lats), len(lons)):
+            raise ValueError(f"grid shape {tuple(values.shape)} doesn't match axes ({len(lats)}, {len(lons)})")
+        if time.tzinfo is not None:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+        name = time.strftime(_TIME_FORMAT)
+        target = self.root / variable / name
+        tmp = self.root / variable / f".{name}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        write_tiled(values, tmp / "tiles.npy", tile=self.tile, fill_value=fill_value)
+        meta = {
+            "variable": variable,
+            "time": name,
+            "units": units,
+            "lat0": lat0, "dlat": dlat, "ny": len(lats),
+            "lon0": lon0, "dlon": dlon, "nx": len(lons),
+            "tile": self.tile,
+        }
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        self._granules.pop(target)
+        self.enforce_retention()
+        self.invalidate()
+        return target
+
+    def enforce_retention(self, now=None):
+        """Deletes granules older than `retention_days` (0 keeps everything)."""
+        if not self.retention_days or not self.root.is_dir():
+            return 0
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=self.retention_days)
+        removed = 0
+        for variable, times in self._scan().items():
+            for t in times:
+                if t >= cutoff:
+                    break
+                directory = self.root / variable / t.strftime(_TIME_FORMAT)
+                self._granules.pop(directory)
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        self.pruned += removed
+        if removed:
+            self.invalidate()
+        return removed
+
+    def ingest_file(self, path, variable="no2", time=None):
+        """Ingests a TEMPO L3 netCDF granule or an .npz grid (values, lat, lon)."""
+        path = Path(path)
+        if path.suffix == ".npz":
+            with np.load(path) as data:
+                return self.ingest_array(data["values"], data["lat"], data["lon"], variable, time or _file_time(path))
+
+        try:
+            import netCDF4
+        except ImportError as e:
+            raise RuntimeError("netCDF4 is required to ingest .nc granules (pip install netCDF4)") from e
+
+        with netCDF4.Dataset(path) as ds:
+            group_path, var_name = VARIABLES[variable][0].rsplit("/", 1)
+            group = ds
+            for part in group_path.split("/"):
+                group = group.groups[part]
+            var = group.variables[var_name]
+            var.set_auto_mask(True)
+            lats = ds.variables["latitude"][:]
+            lons = ds.variables["longitude"][:]
+            if time is None:
+                start = getattr(ds, "time_coverage_start", None)
+                time = datetime.fromisoformat(start.replace("Z", "+00:00")) if start else _file_time(path)
+            # L3 variables are (time, lat, lon) with a single time step
+            grid = _Band(var) if var.ndim == 3 else var
+            return self.ingest_array(grid, lats, lons, variable, time, units=getattr(var, "units", None))
+
+    # --- lookup ---
+
+    def _open(self, directory):
+        granule = self._granules.get(directory)
+        if granule is None:
+            granule = Granule(directory)
+            self._granules.set(directory, granule)
+        return granule
+
+    def _scan(self):
+        """Reads the granule catalog from disk: {variable: [times]}."""
+        if not self.root.is_dir():
+            return {}
+        index = {}
+        for directory in self.root.iterdir():
+            if not directory.is_dir() or directory.name.startswith("."):
+                continue
+            names = sorted(p.name for p in directory.iterdir() if not p.name.startswith("."))
+            index[directory.name] = [datetime.strptime(n, _TIME_FORMAT).replace(tzinfo=timezone.utc) for n in names]
+        return index
+
+    def invalidate(self):
+        """Forces the next lookup to rebuild the granule index."""
+        self._indexed_at = None
+
+    def index(self):
+        """The in-memory granule index, rebuilt if older than `index_seconds`."""
+        now = _time.monotonic()
+        if self._indexed_at is None or now - self._indexed_at >= self.index_seconds:
+            with self._lock:
+                if self._indexed_at is None or now - self._indexed_at >= self.index_seconds:
+                    self._index = self._scan()
+                    self._indexed_at = _time.monotonic()
+                    self.index_builds += 1
+        return self._index
+
+    def times(self, variable):
+        """Ingested granule times for a variable, oldest first."""
+        return list(self.index().get(variable, ()))
+
+    def granule(self, variable, time):
+        return self._open(self.root / variable / time.strftime(_TIME_FORMAT))
+
+    def latest(self, variable, max_age=None):
+        """Newest granule for `variable` (optionally no older than `max_age`)."""
+        times = self.times(variable)
+        if not times:
+            return None
+        if max_age is not None and datetime.now(timezone.utc) - times[-1] > max_age:
+            return None
+        return self.granule(variable, times[-1])
+
+    def sample_latest(self, variable, lats, lons, max_age=None):
+        """Returns (granule, values) for the newest granule, or (None, None)."""
+        granule = self.latest(variable, max_age)
+        if granule is None:
+            return None, None
+        return granule, granule.sample(lats, lons)
+
+    def daily_means(self, variable, day, lats, lons):
+        """Mean of all of a UTC day's granules at each point (NaN if none)."""
+        times = [t for t in self.times(variable) if t.date() == day]
+        n = len(np.atleast_1d(lats))
+        if not times:
+            return np.full(n, np.nan)
+        samples = np.stack([self.granule(variable, t).sample(lats, lons) for t in times])
+        with np.errstate(invalid="ignore"):
+            counts = (~np.isnan(samples)).sum(axis=0)
+            sums = np.nansum(samples, axis=0)
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def stats(self):
+        index = self.index()
+        return {
+            "root": str(self.root),
+            "granules": {v: len(t) for v, t in index.items()},
+            "latest": {v: (t[-1].isoformat() if t else None) for v, t in index.items()},
+            "open": len(self._granules),
+            "index_builds": self.index_builds,
+            "pruned": self.pruned,
+            "retention_days": self.retention_days,
+        }
+
+
+class _Band:
+    """Drops the leading time axis of a (1, lat, lon) netCDF variable while
+    keeping reads lazy."""
+
+    def __init__(self, var):
+        self.var = var
+        self.shape = tuple(var.shape[1:])
+
+    def __getitem__(self, key):
+        return self.var[(0,) + key]
+
+
+def _file_time(path):
+    return datetime.fromtimestamp(os.stat(path).st_mtime, timezone.utc)
+
+
+def trend_updates(store, variable, day, centroids):
+    """
+    Daily-mean satellite values at each ZIP centroid as updates-file
+    records ({"zip", "date", "tempo_<var>"}) for the historical loader.
+    `centroids` is {zip: (lat, lon)}.
+    """
+    zips = list(centroids)
+    if not zips:
+        return []
+    points = np.array([centroids[z] for z in zips], dtype=np.float64)
+    means = store.daily_means(variable, day, points[:, 0], points[:, 1])
+    column = VARIABLES[variable][1]
+    return [
+        {"zip": z, "date": day.isoformat(), column: float(v)}
+        for z, v in zip(zips, means)
+        if not np.isnan(v)
+    ]
+
+
+def append_trend_updates(updates_path, records):
+    """Appends records to the historical updates file (see HistoricalDataLoader)."""
+    Path(updates_path).parent.mkdir(parents=True, exist_ok=True)
+    # Held so a worker compacting the file doesn't drop these lines
+    with updates_lock(updates_path), open(updates_path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest TEMPO granules and derive daily trends.")
+    parser.add_argument("--root", default=os.getenv("TEMPO_DATA_DIR", "tempo_data"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="convert granules into tiled arrays")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--variable", default="no2", choices=sorted(VARIABLES))
+
+    trends = sub.add_parser("trends", help="append daily means at ZIP centroids to the updates file")
+    trends.add_argument("day", nargs="?", help="UTC day (YYYY-MM-DD), default yesterday")
+    trends.add_argument("--variable", action="append", choices=sorted(VARIABLES))
+    trends.add_argument("--centroids", default=os.getenv("ZIP_CENTROIDS_PATH", "zip_centroids.csv"))
+    trends.add_argument("--updates", default=HISTORICAL_UPDATES_PATH)
+    trends.add_argument("--historical", default="historical_data.json",
+                        help="only ZIPs already in this file get satellite columns ('' for every centroid)")
+
+    args = parser.parse_args(argv)
+    store = TempoStore(args.root)
+    if args.command == "ingest":
+        for path in args.files:
+            print(f"Ingested {path} -> {store.ingest_file(path, args.variable)}")
+        return
+
+    from app.geo import load_zip_centroids
+
+    day = date.fromisoformat(args.day) if args.day else datetime.now(timezone.utc).date() - timedelta(days=1)
+    centroids = load_zip_centroids(args.centroids)
+    if args.historical and os.path.exists(args.historical):
+        with open(args.historical, encoding="utf-8") as f:
+            known = set(json.load(f))
+        centroids = {z: p for z, p in centroids.items() if z in known}
+    for variable in args.variable or ["no2"]:
+        records = trend_updates(store, variable, day, centroids)
+        print(f"{variable}: {append_trend_updates(args.updates, records)} ZIP values for {day}")
+
+
+if __name__ == "__main__":
+    main()
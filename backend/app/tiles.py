@@ -0,0 +1,249 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from app.cache import LRUCache
+
+# --- AQI heatmap tiles ---
+# Point AQI values (one per reporting area / ZIP) are splatted onto a
+# coarse lat/lon grid, each cell taking the nearest point within
+# `radius_km`. Web Mercator tiles (z/x/y, 256 px) are rendered by sampling
+# that grid, coloured with the EPA AQI palette and PNG-encoded with zlib.
+# Rendered tiles live in a byte-bounded LRU; low zooms are pre-rendered
+# after each rebuild and higher zooms are rendered on demand.
+
+TILE_SIZE = 256
+
+# EPA AQI category upper bounds and colours (RGB)
+AQI_BREAKS = np.array([50, 100, 150, 200, 300], dtype=np.float32)
+AQI_COLORS = np.array([
+    (0, 228, 0),      # Good
+    (255, 255, 0),    # Moderate
+    (255, 126, 0),    # Unhealthy for Sensitive Groups
+    (255, 0, 0),      # Unhealthy
+    (143, 63, 151),   # Very Unhealthy
+    (126, 0, 35),     # Hazardous
+], dtype=np.uint8)
+TILE_ALPHA = 160
+
+
+def encode_png(rgba):
+    """Encodes an (h, w, 4) uint8 array as an RGBA PNG."""
+    height, width, _ = rgba.shape
+    # Filter type 0 (None) in front of every scanline
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)], axis=1)
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b"")
+    )
+
+
+def colorize(aqi):
+    """AQI array -> RGBA; NaN is transparent."""
+    rgba = np.zeros(aqi.shape + (4,), dtype=np.uint8)
+    valid = ~np.isnan(aqi)
+    rgba[valid, :3] = AQI_COLORS[np.searchsorted(AQI_BREAKS, aqi[valid], side="left")]
+    rgba[valid, 3] = TILE_ALPHA
+    return rgba
+
+
+def tile_lat_lon(z, x, y, size=TILE_SIZE):
+    """Latitudes of pixel-row centres and longitudes of pixel-column centres."""
+    n = 2 ** z
+    offsets = (np.arange(size) + 0.5) / size
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lats, lons
+
+
+def tile_range(z, south, west, north, east):
+    """Inclusive x/y tile ranges covering a lat/lon box at zoom z."""
+    n = 2 ** z
+
+    def tx(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def ty(lat):
+        lat = math.radians(max(min(lat, 85.0511), -85.0511))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return range(tx(west), tx(east) + 1), range(ty(north), ty(south) + 1)
+
+
+class AQIGrid:
+    """Coarse lat/lon raster of AQI built from point values."""
+
+    def __init__(self, south=10.0, west=-170.0, north=75.0, east=-50.0, resolution=0.1, radius_km=60.0):
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.resolution = resolution
+        self.radius_km = radius_km
+        self.ny = int(round((north - south) / resolution))
+        self.nx = int(round((east - west) / resolution))
+        self.values = np.full((self.ny, self.nx), np.nan, dtype=np.float32)
+
+    def splat(self, points):
+        """
+        Fills cells within `radius_km` of each (lat, lon, aqi) point with the
+        nearest point's AQI. Each point only touches its own small window.
+        """
+        distance = np.full((self.ny, self.nx), np.inf, dtype=np.float32)
+        dlat = self.radius_km / 111.0
+        for lat, lon, aqi in points:
+            if aqi is None or not (self.south <= lat < self.north and self.west <= lon < self.east):
+                continue
+            dlon = dlat / max(math.cos(math.radians(lat)), 0.05)
+            i0 = max(0, int((lat - dlat - self.south) / self.resolution))
+            i1 = min(self.ny, int((lat + dlat - self.south) / self.resolution) + 1)
+            j0 = max(0, int((lon - dlon - self.west) / self.resolution))
+            j1 = min(self.nx, int((lon + dlon - self.west) / self.resolution) + 1)
+            cell_lats = self.south + (np.arange(i0, i1) + 0.5) * self.resolution
+            cell_lons = self.west + (np.arange(j0, j1) + 0.5) * self.resolution
+            # Equirectangular distance is plenty at this radius
+            dy = (cell_lats[:, None] - lat) * 111.0
+            dx = (cell_lons[None, :] - lon) * 111.0 * math.cos(math.radians(lat))
+            d = np.sqrt(dy * dy + dx * dx)
+            window = distance[i0:i1, j0:j1]
+            closer = (d <= self.radius_km) & (d < window)
+            window[closer] = d[closer]
+            self.values[i0:i1, j0:j1][closer] = aqi
+        return self
+
+    def sample(self, lats, lons):
+        """Nearest-cell AQI on the lats x lons mesh (NaN outside the grid)."""
+        rows = np.floor((lats - self.south) / self.resolution).astype(np.int64)
+        cols = np.floor((lons - self.west) / self.resolution).astype(np.int64)
+        row_ok = (rows >= 0) & (rows < self.ny)
+        col_ok = (cols >= 0) & (cols < self.nx)
+        out = self.values[np.clip(rows, 0, self.ny - 1)[:, None], np.clip(cols, 0, self.nx - 1)[None, :]]
+        out = out.copy()
+        out[~row_ok, :] = np.nan
+        out[:, ~col_ok] = np.nan
+        return out
+
+
+class TileRenderer:
+    """
+    Renders and caches tiles for one layer. `source()` returns
+    (version, points) where points are (lat, lon, aqi); the grid is rebuilt
+    when the version changes, at most every `min_rebuild_seconds`.
+    """
+
+    def __init__(self, name, source, cache_bytes=32 * 1024 * 1024, precompute_zoom=4,
+                 max_zoom=12, min_rebuild_seconds=60, **grid_options):
+        self.name = name
+        self.source = source
+        self.precompute_zoom = precompute_zoom
+        self.max_zoom = max_zoom
+        self.min_rebuild_seconds = min_rebuild_seconds
+        self.grid_options = grid_options
+        self.cache = LRUCache(maxsize=100000, max_bytes=cache_bytes, sizeof=lambda entry: len(entry[0]) + 100)
+        self.grid = None
+        self.version = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._precomputing = False
+        self.build_seconds = None
+        self.precompute_seconds = None
+        self.precomputed = 0
+        self._renders = {}  # zoom -> [count, total_seconds, max_seconds]
+
+    def _current_grid(self):
+        if self.grid is not None and time.monotonic() - self._built_at < self.min_rebuild_seconds:
+            return self.grid
+        version, points = self.source()
+        if self.grid is not None and version == self.version:
+            self._built_at = time.monotonic()
+            return self.grid
+        with self._lock:
+            if self.grid is None or version != self.version:
+                start = time.perf_counter()
+                grid = AQIGrid(**self.grid_options).splat(points)
+                self.grid, self.version = grid, version
+                self.cache.clear()
+                self.build_seconds = round(time.perf_counter() - start, 4)
+            self._built_at = time.monotonic()
+        return self.grid
+
+    def render(self, z, x, y, grid=None):
+        grid = grid or self._current_grid()
+        start = time.perf_counter()
+        lats, lons = tile_lat_lon(z, x, y)
+        png = encode_png(colorize(grid.sample(lats, lons)))
+        seconds = time.perf_counter() - start
+        with self._lock:
+            stats = self._renders.setdefault(z, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        return png, '"' + hashlib.sha1(png).hexdigest()[:20] + '"'
+
+    def get(self, z, x, y):
+        """Returns (png_bytes, etag) for a tile, rendering it on a miss."""
+        if not (0 <= z <= self.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"Tile {z}/{x}/{y} is out of range (max zoom {self.max_zoom}).")
+        grid = self._current_grid()
+        key = (self.version, z, x, y)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.render(z, x, y, grid)
+            self.cache.set(key, entry)
+        return entry
+
+    def precompute(self):
+        """Renders every tile over the grid area up to `precompute_zoom`."""
+        with self._lock:
+            if self._precomputing:
+                return 0
+            self._precomputing = True
+        try:
+            self._built_at = 0.0  # force a version check
+            grid = self._current_grid()
+            version = self.version
+            start = time.perf_counter()
+            count = 0
+            for z in range(self.precompute_zoom + 1):
+                xs, ys = tile_range(z, grid.south, grid.west, grid.north, grid.east)
+                for x in xs:
+                    for y in ys:
+                        self.cache.set((version, z, x, y), self.render(z, x, y, grid))
+                        count += 1
+            self.precomputed = count
+            self.precompute_seconds = round(time.perf_counter() - start, 4)
+            return count
+        finally:
+            self._precomputing = False
+
+    def precompute_in_background(self):
+        threading.Thread(target=self.precompute, daemon=True, name=f"tiles-{self.name}").start()
+
+    def stats(self):
+        with self._lock:
+            renders = {
+                z: {
+                    "count": c,
+                    "avg_ms": round(total / c * 1000, 3) if c else 0.0,
+                    "max_ms": round(worst * 1000, 3),
+                }
+                for z, (c, total, worst) in sorted(self._renders.items())
+            }
+        return {
+            "version": self.version,
+            "grid_build_seconds": self.build_seconds,
+            "precomputed_tiles": self.precomputed,
+            "precompute_seconds": self.precompute_seconds,
+            "renders_by_zoom": renders,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,362 @@
+import itertools
+import json
+import re
+import warnings
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+# --- Columnar historical trends store ---
+# One float32 matrix per pollutant (rows = ZIPs, columns = days) plus a
+# shared, sorted date index. Range queries are slices and aggregates are
+# NumPy reductions over those slices, so cost doesn't grow with Python
+# object counts. The arrays can be saved as .npy files and memory-mapped.
+
+RESAMPLE_CHOICES = ("daily", "weekly", "monthly")
+# Satellite columns (see app/tempo.py) are only returned by `query`; the
+# legacy payload keeps the ground-station pollutants it always had.
+SATELLITE_PREFIX = "tempo_"
+_PERCENTILE = re.compile(r"^p(\d{1,2}(\.\d+)?)$")
+_generations = itertools.count(1)
+
+
+def _parse_day(label, year):
+    """Parses "2025-10-03" or the legacy "Oct 3" labels."""
+    try:
+        return date.fromisoformat(label)
+    except ValueError:
+        return datetime.strptime(f"{label} {year}", "%b %d %Y").date()
+
+
+def _label(day):
+    day = day.astype(object) if isinstance(day, np.datetime64) else day
+    return f"{day:%b} {day.day}"
+
+
+def _default_year(labels):
+    """Picks the latest year that doesn't put the newest label in the future."""
+    today = date.today()
+    year = today.year
+    for label in labels:
+        try:
+            date.fromisoformat(label)
+            continue
+        except ValueError:
+            pass
+        if datetime.strptime(f"{label} {year}", "%b %d %Y").date() > today:
+            return year - 1
+    return year
+
+
+class TrendsStore:
+    def __init__(self, dates, zips, location_names, values):
+        # Arrays may be over-allocated so appends are amortized O(1); only
+        # the first _n_zips rows / _n_days columns are live.
+        self._dates = dates                     # datetime64[D], sorted
+        self._values = values                   # pollutant -> float32 (zips, days)
+        self._n_days = len(dates)
+        self._n_zips = len(zips)
+        self.zips = list(zips)
+        self.zip_index = {z: i for i, z in enumerate(self.zips)}
+        self.location_names = list(location_names)
+        self.pollutants = tuple(values)
+        self.version = 0                        # bumped on every append
+        # Process-wide unique per store and content: caches key on this
+        # instead of holding on to the store object itself.
+        self.generation = next(_generations)
+
+    @property
+    def dates(self):
+        return self._dates[:self._n_days]
+
+    @property
+    def values(self):
+        return {p: m[:self._n_zips, :self._n_days] for p, m in self._values.items()}
+
+    # --- building / persistence ---
+
+    @classmethod
+    def empty(cls):
+        return cls(np.array([], dtype="datetime64[D]"), [], [], {})
+
+    @classmethod
+    def from_json_dict(cls, data, year=None):
+        """
+        Builds the store from the historical_data.json layout:
+        {zip: {"locationName", "weeklyTrends": [...], "monthlyTrends": [...]}}.
+        Weekly and monthly lists overlap; every distinct day is kept once.
+        """
+        per_zip = {}
+        labels = set()
+        pollutants = []
+        for zip_code, entry in data.items():
+            days = {}
+            for key in ("monthlyTrends", "weeklyTrends", "dailyTrends"):
+                for row in entry.get(key, []):
+                    days[row["date"]] = row
+                    labels.add(row["date"])
+                    for field in row:
+                        if field != "date" and field not in pollutants:
+                            pollutants.append(field)
+            per_zip[zip_code] = (entry.get("locationName", zip_code), days)
+
+        year = year or _default_year(labels)
+        parsed = {label: np.datetime64(_parse_day(label, year), "D") for label in labels}
+        dates = np.array(sorted(set(parsed.values())), dtype="datetime64[D]")
+        zips = list(per_zip)
+        values = {p: np.full((len(zips), len(dates)), np.nan, dtype=np.float32) for p in pollutants}
+
+        for row_idx, zip_code in enumerate(zips):
+            _, days = per_zip[zip_code]
+            if not days:
+                continue
+            cols = np.searchsorted(dates, [parsed[label] for label in days])
+            for p in pollutants:
+                values[p][row_idx, cols] = [
+                    np.nan if row.get(p) is None else row[p] for row in days.values()
+                ]
+        return cls(dates, zips, [per_zip[z][0] for z in zips], values)
+
+    @classmethod
+    def from_json_file(cls, path, year=None):
+        with Path(path).open("r", encoding="utf-8") as f:
+            return cls.from_json_dict(json.load(f), year=year)
+
+    def save(self, directory):
+        """Writes the store as .npy arrays that `open` can memory-map."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "dates.npy", self.dates)
+        for p, matrix in self.values.items():
+            np.save(directory / f"{p}.npy", matrix)
+        meta = {"zips": self.zips, "locationNames": self.location_names, "pollutants": list(self.pollutants)}
+        (directory / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        mode = "r" if mmap else None
+        dates = np.load(directory / "dates.npy")
+        values = {p: np.load(directory / f"{p}.npy", mmap_mode=mode) for p in meta["pollutants"]}
+        return cls(dates, meta["zips"], meta["locationNames"], values)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays (including spare append capacity)."""
+        return int(self._dates.nbytes + sum(m.nbytes for m in self._values.values()))
+
+    @property
+    def memory_mapped(self):
+        return any(isinstance(m, np.memmap) for m in self._values.values())
+
+    # --- incremental ingest ---
+    # `append_days` mutates the arrays in place and is not safe while other
+    # threads read the store: HistoricalDataLoader appends to a `copy()` and
+    # swaps the new store in with one reference assignment.
+
+    def copy(self):
+        """Independent copy, spare capacity included, for copy-on-write appends."""
+        store = TrendsStore(
+            self._dates.copy(), self.zips, self.location_names,
+            {p: np.array(m) for p, m in self._values.items()},
+        )
+        store._n_days = self._n_days
+        store._n_zips = self._n_zips
+        store.version = self.version
+        return store
+
+    def _ensure_capacity(self, n_zips, n_days, pollutants):
+        """Grows the backing arrays geometrically; copies mmaps into RAM."""
+        zip_cap = max((m.shape[0] for m in self._values.values()), default=0)
+        day_cap = len(self._dates)
+        grow = (
+            n_zips > zip_cap or n_days > day_cap or self.memory_mapped
+            or any(p not in self._values for p in pollutants)
+        )
+        if not grow:
+            return
+        new_zip_cap = max(n_zips, zip_cap if n_zips <= zip_cap else int(zip_cap * 1.5) + 8)
+        new_day_cap = max(n_days, day_cap if n_days <= day_cap else int(day_cap * 1.5) + 32)
+        dates = np.zeros(new_day_cap, dtype="datetime64[D]")
+        dates[:self._n_days] = self._dates[:self._n_days]
+        values = {}
+        for p in dict.fromkeys(list(self._values) + list(pollutants)):
+            matrix = np.full((new_zip_cap, new_day_cap), np.nan, dtype=np.float32)
+            if p in self._values:
+                matrix[:self._n_zips, :self._n_days] = self._values[p][:self._n_zips, :self._n_days]
+            values[p] = matrix
+        self._dates, self._values = dates, values
+        self.pollutants = tuple(values)
+
+    def append_days(self, zip_code, rows, location_name=None):
+        """
+        Adds or overwrites daily values for one ZIP without rebuilding the
+        store. `rows` are {"date": "YYYY-MM-DD", pollutant: value, ...}.
+        Days after the current last day are appended; earlier missing days
+        are inserted (a copy, but rare).
+        """
+        if not rows:
+            return
+        days = np.array([np.datetime64(date.fromisoformat(r["date"]), "D") for r in rows])
+        pollutants = [k for r in rows for k in r if k != "date"]
+        new_days = np.setdiff1d(days, self.dates)
+        is_new_zip = zip_code not in self.zip_index
+        self._ensure_capacity(self._n_zips + is_new_zip, self._n_days + len(new_days), pollutants)
+
+        if len(new_days):
+            if self._n_days and new_days[0] <= self._dates[self._n_days - 1]:
+                # Back-filled days: insert columns in order (copying).
+                merged = np.union1d(self.dates, new_days)
+                positions = np.searchsorted(merged, self.dates)
+                for p, matrix in self._values.items():
+                    live = matrix[:self._n_zips, :self._n_days].copy()
+                    matrix[:self._n_zips, :len(merged)] = np.nan
+                    matrix[:self._n_zips, positions] = live
+                self._dates[:len(merged)] = merged
+            else:
+                self._dates[self._n_days:self._n_days + len(new_days)] = new_days
+            self._n_days += len(new_days)
+
+        if is_new_zip:
+            self.zip_index[zip_code] = self._n_zips
+            self.zips.append(zip_code)
+            self.location_names.append(location_name or zip_code)
+            self._n_zips += 1
+        elif location_name:
+            self.location_names[self.zip_index[zip_code]] = location_name
+
+        idx = self.zip_index[zip_code]
+        cols = np.searchsorted(self.dates, days)
+        for p in set(pollutants):
+            self._values[p][idx, cols] = [
+                np.nan if r.get(p) is None else r[p] for r in rows
+            ]
+        self.version += 1
+        self.generation = next(_generations)
+
+    def __len__(self):
+        return len(self.zips)
+
+    def __contains__(self, zip_code):
+        return zip_code in self.zip_index
+
+    # --- queries ---
+
+    def _rows(self, zip_code, start=None, end=None):
+        """Returns (dates, {pollutant: values}) for a ZIP within [start, end]."""
+        idx = self.zip_index[zip_code]
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, "D"), "left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, "D"), "right")
+        return self.dates[lo:hi], {p: np.asarray(m[idx, lo:hi]) for p, m in self.values.items()}
+
+    def legacy_trends(self, zip_code):
+        """Reproduces the original weekly (7 days) / monthly (30 days) payload."""
+        idx = self.zip_index[zip_code]
+        ground = [p for p in self.values if not p.startswith(SATELLITE_PREFIX)]
+        has_data = np.zeros(len(self.dates), dtype=bool)
+        for p in ground:
+            has_data |= ~np.isnan(np.asarray(self.values[p][idx]))
+        last = np.flatnonzero(has_data)
+        if not len(last):
+            return {"locationName": self.location_names[idx], "weeklyTrends": [], "monthlyTrends": []}
+        end = self.dates[last[-1]]
+
+        def points(start):
+            dates, columns = self._rows(zip_code, start, end)
+            return self._points(dates, {p: columns[p] for p in ground})
+
+        return {
+            "locationName": self.location_names[idx],
+            "weeklyTrends": points(end - 6),
+            "monthlyTrends": points(end - 29),
+        }
+
+    @staticmethod
+    def _points(dates, columns, labels=None):
+        labels = labels if labels is not None else [_label(d) for d in dates]
+        rounded = {p: np.round(col.astype(np.float64), 3) for p, col in columns.items()}
+        points = []
+        for i, label in enumerate(labels):
+            point = {"date": label}
+            for p, col in rounded.items():
+                v = col[i]
+                point[p] = None if np.isnan(v) else float(v)
+            points.append(point)
+        return points
+
+    def query(self, zip_code, start=None, end=None, resample="daily", stat="mean", rolling=None):
+        """
+        Range + aggregate query for one ZIP.
+
+        - resample: "daily", "weekly" (ISO weeks) or "monthly"
+        - stat: "mean", "max", "min", "median" or a percentile like "p95"
+        - rolling: optional window (in output points) for a rolling mean
+        Dates in the result are ISO strings (period start for resampled data).
+        """
+        reducer = _reducer(stat)
+        dates, columns = self._rows(zip_code, start, end)
+
+        if resample != "daily" and len(dates):
+            if resample == "weekly":
+                # 1970-01-01 was a Thursday; shift so weeks start on Monday.
+                periods = (dates.astype(np.int64) + 3) // 7
+                starts = (periods * 7 - 3).astype("datetime64[D]")
+            elif resample == "monthly":
+                periods = dates.astype("datetime64[M]").astype(np.int64)
+                starts = periods.astype("datetime64[M]").astype("datetime64[D]")
+            else:
+                raise ValueError(f"resample must be one of {RESAMPLE_CHOICES}")
+            _, first, counts = np.unique(periods, return_index=True, return_counts=True)
+            # Pad each period into one row of a (n_periods, max_len) matrix so
+            # every statistic is a single NaN-aware reduction along axis 1.
+            offsets = np.arange(len(dates)) - np.repeat(first, counts)
+            group = np.repeat(np.arange(len(first)), counts)
+            columns_out = {}
+            for p, col in columns.items():
+                padded = np.full((len(first), counts.max()), np.nan, dtype=np.float64)
+                padded[group, offsets] = col
+                columns_out[p] = reducer(padded)
+            dates, columns = starts[first], columns_out
+
+        if rolling and rolling > 1:
+            columns = {p: _rolling_mean(col, rolling) for p, col in columns.items()}
+
+        return self._points(dates, columns, labels=[str(d) for d in dates])
+
+
+def _reducer(stat):
+    def quiet(fn):
+        def run(matrix):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                return fn(matrix)
+        return run
+
+    if stat == "mean":
+        return quiet(lambda m: np.nanmean(m, axis=1))
+    if stat == "max":
+        return quiet(lambda m: np.nanmax(m, axis=1))
+    if stat == "min":
+        return quiet(lambda m: np.nanmin(m, axis=1))
+    if stat == "median":
+        return quiet(lambda m: np.nanmedian(m, axis=1))
+    match = _PERCENTILE.match(stat or "")
+    if match:
+        q = float(match.group(1))
+        return quiet(lambda m: np.nanpercentile(m, q, axis=1))
+    raise ValueError("stat must be mean, max, min, median or pNN (e.g. p95)")
+
+
+def _rolling_mean(values, window):
+    """NaN-aware trailing rolling mean using cumulative sums."""
+    values = values.astype(np.float64)
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    window_counts = counts[idx] - counts[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, (sums[idx] - sums[lo]) / window_counts, np.nan)
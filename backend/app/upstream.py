@@ -0,0 +1,495 @@
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# --- Upstream access layer ---
+# Every AirNow and Groq call passes through an `Upstream`, which applies:
+#
+# - a token-bucket quota (AirNow's hourly request cap, Groq's RPM). The
+#   last `reserve` fraction of the bucket is kept for interactive calls;
+# - an adaptive concurrency limit (AIMD): it grows by 1/limit per fast
+#   success and shrinks by 25% (at most once per latency target) when
+#   calls are slow or fail. Interactive waiters are served first, and
+#   background work may only use `background_share` of the slots;
+# - a circuit breaker that opens when too many recent calls fail. While
+#   open it rejects calls immediately; after `open_seconds` a single probe
+#   is let through.
+#
+# Rejections raise UpstreamError subclasses straight away (interactive)
+# or after a bounded wait (background), so callers can fall back to
+# cached data instead of sitting in a 10-30 s timeout.
+#
+# Priority comes from the `priority()` context (a ContextVar, so it
+# follows asyncio tasks). Without one, sync callers count as background
+# (the refresh job) and async callers as interactive (request handlers).
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+UPSTREAM_INTERACTIVE_WAIT = float(os.getenv("UPSTREAM_INTERACTIVE_WAIT", 1.0))
+UPSTREAM_BACKGROUND_WAIT = float(os.getenv("UPSTREAM_BACKGROUND_WAIT", 60.0))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", 0.5))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))
+
+_priority = contextvars.ContextVar("upstream_priority", default=None)
+
+
+@contextmanager
+def priority(level):
+    """Runs the block's upstream calls at `level` (INTERACTIVE or BACKGROUND)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default):
+    return _priority.get() or default
+
+
+class UpstreamError(Exception):
+    """An upstream call was refused locally; the service was not contacted."""
+
+    def __init__(self, service, message, retry_after=None):
+        super().__init__(f"{service}: {message}")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class QuotaExceededError(UpstreamError):
+    pass
+
+
+class OverloadedError(UpstreamError):
+    pass
+
+
+def _status_code(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_failure(exc):
+    """
+    Whether an exception says the upstream is unhealthy: timeouts,
+    connection errors, bad payloads, 429 and 5xx. Other 4xx responses are
+    our request's fault and don't count against the service.
+    """
+    status = _status_code(exc)
+    return status is None or status == 429 or status >= 500
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, reserve=0.2):
+        self.rate = float(rate)              # tokens per second
+        self.capacity = float(capacity)
+        self.reserve = reserve               # fraction kept for interactive calls
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, level):
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        floor = self.capacity * self.reserve if level == BACKGROUND else 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return 0.0
+            return (floor + 1 - self._tokens) / self.rate
+
+    def penalize(self, seconds):
+        """Upstream said slow down (429): no tokens for `seconds`."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            tokens = self._tokens
+        return {"tokens": round(tokens, 2), "capacity": self.capacity, "rate_per_hour": round(self.rate * 3600, 1)}
+
+
+class CircuitBreaker:
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_ratio=BREAKER_FAILURE_RATIO, open_seconds=BREAKER_OPEN_SECONDS):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def rejects(self):
+        """Cheap pre-check: open and not yet due for a probe."""
+        return self.state == "open" and self.retry_after() > 0
+
+    def allow(self):
+        """Whether a call may go out; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == "open":
+                if self.retry_after() > 0:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == "open":
+                return  # a call that started before the circuit opened
+            if self.state == "half_open":
+                self._probing = False
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "open": self.state == "open",
+            "retry_after": round(self.retry_after(), 1) if self.state == "open" else 0.0,
+            "recent_failures": self._outcomes.count(False),
+            "recent_calls": len(self._outcomes),
+            "opened": self.opened,
+        }
+
+
+class _Waiter:
+    """A queued slot request from a thread (Event) or an event loop (Future)."""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.granted = False
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial, min_limit, max_limit, latency_target, background_share=0.75):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.background_share = background_share
+        self.in_flight = 0
+        self._waiters = {INTERACTIVE: deque(), BACKGROUND: deque()}
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _capacity(self, level):
+        limit = int(self.limit)
+        return limit if level == INTERACTIVE else max(1, int(limit * self.background_share))
+
+    def _grantable(self, level):
+        if level == BACKGROUND and self._waiters[INTERACTIVE]:
+            return False
+        return not self._waiters[level] and self.in_flight < self._capacity(level)
+
+    def _wake(self):
+        for level in (INTERACTIVE, BACKGROUND):
+            queue = self._waiters[level]
+            while queue and self.in_flight < self._capacity(level):
+                self.in_flight += 1
+                queue.popleft().grant()
+            if queue:
+                return  # higher priority still waiting
+
+    def _enqueue(self, level, loop=None):
+        """Returns None if a slot was taken immediately, else a queued waiter."""
+        with self._lock:
+            if self._grantable(level):
+                self.in_flight += 1
+                return None
+            waiter = _Waiter(loop)
+            self._waiters[level].append(waiter)
+            return waiter
+
+    def _abandon(self, level, waiter):
+        """Timed out: leaves the queue. True if a slot was granted meanwhile."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters[level].remove(waiter)
+            return waiter.granted
+
+    def acquire(self, level, timeout):
+        waiter = self._enqueue(level)
+        if waiter is None or waiter.event.wait(timeout):
+            return True
+        return self._abandon(level, waiter)
+
+    async def aacquire(self, level, timeout):
+        waiter = self._enqueue(level, asyncio.get_running_loop())
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._abandon(level, waiter)
+        except asyncio.CancelledError:
+            if self._abandon(level, waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            now = time.monotonic()
+            if not ok or seconds > self.latency_target:
+                if now - self._last_decrease >= self.latency_target:
+                    self.limit = max(self.min_limit, self.limit * 0.75)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._wake()
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting_interactive": len(self._waiters[INTERACTIVE]),
+            "waiting_background": len(self._waiters[BACKGROUND]),
+            "latency_target": self.latency_target,
+        }
+
+
+class Upstream:
+    def __init__(self, name, quota, limiter, breaker=None,
+                 interactive_wait=UPSTREAM_INTERACTIVE_WAIT, background_wait=UPSTREAM_BACKGROUND_WAIT):
+        self.name = name
+        self.quota = quota
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.interactive_wait = interactive_wait
+        self.background_wait = background_wait
+        self._counters = {
+            "calls": 0, "failures": 0, "rejected_circuit": 0,
+            "rejected_quota": 0, "rejected_overload": 0, "seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _max_wait(self, level):
+        return self.interactive_wait if level == INTERACTIVE else self.background_wait
+
+    def _reject_if_open(self):
+        if self.breaker.rejects():
+            self._count("rejected_circuit")
+            retry = self.breaker.retry_after()
+            raise CircuitOpenError(self.name, f"circuit open, retry in {retry:.0f}s", retry)
+
+    def _quota_wait(self, level, waited, max_wait):
+        """Seconds to sleep before retrying the quota, or raises if over budget."""
+        wait = self.quota.try_take(level) if self.quota is not None else 0.0
+        if wait and (level == INTERACTIVE or waited + wait > max_wait):
+            self._count("rejected_quota")
+            raise QuotaExceededError(self.name, f"request quota exhausted, retry in {wait:.0f}s", wait)
+        return wait
+
+    def _overloaded(self, level, max_wait):
+        self._count("rejected_overload")
+        return OverloadedError(self.name, f"no {level} slot free within {max_wait}s")
+
+    def _claim(self):
+        if not self.breaker.allow():
+            self._count("rejected_circuit")
+            self.limiter.release()
+            retry = self.breaker.retry_after()
+            raise CircuitOpenError(self.name, "circuit half-open, probe in flight", retry)
+
+    def _finish(self, started, exc):
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            # Abandoned by the caller (lost hedge, client went away): says
+            # nothing about the upstream's health
+            self.limiter.release()
+            return
+        seconds = time.perf_counter() - started
+        failed = exc is not None and is_failure(exc)
+        self.breaker.record(not failed)
+        self.limiter.record(seconds, not failed)
+        if exc is not None and _status_code(exc) == 429 and self.quota is not None:
+            self.quota.penalize(_retry_after(exc) or 60.0)
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["seconds"] += seconds
+            if failed:
+                self._counters["failures"] += 1
+        self.limiter.release()
+
+    @contextmanager
+    def slot(self, level=None, max_wait=None):
+        """
+        Admission for one sync call; the block's exception decides the
+        outcome. `max_wait` overrides the priority's default wait (0 = only
+        if a slot is free right now).
+        """
+        level = current_priority(BACKGROUND) if level is None else level
+        max_wait = self._max_wait(level) if max_wait is None else max_wait
+        self._reject_if_open()
+        waited = 0.0
+        while True:
+            wait = self._quota_wait(level, waited, max_wait)
+            if not wait:
+                break
+            time.sleep(wait)
+            waited += wait
+        if not self.limiter.acquire(level, max_wait):
+            raise self._overloaded(level, max_wait)
+        self._claim()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+
+    @asynccontextmanager
+    async def aslot(self, level=None, max_wait=None):
+        """Async `slot`; also used around streamed responses."""
+        level = current_priority(INTERACTIVE) if level is None else level
+        max_wait = self._max_wait(level) if max_wait is None else max_wait
+        self._reject_if_open()
+        waited = 0.0
+        while True:
+            wait = self._quota_wait(level, waited, max_wait)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        if not await self.limiter.aacquire(level, max_wait):
+            raise self._overloaded(level, max_wait)
+        self._claim()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+
+    def call(self, fn, *args, **kwargs):
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    async def acall(self, fn, *args, **kwargs):
+        async with self.aslot():
+            return await fn(*args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        calls = counters.pop("calls")
+        seconds = counters.pop("seconds")
+        return {
+            "calls": calls,
+            "avg_seconds": round(seconds / calls, 4) if calls else 0.0,
+            **counters,
+            "breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+            "quota": self.quota.stats() if self.quota is not None else None,
+        }
+
+
+def _upstream(name, per_second, burst, latency_target, max_concurrency):
+    return Upstream(
+        name,
+        TokenBucket(per_second, burst) if per_second > 0 else None,
+        AdaptiveLimiter(
+            initial=max(1, max_concurrency // 2), min_limit=1,
+            max_limit=max_concurrency, latency_target=latency_target,
+        ),
+    )
+
+
+# AirNow allows 500 requests per hour per key; Groq's free tier 30 per minute.
+AIRNOW_QUOTA_PER_HOUR = float(os.getenv("AIRNOW_QUOTA_PER_HOUR", 500))
+GROQ_QUOTA_PER_MINUTE = float(os.getenv("GROQ_QUOTA_PER_MINUTE", 30))
+
+airnow = _upstream(
+    "airnow", AIRNOW_QUOTA_PER_HOUR / 3600.0, math.ceil(AIRNOW_QUOTA_PER_HOUR),
+    latency_target=float(os.getenv("AIRNOW_LATENCY_TARGET", 2.0)),
+    max_concurrency=int(os.getenv("AIRNOW_CONCURRENCY_MAX", 16)),
+)
+groq = _upstream(
+    "groq", GROQ_QUOTA_PER_MINUTE / 60.0, math.ceil(GROQ_QUOTA_PER_MINUTE),
+    latency_target=float(os.getenv("GROQ_LATENCY_TARGET", 8.0)),
+    max_concurrency=int(os.getenv("GROQ_CONCURRENCY_MAX", 16)),
+)
+
+
+def stats():
+    return {"airnow": airnow.stats(), "groq": groq.stats()}
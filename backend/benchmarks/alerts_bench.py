@@ -0,0 +1,79 @@
+"""
+Times bulk threshold evaluation for synthetic users.
+
+Run from backend/:  python -m benchmarks.alerts_bench --users 1000000 --locations 3000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.alerts import AlertEngine, POLLUTANTS, UserIndex
+
+
+class CountingDispatcher:
+    def __init__(self):
+        self.jobs = 0
+
+    def submit(self, jobs):
+        self.jobs += len(jobs)
+
+    def stats(self):
+        return {"jobs": self.jobs}
+
+
+def synthetic_records(n_users, n_locations, seed=0):
+    rng = np.random.default_rng(seed)
+    zips = rng.integers(0, n_locations, size=n_users)
+    thresholds = rng.choice([50, 100, 150], size=(n_users, len(POLLUTANTS)))
+    for i in range(n_users):
+        yield (
+            i,
+            f"{zips[i]:05d}",
+            dict(zip(POLLUTANTS, thresholds[i].tolist())),
+            {"email": True, "push": bool(i % 2), "sms": False},
+        )
+
+
+def synthetic_rows(n_locations, rng):
+    names = ("PM2.5", "PM10", "O3", "NO2")
+    aqi = rng.integers(10, 180, size=(n_locations, len(names)))
+    return {
+        f"{loc:05d}": [{"ParameterName": n, "AQI": int(aqi[loc, j])} for j, n in enumerate(names)]
+        for loc in range(n_locations)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--locations", type=int, default=3000)
+    parser.add_argument("--cycles", type=int, default=3)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = UserIndex.from_records(synthetic_records(args.users, args.locations), lambda z: z)
+    build_seconds = time.perf_counter() - start
+
+    engine = AlertEngine(lambda: iter(()), lambda z: z, CountingDispatcher())
+    engine.index = index
+    engine._active = np.zeros(index.thresholds.shape, dtype=bool)
+    engine._last_alert = np.full(len(index), -np.inf)
+    engine._loaded_at = float("inf")  # keep the synthetic index
+
+    rng = np.random.default_rng(1)
+    runs = []
+    for cycle in range(args.cycles):
+        # Cooldown elapsed between cycles, so only hysteresis limits re-alerts
+        runs.append(engine.evaluate(synthetic_rows(args.locations, rng), now=cycle * 86400.0))
+    print(json.dumps({
+        "users": args.users,
+        "locations": args.locations,
+        "index_build_seconds": round(build_seconds, 3),
+        "cycles": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
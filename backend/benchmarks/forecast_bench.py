@@ -0,0 +1,59 @@
+"""
+Times the batch forecast over a synthetic store.
+
+Run from backend/:  python -m benchmarks.forecast_bench --zips 10000 --days 365
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.forecast import forecast_store
+from app.trends_store import TrendsStore
+
+
+def synthetic_store(n_zips, n_days, pollutants=("pm25", "no2", "o3"), missing=0.05, seed=0):
+    """AR(2)-like daily series around a per-ZIP level, with random gaps."""
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64("2024-01-01") + np.arange(n_days)
+    values = {}
+    for p in pollutants:
+        level = rng.uniform(5, 60, size=(n_zips, 1))
+        series = np.zeros((n_zips, n_days))
+        noise = rng.normal(scale=3.0, size=(n_zips, n_days))
+        for t in range(2, n_days):
+            series[:, t] = 0.6 * series[:, t - 1] + 0.2 * series[:, t - 2] + noise[:, t]
+        matrix = (series + level).astype(np.float32)
+        matrix[rng.random(matrix.shape) < missing] = np.nan
+        values[p] = matrix
+    zips = [f"{i:05d}" for i in range(n_zips)]
+    return TrendsStore(dates, zips, zips, values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--zips", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    store = synthetic_store(args.zips, args.days)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = forecast_store(store)
+        timings.append(time.perf_counter() - start)
+    print(json.dumps({
+        "zips": args.zips,
+        "days": args.days,
+        "pollutants": list(result.models),
+        "seconds_min": round(min(timings), 4),
+        "seconds_median": round(float(np.median(timings)), 4),
+        "per_zip_us": round(min(timings) / args.zips * 1e6, 2),
+        "models": result.models,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmarks for the hot functions behind the endpoints: chat context
+building, historical data loading / trend encoding, and password hashing.
+
+Run from backend/:  python -m benchmarks.micro [--only build_context,json_load] [--output out.json]
+"""
+import argparse
+import json
+import os
+import platform
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+# The app modules read these at import time; no database is touched here.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SCHEDULER_INITIAL_DELAY", "3600")
+
+from benchmarks.load import git_revision  # noqa: E402
+
+DATA_PATH = Path(__file__).resolve().parents[1] / "historical_data.json"
+
+SAMPLE_ROWS = [
+    {"ParameterName": "PM2.5", "AQI": 42, "Category": "Good"},
+    {"ParameterName": "O3", "AQI": 61, "Category": "Moderate"},
+    {"ParameterName": "PM10", "AQI": 18, "Category": "Good"},
+]
+
+
+def bench_build_context():
+    import chatbotbackend
+    return lambda: chatbotbackend.build_context(SAMPLE_ROWS, "94103", "asthma", "jogging")
+
+
+def bench_json_load():
+    raw = DATA_PATH.read_bytes()
+    return lambda: json.loads(raw)
+
+
+def bench_trends_store():
+    from app.trends_store import TrendsStore
+    data = json.loads(DATA_PATH.read_bytes())
+    return lambda: TrendsStore.from_json_dict(data)
+
+
+def bench_legacy_trends():
+    from app.trends_store import TrendsStore
+    store = TrendsStore.from_json_dict(json.loads(DATA_PATH.read_bytes()))
+    zip_code = next(iter(store.zip_index))
+    return lambda: json.dumps(store.legacy_trends(zip_code), separators=(",", ":"))
+
+
+def bench_password_hash():
+    from app.core import get_password_hash
+    return lambda: get_password_hash("bench-password-1")
+
+
+def bench_password_verify():
+    from app.core import get_password_hash, verify_password
+    hashed = get_password_hash("bench-password-1")
+    return lambda: verify_password("bench-password-1", hashed)
+
+
+BENCHMARKS = {
+    "build_context": bench_build_context,
+    "json_load": bench_json_load,
+    "trends_store": bench_trends_store,
+    "legacy_trends": bench_legacy_trends,
+    "password_hash": bench_password_hash,
+    "password_verify": bench_password_verify,
+}
+
+
+def measure(func, repeat, min_seconds):
+    """Best and median per-call time (microseconds) over `repeat` timed runs."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_seconds / repeat and number < 10 ** 7:
+        number *= 10
+    runs = sorted(timer.repeat(repeat=repeat, number=number))
+    return {
+        "calls_per_run": number,
+        "best_us": round(runs[0] / number * 1e6, 3),
+        "median_us": round(runs[len(runs) // 2] / number * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", type=lambda s: s.split(","), default=list(BENCHMARKS),
+                        help=f"Comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Approximate time budget per benchmark")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.only:
+        results[name] = measure(BENCHMARKS[name](), args.repeat, args.min_seconds)
+        print(f"{name:<16} best {results[name]['best_us']:>12} us   median {results[name]['median_us']:>12} us")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps({
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "git": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "benchmarks": results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Local stand-ins for AirNow and Groq, for load tests that shouldn't touch
+(or pay for) the real APIs. Each stub has configurable latency, jitter and
+error rate. Point the app at them with AIRNOW_BASE_URL and GROQ_CHAT_URL.
+
+Run standalone from backend/:
+    python -m benchmarks.stubs --airnow-port 8701 --groq-port 8702 --groq-latency-ms 400
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATEGORIES = [(50, 1, "Good"), (100, 2, "Moderate"), (150, 3, "Unhealthy for Sensitive Groups"),
+              (200, 4, "Unhealthy"), (300, 5, "Very Unhealthy"), (500, 6, "Hazardous")]
+
+
+class StubConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self, scale=1.0):
+        with self._lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        seconds = max(0.0, self.latency_ms + jitter) * scale / 1000.0
+        if seconds:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+
+def _observations(zip_code=None, lat=None, lon=None):
+    """Deterministic per-location observations in AirNow's response shape."""
+    seed = zip_code or f"{lat:.2f},{lon:.2f}"
+    rng = random.Random(seed)
+    area = f"Stub Area {seed}"
+    lat = lat if lat is not None else 25 + rng.random() * 23
+    lon = lon if lon is not None else -124 + rng.random() * 57
+    now = time.gmtime()
+    rows = []
+    for parameter in ("PM2.5", "O3", "PM10"):
+        aqi = rng.randint(10, 180)
+        number, name = next((n, c) for bound, n, c in CATEGORIES if aqi <= bound)
+        rows.append({
+            "DateObserved": time.strftime("%Y-%m-%d ", now),
+            "HourObserved": now.tm_hour,
+            "LocalTimeZone": "UTC",
+            "ReportingArea": area,
+            "StateCode": "ZZ",
+            "Latitude": round(lat, 3),
+            "Longitude": round(lon, 3),
+            "ParameterName": parameter,
+            "AQI": aqi,
+            "Category": {"Number": number, "Name": name},
+        })
+    return rows
+
+
+class AirNowHandler(_Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.config.delay()
+        if self.config.should_fail():
+            return self._send_json(500, {"error": "stub failure"})
+        if url.path.startswith("/aq/observation/zipCode/current"):
+            return self._send_json(200, _observations(zip_code=query.get("zipCode", "00000")))
+        if url.path.startswith("/aq/observation/latLong/current"):
+            return self._send_json(200, _observations(
+                lat=float(query.get("latitude", 0)), lon=float(query.get("longitude", 0))
+            ))
+        self._send_json(404, {"error": f"unknown path {url.path}"})
+
+
+STUB_ANSWER = (
+    "Air quality is moderate right now. Sensitive groups should consider "
+    "shortening long or intense outdoor activities, and everyone else can "
+    "go about their day as usual."
+)
+
+
+class GroqHandler(_Handler):
+    def do_POST(self):
+        try:
+            payload = json.loads(self._read_body() or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+        if self.config.should_fail():
+            self.config.delay()
+            return self._send_json(503, {"error": {"message": "stub failure"}})
+        model = payload.get("model", "stub")
+        if payload.get("stream"):
+            return self._stream(model)
+        self.config.delay()
+        self._send_json(200, {
+            "id": "stub-completion",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": STUB_ANSWER},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240},
+        })
+
+    def _stream(self, model):
+        """SSE chunks, one word each; the latency is spread over the stream."""
+        words = STUB_ANSWER.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.config.delay(0.3)  # time to first token
+        for i, word in enumerate(words):
+            chunk = {"id": "stub-completion", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self.config.delay(0.7 / len(words))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class StubServer:
+    """Runs one handler class on a background ThreadingHTTPServer."""
+
+    def __init__(self, handler, config, host="127.0.0.1", port=0):
+        handler_class = type(handler.__name__, (handler,), {"config": config})
+        self.config = config
+        self.server = ThreadingHTTPServer((host, port), handler_class)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True,
+                                        name=f"stub-{self.server.server_address[1]}")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stubs(airnow=None, groq=None, host="127.0.0.1", airnow_port=0, groq_port=0):
+    """Starts both stubs; returns (airnow_server, groq_server)."""
+    return (
+        StubServer(AirNowHandler, airnow or StubConfig(), host, airnow_port).start(),
+        StubServer(GroqHandler, groq or StubConfig(), host, groq_port).start(),
+    )
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--airnow-latency-ms", type=float, default=50.0)
+    parser.add_argument("--airnow-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--airnow-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-latency-ms", type=float, default=400.0)
+    parser.add_argument("--groq-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def configs_from_args(args):
+    return (
+        StubConfig(args.airnow_latency_ms, args.airnow_jitter_ms, args.airnow_error_rate, args.seed),
+        StubConfig(args.groq_latency_ms, args.groq_jitter_ms, args.groq_error_rate, args.seed + 1),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--airnow-port", type=int, default=8701)
+    parser.add_argument("--groq-port", type=int, default=8702)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    airnow_config, groq_config = configs_from_args(args)
+    airnow, groq = start_stubs(airnow_config, groq_config, args.host, args.airnow_port, args.groq_port)
+    print(f"AIRNOW_BASE_URL={airnow.url}")
+    print(f"GROQ_CHAT_URL={groq.url}/openai/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        airnow.stop()
+        groq.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import os
-import requests
-import csv
+import re
 import time
 import threading
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+from app import airnow
+from app.aqi_cache import LiveAQICache
+from app.cache import LRUCache
+from app import intents
+from app import llm
+from app import metrics
+from app import upstream
+from app.live_store import LiveObservationStore
+from app.geo import ZipResolver, is_area_key
+from app.scheduler import LeaderLock, LeaderScheduler, SharedSnapshot
 # --- Cell 2: Configuration & Logging ---
 
 # Set your API keys
@@ -15,14 +24,44 @@ USERS_CSV = "users.csv"
 DAILY_AQI_CSV = "daily_aqi.csv"
 LIVE_AQI_FILE = "live_aqi.csv"   # ✅ add this line
 LOG_FILE = "aqi_chatbot.log"
+# Cross-worker scheduler coordination (see app/scheduler.py)
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "aqi_scheduler.lock")
+SHARED_AQI_DB = os.getenv("SHARED_AQI_DB", "live_aqi_shared.sqlite")
+
+# ZIP -> nearest AirNow reporting area (see app/geo.py)
+ZIP_CENTROIDS_PATH = os.getenv("ZIP_CENTROIDS_PATH", "zip_centroids.csv")
+REPORTING_AREAS_FILE = os.getenv("REPORTING_AREAS_FILE", "reporting_areas.csv")
+AQI_AREA_MAX_KM = float(os.getenv("AQI_AREA_MAX_KM", 50))
+
+# Ingested TEMPO satellite granules (see app/tempo.py); only granules
+# newer than TEMPO_MAX_AGE_HOURS are used as chat context.
+TEMPO_DATA_DIR = os.getenv("TEMPO_DATA_DIR", "tempo_data")
+TEMPO_MAX_AGE_HOURS = float(os.getenv("TEMPO_MAX_AGE_HOURS", 6))
+TEMPO_VARIABLES = ("no2", "o3")
+
+# Observation history with hourly/daily/monthly rollups (see app/history.py)
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+# Last closed day fed into the historical trends
+TRENDS_FED_MARKER = os.path.join(HISTORY_DIR, "trends_fed_through")
+
+# Evaluate users' AQI thresholds after each refresh (see app/alerts.py)
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Live AQI cache TTL (AirNow updates observations hourly)
+LIVE_AQI_TTL = int(os.getenv("LIVE_AQI_TTL", 3600))
+# How often the live observation snapshot is persisted to LIVE_AQI_FILE
+LIVE_AQI_FLUSH_SECONDS = int(os.getenv("LIVE_AQI_FLUSH_SECONDS", 60))
+
+# LLM answer cache (answers depend on the hourly AQI snapshot)
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2048))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", 8 * 1024 * 1024))
 
 # AirNow endpoints
 AIRNOW_BASE = "https://www.airnowapi.org/aq/forecast"
 OBS_BASE    = "https://www.airnowapi.org/aq/observation"
 
-# Groq API endpoint
-GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
-
 # Simple logger
 def log(msg: str):
     stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
@@ -35,65 +74,146 @@ def log(msg):
     ts = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
     print(f"{ts} {msg}")
 
-def fetch_live_aqi_by_zip(zip_code):
-    """Fetch live AQI data from AirNow API for a given ZIP code."""
-    url = "https://www.airnowapi.org/aq/observation/zipCode/current/"
-    params = {
-        "format": "application/json",
-        "zipCode": zip_code,
-        "API_KEY": AIRNOW_API_KEY
-    }
+# Neighbouring ZIPs share a reporting area, so live AQI is cached and
+# refreshed per area; ZIPs without a known nearby area fall back to
+# their own key until an AirNow response teaches us their area.
+zip_resolver = ZipResolver(ZIP_CENTROIDS_PATH, REPORTING_AREAS_FILE, max_km=AQI_AREA_MAX_KM)
+
+def live_aqi_key(zip_code):
+    """Cache key for a ZIP's live AQI: its reporting area, or the ZIP itself."""
+    return zip_resolver.key_for_zip(zip_code)
+
+def _learn_areas(rows):
+    if zip_resolver.learn(rows):
+        zip_resolver.save()
+
+def fetch_aqi_for_key(key):
+    """Fetches live AQI for a ZIP or reporting-area key. Raises on failure."""
+    if is_area_key(key):
+        area = zip_resolver.area(key)
+        if area is None:
+            raise ValueError(f"Unknown reporting area {key}")
+        rows = airnow.fetch_observations_latlong(area.lat, area.lon)
+    else:
+        rows = airnow.fetch_observations(key)
+    _learn_areas(rows)
+    return rows
+
+async def fetch_aqi_for_key_async(key):
+    if is_area_key(key):
+        area = zip_resolver.area(key)
+        if area is None:
+            raise ValueError(f"Unknown reporting area {key}")
+        rows = await airnow.fetch_observations_latlong_async(area.lat, area.lon)
+    else:
+        rows = await airnow.fetch_observations_async(key)
+    _learn_areas(rows)
+    return rows
+
+def fetch_live_aqi(key):
+    """Fetch live AQI data from AirNow for a cache key (ZIP or reporting area)."""
     try:
-        r = requests.get(url, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        rows = []
-        for item in data:
-            rows.append({
-                "DateObserved": item.get("DateObserved"),
-                "ReportingArea": item.get("ReportingArea"),
-                "StateCode": item.get("StateCode"),
-                "ParameterName": item.get("ParameterName"),
-                "AQI": item.get("AQI"),
-                "Category": item["Category"]["Name"]
-            })
-        return rows
+        return fetch_aqi_for_key(key)
     except Exception as e:
-        log(f"Error fetching live AQI for {zip_code}: {e}")
+        log(f"Error fetching live AQI for {key}: {e}")
         return []
-    
-def overwrite_live_aqi_csv(rows):
-    """Save rows to live_aqi.csv."""
-    if not rows:
-        log("⚠️ No data to write to CSV.")
-        return
-    with open(LIVE_AQI_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-        writer.writeheader()
-        writer.writerows(rows)
-    log(f"✅ Updated {LIVE_AQI_FILE} with {len(rows)} rows.")
 
+async def fetch_live_aqi_async(key):
+    """Async version of fetch_live_aqi for the chat endpoints."""
+    try:
+        return await fetch_aqi_for_key_async(key)
+    except Exception as e:
+        log(f"Error fetching live AQI for {key}: {e}")
+        return []
 
-def daily_airnow_job(zip_list):
-    """Fetch live AQI for all ZIPs and update CSV."""
-    log("Running daily AirNow live data job ...")
-    all_rows = []
-    for z in zip_list:
-        rows = fetch_live_aqi_by_zip(z)
-        all_rows.extend(rows)
-        time.sleep(0.3)
-    overwrite_live_aqi_csv(all_rows)
-    log("Live AQI fetch complete.")
-
-
-def schedule_daily_job(zip_list, interval_hours=1):
-    """Run the live AQI update every given hours."""
-    def loop():
-        while True:
-            daily_airnow_job(zip_list)
-            time.sleep(interval_hours * 3600)
-    threading.Thread(target=loop, daemon=True).start()
-    log(f"Scheduler started (updates every {interval_hours} hours).")
+def fetch_live_aqi_by_zip(zip_code):
+    """Fetch live AQI data from AirNow API for a given ZIP code."""
+    return fetch_live_aqi(live_aqi_key(zip_code))
+
+# Latest observations per ZIP/pollutant, flushed to LIVE_AQI_FILE in the background.
+live_store = LiveObservationStore(LIVE_AQI_FILE, flush_interval=LIVE_AQI_FLUSH_SECONDS)
+
+# Shared cache in front of AirNow; the periodic job keeps it warm. Its
+# fetchers raise so that failures fall back to the last known rows.
+live_aqi_cache = LiveAQICache(
+    fetch_aqi_for_key,
+    ttl=LIVE_AQI_TTL,
+    store=live_store,
+    afetch=fetch_aqi_for_key_async,
+)
+
+def live_aqi_freshness(zip_code, rows):
+    """
+    How current the rows served for a ZIP are: `stale` once they are older
+    than the TTL (or were recovered from the live store), with their age.
+    """
+    age = live_aqi_cache.age(live_aqi_key(zip_code))
+    return {
+        "stale": bool(rows) and (age is None or age >= live_aqi_cache.ttl),
+        "data_age_seconds": int(age) if rows and age is not None else None,
+    }
+
+
+_tempo_store = None
+
+def get_tempo_store():
+    global _tempo_store
+    if _tempo_store is None:
+        # Imported here so NumPy isn't loaded at app import (cold start).
+        from app.tempo import TempoStore
+        _tempo_store = TempoStore(TEMPO_DATA_DIR)
+    return _tempo_store
+
+def satellite_context(zip_code):
+    """
+    Latest TEMPO column values at the ZIP centroid, or None. Served from
+    the store's in-memory granule index; no directory listing per request.
+    """
+    point = zip_resolver.centroid(zip_code)
+    if point is None:
+        return None
+    from app.tempo import LABELS
+    tempo_store = get_tempo_store()
+    max_age = timedelta(hours=TEMPO_MAX_AGE_HOURS)
+    parts = []
+    for variable in TEMPO_VARIABLES:
+        try:
+            granule, values = tempo_store.sample_latest(variable, [point[0]], [point[1]], max_age)
+        except Exception as e:
+            log(f"TEMPO sampling failed for {variable}: {e}")
+            continue
+        if granule is None or values[0] != values[0]:  # missing or NaN
+            continue
+        units = f" {granule.units}" if granule.units else ""
+        parts.append(
+            f"{LABELS[variable]} {values[0]:.3g}{units} ({granule.time:%Y-%m-%d %H:%M} UTC)"
+        )
+    return "Satellite (TEMPO): " + "; ".join(parts) if parts else None
+
+def forecast_context(zip_code):
+    """
+    Next days' forecast for the ZIP, if the historical data is loaded and
+    covers it. Never loads data or fits models on the request path; the
+    forecast is warmed at startup and recomputed in the background when
+    the data changes.
+    """
+    from app.routes.data import historical_loader
+    from app.forecast import forecast_engine
+
+    store = historical_loader.peek()
+    if store is None or zip_code not in store:
+        return None
+    forecast = forecast_engine.get_nowait(store)
+    if forecast is None or forecast.issued is None or zip_code not in forecast:
+        return None
+    if forecast.is_stale():
+        # Never pass past days off as a forecast
+        return f"Forecast: unavailable (historical data is stale; it ends {forecast.issued})."
+    days = []
+    for point in forecast.points(zip_code):
+        values = ", ".join(f"{p}={point[p]}" for p in forecast.values if point[p] is not None)
+        days.append(f"{point['label']}: {values}")
+    return "Forecast (daily averages): " + "; ".join(days) if days else None
 
 def build_context(aqi_rows, zip_code, health_issue=None, activity=None):
     if not aqi_rows:
@@ -104,6 +224,12 @@ def build_context(aqi_rows, zip_code, health_issue=None, activity=None):
         lines.append(f"{r['ParameterName']}={r['AQI']} ({r['Category']})")
 
     context = f"Current AQI for ZIP {zip_code}: " + "; ".join(lines)
+    satellite = satellite_context(zip_code)
+    if satellite:
+        context += f"\n{satellite}"
+    forecast = forecast_context(zip_code)
+    if forecast:
+        context += f"\n{forecast}"
     if health_issue:
         context += f"\nUser health condition: {health_issue}"
     if activity:
@@ -112,33 +238,136 @@ def build_context(aqi_rows, zip_code, health_issue=None, activity=None):
 
 # --- Cell 7: Groq AI Call ---
 
-import requests
+# Completions go through the LLM gateway (see app/llm.py): pooled
+# keep-alive clients, the Groq in-flight limit, hedging and model fallback.
+GROQ_MODEL = llm.LLM_MODEL
 
-def call_groq(system_prompt, user_question, context_text, model="llama-3.1-8b-instant"):
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Context:\n{context_text}"},
-            {"role": "user", "content": user_question}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 800
-    }
+def call_groq(system_prompt, user_question, context_text, model=None):
+    """Blocking completion; `model=None` lets the gateway pick (primary or fallback)."""
+    return llm.gateway.complete(system_prompt, user_question, context_text, model)
+
+async def call_groq_async(system_prompt, user_question, context_text, model=None):
+    return await llm.gateway.acomplete(system_prompt, user_question, context_text, model)
+
+def stream_groq(system_prompt, user_question, context_text, model=None):
+    """Yields answer text chunks as Groq streams them (OpenAI-style SSE)."""
+    return llm.gateway.astream(system_prompt, user_question, context_text, model)
 
-    # ✅ Corrected variable name
-    response = requests.post(GROQ_CHAT_URL, headers=headers, json=payload, timeout=30)
+# --- LLM answer cache ---
 
-    if not response.ok:
-        print("❌ Groq Error:", response.status_code, response.text)
-        response.raise_for_status()
+answer_cache = LRUCache(
+    maxsize=ANSWER_CACHE_MAX_ENTRIES,
+    ttl=ANSWER_CACHE_TTL,
+    max_bytes=ANSWER_CACHE_MAX_BYTES,
+    sizeof=lambda answer: len(answer.encode("utf-8")),
+)
+# Upstream time spent on cache misses, used to estimate time saved by hits.
+answer_cache_latency = {"llm_calls": 0, "llm_seconds": 0.0, "saved_seconds": 0.0}
 
-    data = response.json()
-    return data["choices"][0]["message"]["content"]
+def _normalize_text(text):
+    text = re.sub(r"[^a-z0-9\s]", " ", (text or "").lower())
+    return " ".join(text.split())
+
+def answer_cache_key(question, aqi_rows, zip_code, health_issue=None, activity=None):
+    """
+    Key for a cached answer. AQI values are bucketed by category so that
+    small changes within e.g. "Moderate" still reuse the same answer.
+    """
+    aqi_bucket = tuple(sorted((r["ParameterName"], r["Category"]) for r in aqi_rows))
+    return (
+        _normalize_text(question),
+        zip_code,
+        aqi_bucket,
+        _normalize_text(health_issue),
+        _normalize_text(activity),
+    )
+
+def cached_answer(key):
+    answer = answer_cache.get(key)
+    if answer is not None and answer_cache_latency["llm_calls"]:
+        answer_cache_latency["saved_seconds"] += (
+            answer_cache_latency["llm_seconds"] / answer_cache_latency["llm_calls"]
+        )
+    return answer
+
+def store_answer(key, answer, seconds):
+    answer_cache_latency["llm_calls"] += 1
+    answer_cache_latency["llm_seconds"] += seconds
+    answer_cache.set(key, answer)
+
+def answer_cache_stats():
+    stats = answer_cache.stats()
+    calls = answer_cache_latency["llm_calls"]
+    stats["avg_llm_seconds"] = round(answer_cache_latency["llm_seconds"] / calls, 4) if calls else 0.0
+    stats["saved_seconds"] = round(answer_cache_latency["saved_seconds"], 4)
+    stats["max_bytes"] = answer_cache.max_bytes
+    stats["ttl_seconds"] = answer_cache.ttl
+    return stats
+
+# --- Rule-based fast path ---
+
+# How each answer was produced: fast path, answer cache, LLM, or the
+# rule-based fallback after an LLM error.
+ANSWER_PATHS = ("fast", "cache", "llm", "error")
+answer_path_stats = {}
+for _path in ANSWER_PATHS:
+    answer_path_stats.update({_path: 0, f"{_path}_seconds": 0.0})
+
+def fast_path_answer(question, aqi_rows, zip_code, health_issue=None, activity=None):
+    """Answers simple AQI lookups from the rows without calling the LLM."""
+    if health_issue or activity:
+        return None  # personalised advice needs the LLM
+    intent, pollutant = intents.classify_question(question, zip_code)
+    return intents.answer_from_rows(intent, aqi_rows, zip_code, pollutant)
+
+def record_answer_path(path, seconds):
+    answer_path_stats[path] += 1
+    answer_path_stats[f"{path}_seconds"] += seconds
+
+LLM_UNAVAILABLE_NOTE = "(Personalised advice is temporarily unavailable; this is the latest reading.)"
+
+def degraded_answer(question, aqi_rows, zip_code, error):
+    """
+    Rule-based answer used when the LLM call fails or is refused (circuit
+    open, quota exhausted, overloaded), so users still get the reading.
+    """
+    log(f"LLM unavailable, answering from rules: {error}")
+    intent, pollutant = intents.classify_question(question, zip_code)
+    answer = (
+        intents.answer_from_rows(intent, aqi_rows, zip_code, pollutant)
+        or intents.answer_from_rows(intents.CURRENT_AQI, aqi_rows, zip_code)
+    )
+    if answer is None:
+        return "Sorry, I can’t answer right now: air quality data is temporarily unavailable. Please try again shortly."
+    return f"{answer}\n\n{LLM_UNAVAILABLE_NOTE}"
+
+# --- Chat pipeline timings ---
+# One histogram per stage so a slow /chat/ request can be attributed:
+# live AQI lookup, rule-based fast path, answer cache, context building,
+# LLM call, and the whole pipeline.
+
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "chat_stage_duration_seconds", "Time spent in each chat pipeline stage.", ("stage",),
+)
+CHAT_ANSWERS = metrics.counter("chat_answers_total", "Chat answers by how they were produced.", ("path",))
+_stages = {
+    stage: CHAT_STAGE_SECONDS.labels(stage)
+    for stage in ("live_aqi", "fast_path", "answer_cache", "build_context", "llm", "total")
+}
+_answer_paths = {path: CHAT_ANSWERS.labels(path) for path in ANSWER_PATHS}
+
+def _stage_done(stage, started):
+    """Records a stage that began at `started`; returns the current time."""
+    now = time.perf_counter()
+    _stages[stage].observe(now - started)
+    return now
+
+def answer_path_summary():
+    summary = dict(answer_path_stats)
+    for path in ANSWER_PATHS:
+        count = summary[path]
+        summary[f"{path}_avg_seconds"] = round(summary[f"{path}_seconds"] / count, 6) if count else 0.0
+    return summary
 
 DEFAULT_SYSTEM_PROMPT = """You are a helpful air quality assistant.
 You answer air quality questions clearly, concisely, and naturally.
@@ -147,6 +376,42 @@ If the user asks about a different location, use that location instead of their
 Do not mention data sources or APIs in your answer.
 """
 
+def resolve_active_zip(zip_code=None, user_profile=None):
+    """Priority: direct argument > user_profile ZIP > default."""
+    if zip_code:
+        return zip_code
+    if user_profile and user_profile.get("zip_code"):
+        return user_profile["zip_code"]
+    return "94103"  # fallback if nothing else given
+
+def _answer_done(path, start, received):
+    """Records how an answer was produced and the whole pipeline's time."""
+    record_answer_path(path, time.perf_counter() - start)
+    _answer_paths[path].inc()
+    _stage_done("total", received)
+
+def _answer_without_llm(question, aqi_data, active_zip, health_issue, activity, received):
+    """
+    Stages shared by every chat handler once the live AQI is fetched:
+    the rule-based fast path, then the answer cache. Returns
+    (answer, key, start, stage); when answer is None the caller calls the
+    LLM with `build_context`, stores its answer under `key` and finishes
+    with `_answer_done`.
+    """
+    start = _stage_done("live_aqi", received)
+    answer = fast_path_answer(question, aqi_data, active_zip, health_issue, activity)
+    stage = _stage_done("fast_path", start)
+    if answer is not None:
+        _answer_done("fast", start, received)
+        return answer, None, start, stage
+
+    key = answer_cache_key(question, aqi_data, active_zip, health_issue, activity)
+    answer = cached_answer(key)
+    stage = _stage_done("answer_cache", stage)
+    if answer is not None:
+        _answer_done("cache", start, received)
+    return answer, key, start, stage
+
 def handle_user_question(user_id, question, zip_code=None, health_issue=None, activity=None, user_profile=None):
     """
     Main chatbot handler.
@@ -154,30 +419,114 @@ def handle_user_question(user_id, question, zip_code=None, health_issue=None, ac
     - user_profile: dict that may include 'zip_code' for default location
     """
 
-    # 1️⃣ Determine which ZIP to use
-    active_zip = None
+    received = time.perf_counter()
 
-    # Priority: direct argument > user_profile ZIP > default
-    if zip_code:
-        active_zip = zip_code
-    elif user_profile and "zip_code" in user_profile:
-        active_zip = user_profile["zip_code"]
-    else:
-        active_zip = "94103"  # fallback if nothing else given
+    # 1️⃣ Determine which ZIP to use
+    active_zip = resolve_active_zip(zip_code, user_profile)
 
     # 2️⃣ Fetch live AQI for that ZIP
-    aqi_data = fetch_live_aqi_by_zip(active_zip)
-    overwrite_live_aqi_csv(aqi_data)
+    aqi_data = live_aqi_cache.get(live_aqi_key(active_zip))
 
-    # 3️⃣ Build context and call Groq
+    # 3️⃣ Answer from the data or a cached answer when possible
+    answer, key, start, stage = _answer_without_llm(question, aqi_data, active_zip, health_issue, activity, received)
+    if answer is not None:
+        return answer
+
+    # 4️⃣ Build context and call Groq
     context = build_context(aqi_data, active_zip, health_issue, activity)
+    llm_start = _stage_done("build_context", stage)
     try:
         answer = call_groq(DEFAULT_SYSTEM_PROMPT, question, context)
+        store_answer(key, answer, time.perf_counter() - llm_start)
+        path = "llm"
     except Exception as e:
-        answer = f"Sorry, I couldn’t generate an answer: {e}"
+        answer = degraded_answer(question, aqi_data, active_zip, e)
+        path = "error"
+    _stage_done("llm", llm_start)
+    _answer_done(path, start, received)
 
     return answer  #cell 8 old
 
+async def handle_user_question_async(question, zip_code=None, health_issue=None, activity=None, user_profile=None,
+                                     status=None):
+    """
+    Non-blocking version of handle_user_question for the FastAPI event loop.
+    Returns (answer, active_zip). If a `status` dict is given it is filled
+    with the data's freshness (`stale`, `data_age_seconds`) and `degraded`
+    ("llm_unavailable" when the answer fell back to the rules).
+    """
+    status = {} if status is None else status
+    received = time.perf_counter()
+    active_zip = resolve_active_zip(zip_code, user_profile)
+    aqi_data = await live_aqi_cache.aget(live_aqi_key(active_zip))
+    status.update(live_aqi_freshness(active_zip, aqi_data))
+
+    answer, key, start, stage = _answer_without_llm(question, aqi_data, active_zip, health_issue, activity, received)
+    if answer is not None:
+        return answer, active_zip
+
+    context = build_context(aqi_data, active_zip, health_issue, activity)
+    llm_start = _stage_done("build_context", stage)
+    try:
+        answer = await call_groq_async(DEFAULT_SYSTEM_PROMPT, question, context)
+        store_answer(key, answer, time.perf_counter() - llm_start)
+        path = "llm"
+    except Exception as e:
+        answer = degraded_answer(question, aqi_data, active_zip, e)
+        status["degraded"] = "llm_unavailable"
+        path = "error"
+    _stage_done("llm", llm_start)
+    _answer_done(path, start, received)
+    return answer, active_zip
+
+async def stream_user_question(question, zip_code=None, health_issue=None, activity=None, user_profile=None,
+                               status=None):
+    """
+    Streaming version of handle_user_question.
+    Returns (active_zip, async iterator of answer chunks). `status` is
+    filled as in handle_user_question_async; `degraded` is only known once
+    the iterator is exhausted.
+    """
+    status = {} if status is None else status
+    received = time.perf_counter()
+    active_zip = resolve_active_zip(zip_code, user_profile)
+    aqi_data = await live_aqi_cache.aget(live_aqi_key(active_zip))
+    status.update(live_aqi_freshness(active_zip, aqi_data))
+
+    answer, key, start, stage = _answer_without_llm(question, aqi_data, active_zip, health_issue, activity, received)
+    if answer is not None:
+        async def whole():
+            yield answer
+        return active_zip, whole()
+
+    context = build_context(aqi_data, active_zip, health_issue, activity)
+    llm_start = _stage_done("build_context", stage)
+
+    async def chunks():
+        parts = []
+        path = "llm"
+        try:
+            async for chunk in stream_groq(DEFAULT_SYSTEM_PROMPT, question, context):
+                parts.append(chunk)
+                yield chunk
+            # Only complete, non-empty answers are cached (a failed or
+            # disconnected stream never gets here)
+            answer = "".join(parts)
+            if answer:
+                store_answer(key, answer, time.perf_counter() - llm_start)
+        except Exception as e:
+            path = "error"
+            status["degraded"] = "llm_unavailable"
+            if parts:
+                log(f"Groq stream failed mid-answer: {e}")
+                yield f"\n\n{LLM_UNAVAILABLE_NOTE}"
+            else:
+                yield degraded_answer(question, aqi_data, active_zip, e)
+        _stage_done("llm", llm_start)
+        _answer_done(path, start, received)
+
+    return active_zip, chunks()
+
 # --- Cell 9: Scheduler for Live AQI Updates ---
 
 import threading, time
@@ -186,32 +535,234 @@ import threading, time
 # These are just fallback locations — the chatbot will still fetch user-specific ZIP data on demand.
 DEFAULT_ZIPS = ["94103", "10001", "90001", "60601"]  # SF, NYC, LA, Chicago (example cities)
 
+# Results of the leader's refresh, shared with every worker process.
+shared_snapshot = None
+scheduler = None
+
+# Called with the refresh summary after every successful refresh, and in
+# follower workers with {"synced": n} after they pull the leader's results
+# (e.g. tile pre-rendering, see app/routes/tiles.py).
+refresh_listeners = []
+
+def notify_refresh_listeners(summary):
+    for listener in refresh_listeners:
+        try:
+            listener(summary)
+        except Exception as e:
+            log(f"Refresh listener failed: {e}")
+
+_alert_engine = None
+
+def get_alert_engine():
+    global _alert_engine
+    if _alert_engine is None:
+        # Imported here so NumPy isn't loaded at app import (cold start).
+        from app.alerts import AlertDispatcher, AlertEngine, load_user_records
+        # Hysteresis/cooldown state lives in the shared SQLite file, so it
+        # survives restarts and leader failover
+        _alert_engine = AlertEngine(
+            load_user_records, live_aqi_key, AlertDispatcher(), state=shared_snapshot,
+        )
+    return _alert_engine
+
+def alert_location_keys():
+    """Loads users (if stale) and returns the cache keys they live in."""
+    if not ALERTS_ENABLED:
+        return []
+    try:
+        engine = get_alert_engine()
+        engine.refresh_users()
+        return engine.location_keys()
+    except Exception as e:
+        log(f"Loading alert users failed: {e}")
+        return []
+
+def run_alerts(rows_by_key):
+    if not ALERTS_ENABLED:
+        return None
+    try:
+        summary = get_alert_engine().evaluate(rows_by_key)
+        log(
+            f"Alerts: {summary['users']} users checked in {summary.get('eval_seconds', 0)}s, "
+            f"{summary['alerts']} alerted ({summary['jobs']} notifications queued)."
+        )
+        return summary
+    except Exception as e:
+        log(f"Alert evaluation failed: {e}")
+
+_history_store = None
+
+def get_history_store():
+    global _history_store
+    if _history_store is None:
+        # Imported here so NumPy isn't loaded at app import (cold start).
+        from app.history import HistoryStore
+        _history_store = HistoryStore(HISTORY_DIR)
+    return _history_store
+
+def _trends_fed_through():
+    try:
+        with open(TRENDS_FED_MARKER, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def feed_trends(history, touched):
+    """
+    Appends closed days' daily rollups to the historical trends (through
+    the loader's updates file, so every worker picks them up). Today's
+    partial mean is never fed; a day is fed once after it closes, plus
+    again if late observations for it arrive (appends overwrite by day).
+    """
+    from app.history import trend_rows
+    from app.routes.data import historical_loader
+    from app.trends_store import SATELLITE_PREFIX
+
+    today = date.today().isoformat()
+    fed_through = _trends_fed_through()
+    days = {d for d in history.partitions() if d < today and (fed_through is None or d > fed_through)}
+    days |= {d for d in touched if d < today}
+    if not days:
+        return 0
+
+    store = historical_loader.get()
+    columns = {p for p in store.values if not p.startswith(SATELLITE_PREFIX)}
+    # ZIPs we already chart, plus ZIP keys fetched directly
+    zips = set(store.zips) | {k for keys in touched.values() for k in keys if not is_area_key(k)}
+    records = []
+    for day in sorted(days):
+        for zip_code, row in trend_rows(history, day, zips, live_aqi_key, columns).items():
+            records.append({"zip": zip_code, **row})
+    historical_loader.append_records(records)
+    last = max(days)
+    if fed_through is None or last > fed_through:
+        os.makedirs(os.path.dirname(TRENDS_FED_MARKER) or ".", exist_ok=True)
+        with open(TRENDS_FED_MARKER, "w", encoding="utf-8") as f:
+            f.write(last)
+    return len(records)
+
+def record_history(rows_by_key):
+    """Appends a refresh to the history store and feeds the trends."""
+    if not HISTORY_ENABLED:
+        return None
+    try:
+        history = get_history_store()
+        touched = history.append(rows_by_key)
+        fed = feed_trends(history, touched) if touched else 0
+        log(
+            f"History: {sum(len(rows) for rows in rows_by_key.values())} observations over "
+            f"{len(touched)} day(s) in {history.last_append_seconds}s, {fed} trend rows updated."
+        )
+        return touched
+    except Exception as e:
+        log(f"History append failed: {e}")
+
 def daily_airnow_job(zip_list):
-    """Fetch latest live AQI data for each ZIP in the list."""
+    """
+    Fetch latest live AQI data for each ZIP in the list. Raises if the job
+    fails or every fetch failed, so the scheduler doesn't record the
+    refresh as done.
+    """
     try:
         log("Running daily AirNow fetch job ...")
-        all_rows = []
-        for z in zip_list:
-            try:
-                data = fetch_live_aqi_by_zip(z)
-                all_rows.extend(data)
-                time.sleep(0.3)
-            except Exception as e:
-                log(f"ZIP {z} failed: {e}")
-        overwrite_live_aqi_csv(all_rows)
-        log("Daily AirNow fetch complete.")
+        # Also refresh the keys users have asked about recently (in any
+        # worker) so the caches stay warm. ZIPs collapse onto their
+        # reporting area, so each area is fetched once however many ZIPs
+        # map to it.
+        watched = shared_snapshot.watched(max_age=24 * 3600) if shared_snapshot else []
+        keys = list(zip_list) + served_keys() + watched + alert_location_keys()
+        keys = list(dict.fromkeys(k if is_area_key(k) else live_aqi_key(k) for k in keys))
+        rows_by_zip, stats = airnow.fetch_many(keys, fetch=fetch_aqi_for_key)
+        for z, info in stats["per_zip"].items():
+            if info["error"]:
+                log(f"Key {z} failed: {info['error']}")
+        if stats["zips"] and stats["errors"] == stats["zips"]:
+            raise RuntimeError(f"all {stats['zips']} AirNow fetches failed")
+        live_aqi_cache.warm(rows_by_zip)
+        if shared_snapshot is not None:
+            shared_snapshot.publish(rows_by_zip)
+        live_store.flush()
+        record_history(rows_by_zip)
+        run_alerts(rows_by_zip)
+        notify_refresh_listeners(stats)
+        log(
+            f"Daily AirNow fetch complete: {stats['zips']} keys, {stats['errors']} errors, "
+            f"{stats['wall_seconds']}s wall ({stats['sum_request_seconds']}s of requests "
+            f"at concurrency {stats['concurrency']})."
+        )
+        return stats
     except Exception as e:
         log(f"Daily job failed: {e}")
+        raise
 
-def schedule_daily_job(zip_list=DEFAULT_ZIPS, interval_hours=24):
-    """Start a background thread that updates AQI data periodically."""
-    def loop():
-        while True:
-            daily_airnow_job(zip_list)
-            time.sleep(interval_hours * 3600)
-    threading.Thread(target=loop, daemon=True).start()
-    log(f"Scheduler started (runs every {interval_hours} hours).")
+def served_keys():
+    """
+    Keys this worker was asked about within the cache's TTL + stale window.
+    Idle keys are evicted first, so a ZIP asked about once stops being
+    refreshed (and registered with the leader) after that window.
+    """
+    live_aqi_cache.evict_idle()
+    return live_aqi_cache.requested_keys()
 
-# Start automatic live AQI updates every 3 hours
-schedule_daily_job(DEFAULT_ZIPS, interval_hours=3)
+def apply_shared_update(key, rows, fetched_at):
+    """Takes in rows the leader published (and the areas they reveal)."""
+    zip_resolver.learn(rows)
+    live_aqi_cache.put(key, rows, fetched_at)
 
+def schedule_daily_job(zip_list=DEFAULT_ZIPS, interval_hours=24, initial_delay=0):
+    """
+    Start the periodic AQI refresh. Every worker runs the loop, but only the
+    one holding SCHEDULER_LOCK_FILE fetches from AirNow; the others pick up
+    its results from SHARED_AQI_DB.
+    """
+    global shared_snapshot, scheduler
+    if scheduler is not None:
+        return scheduler
+    shared_snapshot = SharedSnapshot(SHARED_AQI_DB)
+    scheduler = LeaderScheduler(
+        lock=LeaderLock(SCHEDULER_LOCK_FILE),
+        shared=shared_snapshot,
+        job=lambda: daily_airnow_job(zip_list),
+        on_update=apply_shared_update,
+        interval_seconds=interval_hours * 3600,
+        poll_seconds=SCHEDULER_POLL_SECONDS,
+        initial_delay=initial_delay,
+        watch_keys=served_keys,
+        on_synced=lambda count: notify_refresh_listeners({"synced": count}),
+    )
+    scheduler.start()
+    log(f"Scheduler started (runs every {interval_hours} hours on the leader worker).")
+    return scheduler
+
+# Seconds to wait after startup before the first refresh, so a cold start
+# serves requests before it spends time on upstream calls.
+SCHEDULER_INITIAL_DELAY = int(os.getenv("SCHEDULER_INITIAL_DELAY", 10))
+# How often each worker checks leadership and pulls shared results.
+SCHEDULER_POLL_SECONDS = int(os.getenv("SCHEDULER_POLL_SECONDS", 30))
+
+def start_background_jobs():
+    """
+    Loads the last live snapshot and starts the flusher and the refresh
+    scheduler. Called from the FastAPI lifespan, not at import.
+    """
+    live_store.load()
+    # Only the leader writes LIVE_AQI_FILE
+    live_store.start_flusher(should_flush=lambda: scheduler is not None and scheduler.is_leader)
+    # Start automatic live AQI updates every 3 hours
+    schedule_daily_job(DEFAULT_ZIPS, interval_hours=3, initial_delay=SCHEDULER_INITIAL_DELAY)
+
+# Existing counters, exposed as gauges at GET /metrics
+metrics.add_collector("live_aqi_cache", lambda: live_aqi_cache.stats())
+metrics.add_collector("live_store", lambda: live_store.stats())
+metrics.add_collector("answer_cache", answer_cache_stats)
+metrics.add_collector("answer_paths", answer_path_summary)
+metrics.add_collector("scheduler", lambda: scheduler.stats() if scheduler else {})
+metrics.add_collector("alerts", lambda: _alert_engine.stats() if _alert_engine else {})
+metrics.add_collector("history", lambda: _history_store.stats() if _history_store else {})
+metrics.add_collector("upstream_airnow", upstream.airnow.stats)
+metrics.add_collector("upstream_groq", upstream.groq.stats)
+metrics.add_collector("llm", llm.gateway.stats)
+
+async def close_http_clients():
+    await airnow.close_async_client()
+    await llm.gateway.aclose()
@@ -1,25 +1,58 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import logging
 import os
-from app.db import engine, Base
+from app import metrics, profiling, startup
+from app.core import password_pool_summary, require_admin_token, user_cache_stats
+from app.db import ensure_schema, dispose_async_engine, pool_stats
 from app.routes import auth, data, users
 from app.routes import chatbot  # <--- ADD THIS LINE to import the new router
+from app.routes import tiles
+from app.routes import debug
+import chatbotbackend
 
 # Load environment variables
 load_dotenv()
 
+# app.* modules log through logging.getLogger(__name__)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
 # Debug check (optional)
 print("✅ Database URL loaded:", os.getenv("DATABASE_URL"))
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+startup.record("import", time.perf_counter() - _import_started)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything slow runs in the background so the server starts
+    # accepting requests immediately; get_db and load_historical_data
+    # still initialize on demand if a request gets there first.
+    with startup.phase("lifespan"):
+        startup.run_in_background("schema", ensure_schema)
+        startup.run_in_background("historical_data", data.warm_forecast)
+        startup.run_in_background("background_jobs", chatbotbackend.start_background_jobs)
+    startup.mark_ready()
+    print(f"🚀 Startup report: {startup.report()}")
+    yield
+    await chatbotbackend.close_http_clients()
+    await dispose_async_engine()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="CleanSkies API",
     description="Backend for the CleanSkies air quality application.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS setup
@@ -36,14 +69,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Opt-in request profiling; not installed at all unless configured
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+# Per-route latency and response size (outermost, so it sees every response)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.add_collector("db_pool", pool_stats)
+metrics.add_collector("user_cache", user_cache_stats)
+metrics.add_collector("password_pool", password_pool_summary)
+metrics.add_collector("startup", lambda: {"ready_seconds": startup.ready_seconds})
 
 # Routers
 app.include_router(auth.router)
 app.include_router(data.router)
 app.include_router(users.router)
 app.include_router(chatbot.router) # <--- ADD THIS LINE to include the new router
+app.include_router(tiles.router)
+if profiling.PROFILING_TOKEN:
+    app.include_router(debug.router)
 
 @app.get("/")
 def home():
     return {"message": "CleanSkies API is running 🚀"}
 
+@app.get("/startup", dependencies=[Depends(require_admin_token)])
+def startup_report():
+    """Import and startup phase timings for tracking cold-start time."""
+    return startup.report()
+
+@app.get("/db/pool", dependencies=[Depends(require_admin_token)])
+def db_pool_stats():
+    """Connection pool usage (checked out, overflow, checkout wait time)."""
+    return pool_stats()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_admin_token)])
+def prometheus_metrics():
+    """Prometheus text-format metrics for this worker process."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
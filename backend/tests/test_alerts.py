@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.alerts import AlertEngine
+from app.scheduler import SharedSnapshot
+
+USERS = [
+    (1, "New York 10001", {"pm25": 100}, {"email": True, "push": False}),
+    (2, "10001", {"pm25": 150}, {"email": True, "push": False}),
+]
+
+
+def _rows(pm25):
+    return {"10001": [{"ParameterName": "PM2.5", "AQI": pm25}]}
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, jobs):
+        self.jobs.extend(jobs)
+
+
+def _engine(state=None, cooldown=3600):
+    return AlertEngine(lambda: USERS, lambda z: z, RecordingDispatcher(),
+                       hysteresis=10, cooldown=cooldown, state=state)
+
+
+def test_alerts_once_until_the_value_drops_below_the_hysteresis_band():
+    engine = _engine(cooldown=0)
+    assert engine.evaluate(_rows(120), now=0)["alerts"] == 1
+    assert engine.evaluate(_rows(130), now=10)["alerts"] == 0
+    # Inside the band (threshold - hysteresis .. threshold): still active
+    assert engine.evaluate(_rows(95), now=20)["alerts"] == 0
+    assert engine.evaluate(_rows(120), now=30)["alerts"] == 0
+    # Cleared, then above again
+    assert engine.evaluate(_rows(80), now=40)["alerts"] == 0
+    assert engine.evaluate(_rows(120), now=50)["alerts"] == 1
+    assert [job["user_id"] for job in engine.dispatcher.jobs] == [1, 1]
+
+
+def test_exceedance_held_back_by_the_cooldown_alerts_after_it():
+    engine = _engine(cooldown=3600)
+    assert engine.evaluate(_rows(120), now=0)["alerts"] == 1
+    engine.evaluate(_rows(80), now=60)
+    assert engine.evaluate(_rows(120), now=120)["alerts"] == 0
+    assert engine.evaluate(_rows(120), now=3700)["alerts"] == 1
+
+
+def test_state_survives_a_new_engine(tmp_path):
+    shared = SharedSnapshot(str(tmp_path / "shared.sqlite"))
+    first = _engine(state=shared)
+    assert first.evaluate(_rows(160), now=0)["alerts"] == 2
+
+    # A restarted worker or a new leader builds a fresh engine
+    second = _engine(state=shared)
+    assert second.evaluate(_rows(160), now=7200)["alerts"] == 0
+    assert second.dispatcher.jobs == []
+    assert shared.load_alert_state()[1] == (1, 0.0)
+
+
+@pytest.mark.parametrize("pm25, expected", [(np.nan, 0), (100, 0), (101, 1)])
+def test_only_values_above_the_threshold_alert(pm25, expected):
+    assert _engine().evaluate(_rows(pm25), now=0)["alerts"] == expected
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+from app.aqi_cache import LiveAQICache
+
+ROWS = [{"ReportingArea": "New York", "ParameterName": "PM2.5", "AQI": 42}]
+
+
+def test_concurrent_misses_share_one_fetch():
+    calls = []
+    release = threading.Event()
+
+    def fetch(key):
+        calls.append(key)
+        release.wait(5)
+        return ROWS
+
+    cache = LiveAQICache(fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("10001"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Let every thread reach the in-flight future before the fetch returns
+    deadline = time.monotonic() + 5
+    while cache.stats()["coalesced"] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["10001"]
+    assert results == [ROWS] * 8
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_async_misses_share_one_fetch():
+    calls = []
+
+    async def afetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return ROWS
+
+    async def main():
+        cache = LiveAQICache(lambda key: [], afetch=afetch)
+        return await asyncio.gather(*(cache.aget("10001") for _ in range(5)))
+
+    assert asyncio.run(main()) == [ROWS] * 5
+    assert calls == ["10001"]
+
+
+def test_stale_rows_are_served_while_refreshing():
+    fetched = []
+
+    def fetch(key):
+        fetched.append(key)
+        return [dict(ROWS[0], AQI=len(fetched))]
+
+    cache = LiveAQICache(fetch, ttl=0.2, stale_ttl=60)
+    first = cache.get("10001")
+    time.sleep(0.25)
+    assert cache.get("10001") == first  # stale: returned immediately
+    deadline = time.monotonic() + 5
+    while cache.age("10001") > 0.2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert fetched == ["10001", "10001"]
+    assert cache.get("10001")[0]["AQI"] == 2
+    assert cache.stats()["stale"] == 1
+
+
+def test_failed_fetch_falls_back_to_last_rows():
+    responses = [ROWS, RuntimeError("AirNow down")]
+
+    def fetch(key):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    cache = LiveAQICache(fetch, ttl=0, stale_ttl=0)
+    assert cache.get("10001") == ROWS
+    assert cache.get("10001") == ROWS
+    stats = cache.stats()
+    assert stats["refresh_errors"] == 1
+    assert stats["fallbacks"] == 1
+
+
+def test_idle_keys_are_evicted_and_not_requested():
+    cache = LiveAQICache(lambda key: ROWS, ttl=60, stale_ttl=60)
+    cache.get("10001")
+    cache.warm({"94103": ROWS})  # fetched by the refresh, never asked for
+    assert cache.requested_keys() == ["10001"]
+
+    assert cache.evict_idle(max_idle=60) == 0
+    assert cache.evict_idle(max_idle=0) == 2
+    assert cache.keys() == []
+    assert cache.requested_keys() == []
+
+
+def test_cancelled_owner_does_not_hang_waiters():
+    started = None
+
+    async def afetch(key):
+        started.set()
+        await asyncio.sleep(10)
+        return ROWS
+
+    async def main():
+        nonlocal started
+        started = asyncio.Event()
+        cache = LiveAQICache(lambda key: [], afetch=afetch)
+        cache.put("10001", ROWS)
+        cache.ttl = cache.stale_ttl = 0  # force a miss that still has rows to fall back on
+        owner = asyncio.create_task(cache.aget("10001"))
+        await started.wait()
+        waiter = asyncio.create_task(cache.aget("10001"))
+        await asyncio.sleep(0)
+        owner.cancel()
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(main()) == ROWS
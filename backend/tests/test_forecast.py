@@ -0,0 +1,29 @@
+from datetime import date
+
+import numpy as np
+
+from app.forecast import forecast_store
+from app.trends_store import TrendsStore
+
+
+def _store(last_day, days=60):
+    dates = np.datetime64(last_day, "D") - np.arange(days)[::-1]
+    rng = np.random.default_rng(0)
+    pm25 = (10 + rng.normal(0, 1, (2, days))).astype(np.float32)
+    return TrendsStore(dates, ["10001", "94103"], ["New York", "San Francisco"], {"pm25": pm25})
+
+
+def test_forecast_days_follow_the_last_observed_day():
+    forecast = forecast_store(_store("2026-10-09"), horizon=3)
+    assert str(forecast.issued) == "2026-10-09"
+    assert [p["date"] for p in forecast.points("10001", today=date(2026, 10, 10))] == [
+        "2026-10-10", "2026-10-11", "2026-10-12",
+    ]
+
+
+def test_past_days_are_dropped_and_old_data_is_stale():
+    forecast = forecast_store(_store("2026-10-09"), horizon=3)
+    assert [p["date"] for p in forecast.points("10001", today=date(2026, 10, 12))] == ["2026-10-12"]
+    assert not forecast.is_stale(date(2026, 10, 12))
+    assert forecast.points("10001", today=date(2026, 10, 17)) == []
+    assert forecast.is_stale(date(2026, 10, 17))
@@ -0,0 +1,97 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+
+from app.historical_loader import HistoricalDataLoader
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "historical_data.json"
+    path.write_text(json.dumps({
+        "10001": {
+            "locationName": "New York",
+            "weeklyTrends": [{"date": "2026-10-01", "pm25": 10.0}, {"date": "2026-10-02", "pm25": 11.0}],
+            "monthlyTrends": [],
+        },
+    }))
+    return path
+
+
+def _loader(tmp_path, source, **kwargs):
+    return HistoricalDataLoader(
+        source,
+        updates_path=tmp_path / "data" / "updates.jsonl",
+        compact_dir=tmp_path / "data" / "compacted",
+        check_interval=0,
+        **kwargs,
+    )
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_append_is_copy_on_write(tmp_path, source):
+    loader = _loader(tmp_path, source)
+    before = loader.get()
+    loader.append("10001", [{"date": "2026-10-03", "pm25": 12.0}])
+    after = loader.get()
+    assert after is not before
+    assert len(before.dates) == 2
+    assert len(after.dates) == 3
+    assert after.generation != before.generation
+
+
+def test_reload_compacts_updates_into_a_snapshot(tmp_path, source):
+    loader = _loader(tmp_path, source)
+    loader.append("10001", [{"date": "2026-10-03", "pm25": 12.0}])
+    loader.reload()
+    assert loader.stats()["compactions"] == 1
+    assert (tmp_path / "data" / "updates.jsonl").read_text() == ""
+
+    fresh = _loader(tmp_path, source)
+    store = fresh.get()
+    assert store.memory_mapped
+    assert [str(d) for d in store.dates][-1] == "2026-10-03"
+
+
+def test_lines_from_another_writer_are_picked_up_in_the_background(tmp_path, source):
+    loader = _loader(tmp_path, source)
+    store = loader.get()
+    other = _loader(tmp_path, source)
+    other.append("10001", [{"date": "2026-10-03", "pm25": 12.0}])
+    # The request path only schedules the update...
+    assert loader.get() is store or len(loader.get().dates) == 3
+    # ...which lands shortly after, without touching the store requests hold
+    _wait_for(lambda: len(loader.get().dates) == 3)
+    assert len(store.dates) == 2
+
+
+def _append_from_another_process(updates_path, count):
+    from app.tempo import append_trend_updates
+
+    for i in range(count):
+        append_trend_updates(updates_path, [{"zip": f"9{i:04d}", "date": "2026-10-01", "pm25": 1.0}])
+
+
+def test_compaction_doesnt_lose_lines_appended_concurrently(tmp_path, source):
+    count = 2000
+    loader = _loader(tmp_path, source)
+    loader.get()
+    writer = multiprocessing.get_context("spawn").Process(
+        target=_append_from_another_process, args=(str(loader.updates_path), count),
+    )
+    writer.start()
+    while writer.is_alive():
+        loader.reload()
+    writer.join()
+    assert writer.exitcode == 0
+
+    loader.reload()
+    assert len(_loader(tmp_path, source).get()) == count + 1
@@ -0,0 +1,58 @@
+import pytest
+
+from app import intents
+
+ACTIVE_ZIP = "94103"
+
+
+@pytest.mark.parametrize("question", [
+    "What is the air quality in Chicago?",
+    "what is the AQI in new york",
+    "is the air good in Denver",
+    "chicago aqi",
+    "what is the aqi in 10001",
+])
+def test_questions_naming_another_place_go_to_the_llm(question):
+    assert intents.classify_question(question, ACTIVE_ZIP) == (None, None)
+
+
+@pytest.mark.parametrize("question", [
+    "was the air bad yesterday",
+    "what was the AQI last week",
+    "what will the aqi be tomorrow",
+    "has the air been polluted today",
+])
+def test_questions_about_another_time_go_to_the_llm(question):
+    assert intents.classify_question(question, ACTIVE_ZIP) == (None, None)
+
+
+@pytest.mark.parametrize("question", [
+    "Is it safe to run outside?",
+    "should my kids wear a mask",
+    "why is the ozone so high",
+])
+def test_advice_questions_go_to_the_llm(question):
+    assert intents.classify_question(question, ACTIVE_ZIP) == (None, None)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What's the AQI?", (intents.CURRENT_AQI, None)),
+    ("what's the AQI in 94103 right now?", (intents.CURRENT_AQI, None)),
+    ("What’s the air quality index in my area?", (intents.CURRENT_AQI, None)),
+    ("how is the air today", (intents.CATEGORY, None)),
+    ("How bad is the air right now?", (intents.CATEGORY, None)),
+    ("what is the pm2.5 level here", (intents.POLLUTANT, "PM2.5")),
+    ("current ozone reading", (intents.POLLUTANT, "O3")),
+])
+def test_present_tense_lookups_here_take_the_fast_path(question, expected):
+    assert intents.classify_question(question, ACTIVE_ZIP) == expected
+
+
+def test_answer_names_the_reporting_area():
+    rows = [
+        {"ParameterName": "PM2.5", "AQI": 42, "Category": "Good", "ReportingArea": "San Francisco"},
+        {"ParameterName": "O3", "AQI": 61, "Category": "Moderate", "ReportingArea": "San Francisco"},
+    ]
+    answer = intents.answer_from_rows(intents.CURRENT_AQI, rows, ACTIVE_ZIP)
+    assert answer.startswith("The current AQI in San Francisco (ZIP 94103) is 61 (Moderate)")
+    assert intents.answer_from_rows(intents.POLLUTANT, rows, ACTIVE_ZIP, "NO2") is None
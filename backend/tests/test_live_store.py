@@ -0,0 +1,39 @@
+from app.live_store import LiveObservationStore
+
+
+def _row(param, aqi, area="New York"):
+    return {
+        "DateObserved": "2026-10-17", "ReportingArea": area, "StateCode": "NY",
+        "ParameterName": param, "AQI": aqi, "Category": {"Number": 1, "Name": "Good"},
+    }
+
+
+def test_merge_replaces_only_the_pollutants_it_covers(tmp_path):
+    store = LiveObservationStore(str(tmp_path / "live_aqi.csv"))
+    store.merge("10001", [_row("PM2.5", 40), _row("O3", 30)])
+    store.merge("10001", [_row("PM2.5", 55)])
+
+    by_param = {row["ParameterName"]: row["AQI"] for row in store.rows("10001")}
+    assert by_param == {"PM2.5": 55, "O3": 30}
+    assert store.rows("94103") == []
+    assert len(store) == 2
+
+
+def test_flush_round_trips_and_skips_clean_snapshots(tmp_path):
+    path = str(tmp_path / "live_aqi.csv")
+    store = LiveObservationStore(path)
+    store.merge("10001", [_row("PM2.5", 40)])
+    store.merge("94103", [_row("O3", 25, area="San Francisco")])
+    assert store.flush()
+    assert not store.flush()  # nothing changed since
+
+    restored = LiveObservationStore(path)
+    assert restored.load() == 2
+    assert restored.rows("10001")[0]["AQI"] == 40
+    assert restored.rows("94103")[0]["ReportingArea"] == "San Francisco"
+    assert not restored.stats()["dirty"]
+    assert not list(tmp_path.glob(".live_aqi.*.tmp"))
+
+
+def test_load_without_a_snapshot(tmp_path):
+    assert LiveObservationStore(str(tmp_path / "missing.csv")).load() == 0
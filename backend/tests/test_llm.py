@@ -0,0 +1,59 @@
+import json
+import time
+
+import httpx
+
+from app.llm import LLM_LATENCY_MIN_SAMPLES, LLMGateway
+from app.upstream import AdaptiveLimiter, Upstream
+
+
+def _gateway(delays, **kwargs):
+    """Gateway whose Groq answers after `delays[model]` seconds; records the models used."""
+    models = []
+
+    def handler(request):
+        model = json.loads(request.content)["model"]
+        models.append(model)
+        time.sleep(delays.get(model, 0))
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": f"answer from {model}"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        })
+
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=4, latency_target=10)
+    gateway = LLMGateway(
+        url="http://groq.test/chat", api_key="test", model="primary",
+        service=Upstream("groq-test", None, limiter), **kwargs,
+    )
+    gateway._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return gateway, models
+
+
+def _ask(gateway):
+    return gateway.complete("system", "How is the air?", "context")
+
+
+def test_switches_to_the_fallback_model_while_the_primary_misses_its_slo():
+    gateway, models = _gateway(
+        {"primary": 0.005}, fallback_model="fallback", latency_slo=0.001, fallback_cooldown=0.2,
+    )
+    for _ in range(LLM_LATENCY_MIN_SAMPLES):
+        assert _ask(gateway) == "answer from primary"
+    assert _ask(gateway) == "answer from fallback"
+    stats = gateway.stats()
+    assert stats["fallback_switches"] == 1
+    assert stats["fallback_requests"] == 1
+
+    time.sleep(0.25)  # cooldown over: the primary gets another chance
+    assert _ask(gateway) == "answer from primary"
+    assert models.count("fallback") == 1
+
+
+def test_stays_on_the_primary_within_its_slo_or_without_a_fallback():
+    fast, _ = _gateway({}, fallback_model="fallback", latency_slo=5)
+    slow, _ = _gateway({"primary": 0.005}, fallback_model=None, latency_slo=0.001)
+    for _ in range(LLM_LATENCY_MIN_SAMPLES + 1):
+        assert _ask(fast) == "answer from primary"
+        assert _ask(slow) == "answer from primary"
+    assert fast.stats()["fallback_switches"] == 0
+    assert slow.stats()["fallback_switches"] == 0
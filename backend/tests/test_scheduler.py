@@ -0,0 +1,78 @@
+import pytest
+
+from app import scheduler
+from app.scheduler import LeaderLock, LeaderScheduler, SharedSnapshot
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return SharedSnapshot(str(tmp_path / "shared.sqlite"))
+
+
+@pytest.mark.skipif(scheduler.fcntl is None, reason="needs fcntl")
+def test_only_one_lock_holder_until_it_releases(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def _scheduler(tmp_path, shared, job, updates=None, name="leader.lock", **kwargs):
+    return LeaderScheduler(
+        LeaderLock(str(tmp_path / name)), shared, job,
+        on_update=lambda key, rows, fetched_at: (updates if updates is not None else []).append((key, rows)),
+        interval_seconds=3600, **kwargs,
+    )
+
+
+def test_follower_picks_up_what_the_leader_published(tmp_path, shared):
+    runs = []
+
+    def job():
+        runs.append(1)
+        shared.publish({"10001": [{"AQI": 42}]})
+
+    synced = []
+    leader = _scheduler(tmp_path, shared, job, on_synced=synced.append)
+    received = []
+    follower = _scheduler(tmp_path, shared, job, updates=received, on_synced=synced.append)
+    leader.tick()
+    assert synced == []  # the leader's post-refresh work ran in its job
+    follower.tick()
+    assert leader.is_leader
+    assert runs == [1]
+    assert received == [("10001", [{"AQI": 42}])]
+    assert synced == [1]
+    follower.tick()  # nothing new
+    assert synced == [1]
+    # Not due again within the interval
+    leader.tick()
+    assert runs == [1]
+    leader.lock.release()
+
+
+def test_failed_refresh_isnt_recorded_and_is_retried(tmp_path, shared, monkeypatch):
+    attempts = []
+
+    def job():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("AirNow down")
+
+    leader = _scheduler(tmp_path, shared, job, retry_seconds=300)
+    leader.tick()
+    assert shared.get_meta("last_refresh") is None
+    assert leader.stats()["last_error"] == "AirNow down"
+
+    leader.tick()  # still inside the retry delay
+    assert len(attempts) == 1
+
+    now = scheduler.time.time()
+    monkeypatch.setattr(scheduler.time, "time", lambda: now + 301)
+    leader.tick()
+    assert len(attempts) == 2
+    assert shared.get_meta("last_refresh") == now + 301
+    leader.lock.release()
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from app.upstream import (
+    BACKGROUND, INTERACTIVE, AdaptiveLimiter, CircuitBreaker, CircuitOpenError, QuotaExceededError, TokenBucket,
+    Upstream,
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code, "headers": {}})()
+
+
+def _breaker(**kwargs):
+    return CircuitBreaker(**{"window": 4, "min_calls": 4, "failure_ratio": 0.5, "open_seconds": 0.05, **kwargs})
+
+
+def test_breaker_opens_once_the_failure_ratio_is_reached():
+    breaker = _breaker()
+    for ok in (True, True, False):
+        breaker.record(ok)
+    assert breaker.state == "closed"  # fewer than min_calls
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.rejects()
+    assert not breaker.allow()
+
+
+def test_breaker_half_opens_with_a_single_probe():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def _service(breaker=None, quota=None):
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=4, latency_target=1.0)
+    return Upstream("test", quota, limiter, breaker or _breaker())
+
+
+def test_open_circuit_rejects_without_calling_upstream():
+    service = _service()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise HTTPError(503)
+
+    for _ in range(4):
+        with pytest.raises(HTTPError):
+            service.call(fail)
+    with pytest.raises(CircuitOpenError):
+        service.call(fail)
+    assert len(calls) == 4
+    assert service.stats()["rejected_circuit"] == 1
+
+
+def test_client_errors_dont_count_against_the_upstream():
+    service = _service()
+
+    def bad_request():
+        raise HTTPError(400)
+
+    for _ in range(6):
+        with pytest.raises(HTTPError):
+            service.call(bad_request)
+    assert service.breaker.state == "closed"
+    assert service.stats()["failures"] == 0
+
+
+def test_background_calls_leave_the_quota_reserve_to_interactive_ones():
+    service = _service(quota=TokenBucket(rate=0.001, capacity=5, reserve=0.2))
+    for _ in range(4):
+        with service.slot(BACKGROUND):
+            pass
+    with pytest.raises(QuotaExceededError):
+        with service.slot(BACKGROUND, max_wait=1):
+            pass
+    with service.slot(INTERACTIVE):
+        pass
+    with pytest.raises(QuotaExceededError):  # interactive calls never wait for tokens
+        with service.slot(INTERACTIVE):
+            pass